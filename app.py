@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import os
 import json
@@ -6,19 +6,26 @@ import time
 import hashlib
 import uuid
 import random
+import hmac
+import threading
+import zipfile
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
-import requests
 import numpy as np
-import cv2
 
-# Try to import tensorflow / keras model if available. If not present, the predict
-# endpoint will return an error indicating the model is not available.
-try:
-	import tensorflow as tf
-	tf_available = True
-except Exception:
-	tf_available = False
+from inference_batcher import InferenceBatcher, QueueFullError
+from caching import BoundedLRU, PredictionCache, ChatCache, SingleFlight
+from latency import LatencyWindow
+from inference_backends import REMOTE_BACKEND, load_backend
+from model_manager import ModelManager, ModelNotReady, ServedModel, ShadowEvaluator
+from model_registry import ModelRegistry
+from order_store import OrderStore
+from upstream_client import UpstreamClient, CircuitOpenError, UpstreamBusyError
+from preprocess import preprocess_image, ImageTooLargeError, MAX_UPLOAD_BYTES
+from calibration import CALIBRATION_FILE, apply_temperature, load_temperature, top_k
+from metrics import FlaskMetrics, SlowRequestProfiler
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -26,18 +33,59 @@ app = Flask(__name__)
 # allow cross-origin requests from the frontend during development
 CORS(app)
 
-# Attempts to load a Keras model file if present
-MODEL_PATH = os.path.join(BASE_DIR, 'dog_breed_model.h5')
-model = None
-if tf_available and os.path.exists(MODEL_PATH):
+# Per-route and per-stage metrics, served on /metrics. PROFILE_SLOW_MS > 0
+# turns on the sampling profiler: requests slower than that leave a
+# collapsed-stack profile in PROFILE_DIR.
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '0'))
+app_metrics = FlaskMetrics(profiler=SlowRequestProfiler(
+	PROFILE_SLOW_MS,
+	os.environ.get('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles')),
+	interval_ms=float(os.environ.get('PROFILE_INTERVAL_MS', '5')),
+) if PROFILE_SLOW_MS > 0 else None)
+app_metrics.init_app(app)
+
+# Load the served model through the configured backend (keras, tflite,
+# tflite-int8 or onnx; see export_model.py), or 'remote' to use the shared
+# inference_server.py process (see gunicorn.conf.py). With MODEL_LOAD_MODE=background
+# (the default) the server starts accepting requests immediately and the
+# model is loaded and warmed on a background thread; 'eager' blocks import.
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'keras')
+MODEL_PATH = os.environ.get('MODEL_PATH') or None
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', '0')) or None
+INFERENCE_INTER_OP_THREADS = int(os.environ.get('INFERENCE_INTER_OP_THREADS', '0')) or None
+MODEL_LOAD_MODE = os.environ.get('MODEL_LOAD_MODE', 'background')
+# how long /predict waits for a warming model before answering 503
+MODEL_WAIT_TIMEOUT = float(os.environ.get('MODEL_WAIT_TIMEOUT', '0'))
+
+# Versioned models written by training (see model_registry.py). The server
+# loads MODEL_VERSION if set, else MODEL_PATH if set, else the registry's
+# CURRENT version, else dog_breed_model.h5. Unless a version or path is
+# pinned, CURRENT is polled every MODEL_WATCH_SECONDS and a new version is
+# loaded, warmed and swapped in without a restart (0 disables polling).
+# With INFERENCE_BACKEND=remote, inference_server.py watches CURRENT and each
+# worker polls the server to relabel itself when the server's version changes.
+MODEL_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR', os.path.join(BASE_DIR, 'models'))
+MODEL_VERSION = os.environ.get('MODEL_VERSION') or None
+MODEL_WATCH_SECONDS = float(os.environ.get('MODEL_WATCH_SECONDS', '10'))
+model_registry = ModelRegistry(MODEL_REGISTRY_DIR)
+
+# Breed labels in class-index order, written by train_dog_breed_model.py.
+# Scanning the images tree is only a fallback for models trained before that.
+BREED_LABELS_PATH = os.environ.get('BREED_LABELS_PATH', os.path.join(BASE_DIR, 'breed_labels.json'))
+
+
+def _load_breed_labels(path):
 	try:
-		model = tf.keras.models.load_model(MODEL_PATH)
-		print('Loaded model from', MODEL_PATH)
-	except Exception as e:
-		print('Failed to load model:', e)
-		model = None
+		with open(path, 'r', encoding='utf-8') as f:
+			names = json.load(f)
+		if isinstance(names, list) and names:
+			return [str(n) for n in names]
+	except Exception:
+		pass
+	return None
+
 
-# Try to build BREED_NAMES from the images directory (best-effort)
+# Try to build the breed names from the images directory (best-effort)
 def _discover_breeds():
 	# common candidate locations relative to archive/
 	candidates = [
@@ -55,93 +103,635 @@ def _discover_breeds():
 			continue
 	return []
 
-BREED_NAMES = _discover_breeds()
 
-# Simple in-memory cache for chat responses
-CACHE_TTL = int(os.environ.get('CHAT_CACHE_TTL', '300'))
-_qa_cache = {}
+# Temperature fitted on the validation split by train_dog_breed_model.py;
+# MIN_DOG_CONFIDENCE gates the calibrated confidence. Without a calibration
+# file the raw softmax is used (T = 1). Registry versions carry their own.
+CALIBRATION_PATH = os.environ.get('CALIBRATION_PATH') or os.path.join(
+	os.path.dirname(os.path.abspath(MODEL_PATH)) if MODEL_PATH else BASE_DIR, CALIBRATION_FILE)
 
-def cache_get(key: str) -> Optional[str]:
-	entry = _qa_cache.get(key)
-	if not entry:
-		return None
-	value, expires = entry
-	if time.time() > expires:
+
+def _load_served(version: Optional[str] = None) -> ServedModel:
+	# an explicit version (admin reload) wins over the configured precedence
+	version = version or MODEL_VERSION or (None if MODEL_PATH else model_registry.current())
+	if INFERENCE_BACKEND == REMOTE_BACKEND:
+		# the inference server chose the version; use the labels stored for it
+		backend = load_backend(REMOTE_BACKEND)
+		version = backend.server_version
+		if version and model_registry.exists(version):
+			return model_registry.wrap(version, backend)
+	elif version:
+		return model_registry.load(version, INFERENCE_BACKEND, num_threads=INFERENCE_THREADS,
+								   inter_op_threads=INFERENCE_INTER_OP_THREADS)
+	else:
+		backend = load_backend(INFERENCE_BACKEND, MODEL_PATH, base_dir=BASE_DIR, num_threads=INFERENCE_THREADS,
+							   inter_op_threads=INFERENCE_INTER_OP_THREADS)
+	temperature = load_temperature(CALIBRATION_PATH)
+	if temperature != 1.0:
+		print(f'Using calibration temperature {temperature:.3f} from', CALIBRATION_PATH)
+	return ServedModel(backend, _load_breed_labels(BREED_LABELS_PATH) or _discover_breeds(), temperature)
+
+
+model_manager = ModelManager(_load_served)
+if MODEL_LOAD_MODE == 'eager':
+	model_manager.load()
+else:
+	model_manager.start_background()
+
+
+def _watch_registry():
+	# reload when CURRENT moves; each worker process runs its own watcher.
+	# A busy reload (or the first load) is retried on the next poll.
+	seen = model_registry.current()
+	while True:
+		time.sleep(MODEL_WATCH_SECONDS)
+		current = model_registry.current()
+		if not current or current == seen:
+			continue
+		live = getattr(model_manager.served, 'version', None)
+		if current == live:
+			seen = current
+		elif model_manager.reload(lambda version=current: _load_served(version)):
+			print(f'Model registry: CURRENT is now {current}, reloading')
+			seen = current
+
+
+def _watch_remote():
+	# the inference server swaps its own model; rewrap when it serves a
+	# different version so labels, calibration and cache keys follow it
+	while True:
+		time.sleep(MODEL_WATCH_SECONDS)
+		served = model_manager.served
+		if served is None:
+			continue
 		try:
-			del _qa_cache[key]
+			live = served.backend.refresh().get('version')
 		except Exception:
-			pass
-		return None
-	return value
+			continue
+		if live != served.version and model_manager.reload():
+			print(f'Inference server now serves {live}, reloading labels')
+
+
+if MODEL_WATCH_SECONDS > 0:
+	if INFERENCE_BACKEND == REMOTE_BACKEND:
+		threading.Thread(target=_watch_remote, name='model-remote-watch', daemon=True).start()
+	elif not (MODEL_VERSION or MODEL_PATH):
+		threading.Thread(target=_watch_registry, name='model-registry-watch', daemon=True).start()
+
+# Requests to /predict are funnelled through a background batcher so that
+# concurrent uploads share one forward pass instead of one call per image.
+PREDICT_BATCH_MAX_SIZE = int(os.environ.get('PREDICT_BATCH_MAX_SIZE', '16'))
+PREDICT_BATCH_MAX_WAIT_MS = float(os.environ.get('PREDICT_BATCH_MAX_WAIT_MS', '5'))
+PREDICT_QUEUE_MAX = int(os.environ.get('PREDICT_QUEUE_MAX', '256'))
+PREDICT_TIMEOUT = float(os.environ.get('PREDICT_TIMEOUT', '30'))
+
+predict_batcher = InferenceBatcher(
+	model_manager.predict,
+	max_batch_size=PREDICT_BATCH_MAX_SIZE,
+	max_wait_ms=PREDICT_BATCH_MAX_WAIT_MS,
+	max_queue=PREDICT_QUEUE_MAX,
+)
+
+# Prediction cache keyed by upload content (sha256 of the raw bytes, plus an
+# optional perceptual hash of the decoded image). PREDICT_CACHE_SIZE=0 disables.
+PREDICT_CACHE_SIZE = int(os.environ.get('PREDICT_CACHE_SIZE', '2048'))
+PREDICT_CACHE_DIR = os.environ.get('PREDICT_CACHE_DIR', '')
+PREDICT_CACHE_DISK_MAX = int(os.environ.get('PREDICT_CACHE_DISK_MAX', '100000'))
+PREDICT_CACHE_PERCEPTUAL = os.environ.get('PREDICT_CACHE_PERCEPTUAL', '0') == '1'
+
+prediction_cache = None
+if PREDICT_CACHE_SIZE > 0:
+	prediction_cache = PredictionCache(
+		max_entries=PREDICT_CACHE_SIZE,
+		disk_dir=PREDICT_CACHE_DIR or None,
+		disk_max_entries=PREDICT_CACHE_DISK_MAX,
+		perceptual=PREDICT_CACHE_PERCEPTUAL,
+	)
+
+# Chat answer cache: bounded LRU with TTL sweeping, optionally backed by a
+# SQLite file (CHAT_CACHE_SHARED_PATH) so every worker process shares hits.
+CACHE_TTL = int(os.environ.get('CHAT_CACHE_TTL', '300'))
+chat_cache = ChatCache(
+	ttl=CACHE_TTL,
+	max_entries=int(os.environ.get('CHAT_CACHE_MAX_ENTRIES', '2048')),
+	max_bytes=int(os.environ.get('CHAT_CACHE_MAX_BYTES', str(16 * 1024 * 1024))),
+	shared_path=os.environ.get('CHAT_CACHE_SHARED_PATH') or None,
+	sweep_seconds=float(os.environ.get('CHAT_CACHE_SWEEP_SECONDS', '60')),
+)
+# identical questions missing the cache at the same time share one upstream call
+chat_singleflight = SingleFlight()
+
+def cache_get(key: str) -> Optional[str]:
+	return chat_cache.get(key)
 
 def cache_set(key: str, value: str, ttl: int = CACHE_TTL):
-	_qa_cache[key] = (value, time.time() + ttl)
+	chat_cache.set(key, value, ttl)
 
 def question_key(q: str) -> str:
 	return hashlib.sha256(q.strip().lower().encode('utf-8')).hexdigest()
 
-def read_image_from_bytes(file_bytes: bytes):
-	nparr = np.frombuffer(file_bytes, np.uint8)
-	img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-	if img is None:
-		raise ValueError('Could not decode image')
-	img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-	img = cv2.resize(img, (224, 224))
-	img = img.astype(np.float32) / 255.0
-	img = np.expand_dims(img, axis=0)
-	return img
+def _served_size(served=None):
+	# (W, H) for preprocess_image, from the model's metadata (ServedModel.input_size)
+	served = served or model_manager.served
+	h, w = served.input_size if served is not None else (224, 224)
+	return (w, h)
+
+
+def read_image_from_bytes(file_bytes: bytes, timings: Optional[dict] = None, size=None):
+	# (1, H, W, 3) float32 model input at `size` (W, H; default: the live
+	# model's input size); see preprocess.py for the reduced-resolution decode
+	# and the header checks (ImageTooLargeError)
+	return preprocess_image(file_bytes, size or _served_size(), timings=timings)[np.newaxis]
+
+
+# Optional near-duplicate index of the training images (built with
+# `python dup_index.py build`); when loaded, /predict flags uploads that
+# duplicate training data.
+DUP_INDEX_PATH = os.environ.get('DUP_INDEX_PATH', '')
+DUP_INDEX_DISTANCE = int(os.environ.get('DUP_INDEX_DISTANCE', '4'))
+duplicate_index = None
+if DUP_INDEX_PATH:
+	try:
+		from dup_index import DuplicateIndex
+		duplicate_index = DuplicateIndex.load(DUP_INDEX_PATH)
+		print(f'Loaded duplicate index with {len(duplicate_index)} images from', DUP_INDEX_PATH)
+	except Exception as e:
+		print('Failed to load duplicate index:', e)
+		duplicate_index = None
+_duplicate_results = BoundedLRU(4096)
+
+
+def _training_duplicate(img_bytes, img_input, content_key=None):
+	# Closest training image within DUP_INDEX_DISTANCE, memoised per upload
+	# so cache hits that skipped decoding do not have to decode again
+	content_key = content_key or PredictionCache.content_key(img_bytes)
+	found = _duplicate_results.get(content_key)
+	if found is not None:
+		return found or None
+	if img_input is None:
+		img_input = read_image_from_bytes(img_bytes)
+	hits = duplicate_index.query_image(img_input, DUP_INDEX_DISTANCE)
+	dup = {'path': hits[0][0], 'distance': hits[0][1], 'matches': len(hits)} if hits else {}
+	_duplicate_results.set(content_key, dup)
+	return dup or None
+
+
+PREDICT_MAX_TOP_K = int(os.environ.get('PREDICT_MAX_TOP_K', '10'))
+
+
+def _min_confidence() -> float:
+	return float(os.environ.get('MIN_DOG_CONFIDENCE', '0.35'))
+
+
+def _requested_top_k() -> int:
+	# ?top_k=N (0 = off); raises ValueError for a non-integer value
+	k = int(request.args.get('top_k', '0') or 0)
+	return max(0, min(k, PREDICT_MAX_TOP_K))
+
+
+def _rank(probs, k: int, served: ServedModel):
+	# Calibrates an (n, C) batch of model outputs and picks the top k per row
+	probs = apply_temperature(probs, served.temperature)
+	return probs, (top_k(probs, k) if k else None)
+
+
+def _candidates(indices, values, served: ServedModel):
+	return [{'breed': served.label(int(i)), 'confidence': float(v) * 100.0} for i, v in zip(indices, values)]
+
+
+def _label_prediction(probs, min_conf: float, served: ServedModel, ranked=None):
+	# Map one calibrated softmax row to the response payload, or None if below
+	# threshold; ranked is this row's (indices, values) from top_k()
+	pred_idx = int(np.argmax(probs))
+	confidence_frac = float(probs[pred_idx])
+	if confidence_frac < min_conf:
+		return None
+	result = {'breed': served.label(pred_idx), 'confidence': confidence_frac * 100.0}
+	if ranked is not None:
+		result['top_k'] = _candidates(*ranked, served)
+	return result
+
+
+def _rejection(served: ServedModel, ranked=None):
+	# Below-threshold payload; with top_k requested it lists the candidates
+	body = {'error': 'please upload correct breed image'}
+	if ranked is not None:
+		body['candidates'] = _candidates(*ranked, served)
+	return body
+
+
+def _cache_key(key: Optional[str], served: ServedModel) -> Optional[str]:
+	# cached outputs belong to the model that produced them; the disk tier
+	# outlives restarts, so unversioned models are named by their file too
+	return f'{key}@{served.identity}' if key else key
+
+
+# a single-image upload plus room for the multipart envelope
+MAX_UPLOAD_REQUEST_BYTES = MAX_UPLOAD_BYTES + 64 * 1024
+
+
+def _upload_too_large() -> bool:
+	# must run before request.files, which parses and buffers the whole body
+	try:
+		# also caps a chunked body with no Content-Length (Flask >= 3.1)
+		request.max_content_length = MAX_UPLOAD_REQUEST_BYTES
+	except AttributeError:
+		pass
+	return bool(request.content_length and request.content_length > MAX_UPLOAD_REQUEST_BYTES)
+
+
+def _model_unavailable():
+	# Returns an error response while the model is warming or failed to load
+	if model_manager.wait_ready(MODEL_WAIT_TIMEOUT):
+		return None
+	if model_manager.state == 'failed':
+		return jsonify({'error': 'Model not available on server'}), 500
+	return jsonify({'error': 'Model is warming up, please retry', 'status': 'warming'}), 503
 
 
 @app.route('/predict', methods=['POST'])
 def predict():
-	if model is None:
-		return jsonify({'error': 'Model not available on server'}), 500
+	unavailable = _model_unavailable()
+	if unavailable is not None:
+		return unavailable
 
+	if _upload_too_large():
+		return jsonify({'error': 'Image too large'}), 413
 	if 'image' not in request.files:
 		return jsonify({'error': "No image file provided (field 'image')"}), 400
+	try:
+		k = _requested_top_k()
+	except ValueError:
+		return jsonify({'error': 'top_k must be an integer'}), 400
 
 	file = request.files['image']
+	# this request stays on this model even if another is swapped in meanwhile
+	served = model_manager.served
 	try:
-		img_bytes = file.read()
-		img_input = read_image_from_bytes(img_bytes)
-		preds = model.predict(img_input)
-		pred_idx = int(np.argmax(preds, axis=1)[0])
-		confidence_frac = float(np.max(preds))
-		min_conf = float(os.environ.get('MIN_DOG_CONFIDENCE', '0.35'))
-		if confidence_frac < min_conf:
-			return jsonify({'error': 'please upload correct breed image'}), 400
-		confidence = confidence_frac * 100.0
-		if 0 <= pred_idx < len(BREED_NAMES):
-			breed = BREED_NAMES[pred_idx]
+		with app_metrics.stage('read'):
+			img_bytes = file.read()
+		content_key = perceptual_key = img_input = None
+		hit = None
+		if prediction_cache is not None:
+			with app_metrics.stage('cache'):
+				content_key = prediction_cache.content_key(img_bytes)
+				hit = prediction_cache.get(_cache_key(content_key, served))
+		if hit is None:
+			timings = {}
+			img_input = read_image_from_bytes(img_bytes, timings, _served_size(served))
+			app_metrics.observe_stage('decode', timings['decode'])
+			app_metrics.observe_stage('preprocess', timings['preprocess'])
+			if prediction_cache is not None:
+				with app_metrics.stage('cache'):
+					perceptual_key = _cache_key(prediction_cache.perceptual_key(img_input), served)
+					hit = prediction_cache.get(perceptual_key)
+		if hit is not None:
+			probs, tier = hit
+			source = 'cache:' + tier
 		else:
-			breed = str(pred_idx)
-		return jsonify({'breed': breed, 'confidence': confidence})
+			# includes the wait for a micro-batch slot
+			t0 = time.perf_counter()
+			with app_metrics.stage('model'):
+				probs = predict_batcher.predict(img_input, timeout=PREDICT_TIMEOUT, target=served)[0]
+			source = 'model'
+			candidate = shadow
+			if candidate is not None:
+				candidate.offer(img_bytes, probs, served, (time.perf_counter() - t0) * 1000.0, x=img_input)
+			if prediction_cache is not None:
+				prediction_cache.record_miss()
+				prediction_cache.set(_cache_key(content_key, served), probs, perceptual_key=perceptual_key)
+		calibrated, ranked = _rank(probs[np.newaxis], k, served)
+		ranked = (ranked[0][0], ranked[1][0]) if ranked is not None else None
+		result = _label_prediction(calibrated[0], _min_confidence(), served, ranked)
+		if result is None:
+			return jsonify(_rejection(served, ranked)), 400
+		result['cached'] = hit is not None
+		result['source'] = source
+		if duplicate_index is not None:
+			dup = _training_duplicate(img_bytes, img_input, content_key)
+			if dup is not None:
+				result['training_duplicate'] = dup
+		return jsonify(result)
+	except ImageTooLargeError as e:
+		return jsonify({'error': str(e)}), 413
+	except QueueFullError:
+		return jsonify({'error': 'Server busy, please retry'}), 503
+	except ModelNotReady as e:
+		return jsonify({'error': 'Model is warming up, please retry', 'status': e.state}), 503
 	except Exception as e:
 		return jsonify({'error': str(e)}), 500
 
 
-def _orders_file_path():
-	return os.path.join(BASE_DIR, 'orders.json')
+# Batch prediction: images are decoded on a thread pool (cv2 releases the GIL)
+# and classified in fixed-size chunks, one NDJSON line per image.
+BATCH_CHUNK_SIZE = int(os.environ.get('PREDICT_BATCH_CHUNK_SIZE', '32'))
+BATCH_DECODE_WORKERS = int(os.environ.get('PREDICT_DECODE_WORKERS', str(min(8, os.cpu_count() or 1))))
+BATCH_MAX_IMAGES = int(os.environ.get('PREDICT_BATCH_MAX_IMAGES', '1000'))
+BATCH_MAX_IMAGE_BYTES = int(os.environ.get('PREDICT_BATCH_MAX_IMAGE_BYTES', str(25 * 1024 * 1024)))
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
 
+_decode_pool = None
 
-def _read_orders():
-	p = _orders_file_path()
-	try:
-		if not os.path.exists(p):
-			return []
-		with open(p, 'r', encoding='utf-8') as f:
-			return json.load(f)
-	except Exception:
-		return []
+
+def _get_decode_pool():
+	global _decode_pool
+	if _decode_pool is None:
+		_decode_pool = ThreadPoolExecutor(max_workers=max(1, BATCH_DECODE_WORKERS), thread_name_prefix='decode')
+	return _decode_pool
+
+
+def _iter_archive_images(storage):
+	# Yields (name, bytes) for every image member of a zip or tar upload
+	stream = storage.stream
+	if zipfile.is_zipfile(stream):
+		stream.seek(0)
+		with zipfile.ZipFile(stream) as zf:
+			for info in zf.infolist():
+				if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+					continue
+				if info.file_size > BATCH_MAX_IMAGE_BYTES:
+					yield info.filename, None
+					continue
+				yield info.filename, zf.read(info)
+		return
+	stream.seek(0)
+	with tarfile.open(fileobj=stream, mode='r:*') as tf_archive:
+		for member in tf_archive:
+			if not member.isfile() or not member.name.lower().endswith(IMAGE_EXTENSIONS):
+				continue
+			if member.size > BATCH_MAX_IMAGE_BYTES:
+				yield member.name, None
+				continue
+			fh = tf_archive.extractfile(member)
+			yield member.name, fh.read() if fh is not None else None
+
+
+def _iter_batch_uploads():
+	for storage in request.files.getlist('images') + request.files.getlist('image'):
+		yield storage.filename, storage.read()
+	for storage in request.files.getlist('archive'):
+		yield from _iter_archive_images(storage)
 
 
-def _write_orders(orders):
-	p = _orders_file_path()
+def _decode_one(name, data, size, out=None):
+	# size: (W, H) model input; out: the image's row of the chunk's preallocated batch array
+	if data is None:
+		return name, None, 'image too large or unreadable'
 	try:
-		with open(p, 'w', encoding='utf-8') as f:
-			json.dump(orders, f, indent=2, ensure_ascii=False)
+		return name, preprocess_image(data, size, out=out, max_bytes=BATCH_MAX_IMAGE_BYTES), None
 	except Exception as e:
-		print('Failed to write orders file:', e)
+		return name, None, str(e)
+
+
+def _classify_chunk(decoded, min_conf, served, batch_buffer=None, k=0):
+	# decoded: list of (index, name, img or None, error or None); when the
+	# images were decoded into rows of batch_buffer, classify those rows
+	ok = [pos for pos, d in enumerate(decoded) if d[2] is not None]
+	results = {}
+	rankings = {}
+	if ok:
+		if batch_buffer is None:
+			batch = np.stack([decoded[pos][2] for pos in ok])
+		elif len(ok) == len(decoded):
+			batch = batch_buffer[:len(ok)]
+		else:
+			batch = batch_buffer[ok]
+		with app_metrics.stage('model'):
+			preds = predict_batcher.predict(batch, timeout=PREDICT_TIMEOUT, target=served)
+		preds, ranked = _rank(preds, k, served)
+		for row, pos in enumerate(ok):
+			index = decoded[pos][0]
+			if ranked is not None:
+				rankings[index] = (ranked[0][row], ranked[1][row])
+			results[index] = _label_prediction(preds[row], min_conf, served, rankings.get(index))
+	for index, name, _img, err in decoded:
+		line = {'index': index, 'filename': name}
+		if err is not None:
+			line['error'] = err
+		elif results.get(index) is None:
+			line.update(_rejection(served, rankings.get(index)))
+		else:
+			line.update(results[index])
+		yield line
+
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+	unavailable = _model_unavailable()
+	if unavailable is not None:
+		return unavailable
+	if not (request.files.getlist('images') or request.files.getlist('image') or request.files.getlist('archive')):
+		return jsonify({'error': "No images provided (fields 'images' or 'archive')"}), 400
+
+	try:
+		k = _requested_top_k()
+	except ValueError:
+		return jsonify({'error': 'top_k must be an integer'}), 400
+	min_conf = _min_confidence()
+	chunk_size = max(1, BATCH_CHUNK_SIZE)
+	pool = _get_decode_pool()
+	# the whole upload is classified by one model version
+	served = model_manager.served
+	w, h = size = _served_size(served)
+
+	def generate():
+		uploads = _iter_batch_uploads()
+		state = {'count': 0, 'errors': 0}
+		# two batch arrays: one is classified while the next chunk decodes into the other
+		buffers = [np.empty((chunk_size, h, w, 3), dtype=np.float32) for _ in range(2)]
+
+		def next_chunk(buffer):
+			chunk = []
+			for name, data in uploads:
+				if state['count'] >= BATCH_MAX_IMAGES:
+					break
+				chunk.append((state['count'], pool.submit(_decode_one, name, data, size, buffer[len(chunk)])))
+				state['count'] += 1
+				if len(chunk) >= chunk_size:
+					break
+			return chunk
+
+		current = 0
+		chunk = next_chunk(buffers[current])
+		while chunk:
+			decoded = []
+			with app_metrics.stage('decode_wait'):
+				for index, fut in chunk:
+					name, img, err = fut.result()
+					decoded.append((index, name, img, err))
+			# queue up decoding of the next chunk while this one is classified
+			batch_buffer = buffers[current]
+			current ^= 1
+			chunk = next_chunk(buffers[current])
+			try:
+				lines = list(_classify_chunk(decoded, min_conf, served, batch_buffer, k))
+			except QueueFullError:
+				lines = [{'index': i, 'filename': n, 'error': 'Server busy, please retry'} for i, n, _, _ in decoded]
+			except Exception as e:
+				lines = [{'index': i, 'filename': n, 'error': str(e)} for i, n, _, _ in decoded]
+			for line in lines:
+				if 'error' in line:
+					state['errors'] += 1
+				yield json.dumps(line) + '\n'
+		yield json.dumps({'done': True, 'count': state['count'], 'errors': state['errors']}) + '\n'
+
+	return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/predict/stats', methods=['GET'])
+def predict_stats():
+	stats = predict_batcher.stats()
+	backend = model_manager.backend
+	if backend is not None and hasattr(backend, 'stats'):
+		# remote backend: batching stats of the shared inference server
+		try:
+			stats['inference_server'] = backend.stats()
+		except Exception as e:
+			stats['inference_server'] = {'error': str(e)}
+	return jsonify(stats)
+
+
+@app.route('/health', methods=['GET'])
+def health():
+	# liveness: the process is up, whatever the model state
+	return jsonify({'ok': True, 'model': model_manager.status()})
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+	status = model_manager.status()
+	return jsonify(status), 200 if status['ready'] else 503
+
+
+@app.route('/predict/cache/stats', methods=['GET'])
+def predict_cache_stats():
+	if prediction_cache is None:
+		return jsonify({'enabled': False})
+	s = prediction_cache.stats()
+	s['enabled'] = True
+	return jsonify(s)
+
+
+# Shadow mode: a candidate registry version (SHADOW_MODEL_VERSION, or set with
+# POST /admin/shadow) also runs on a SHADOW_SAMPLE_RATE share of /predict
+# model calls, off the request path; /admin/shadow compares its answers and
+# latency with the live model's. It uses SHADOW_BACKEND (default: the live
+# backend, or keras when that is remote).
+SHADOW_MODEL_VERSION = os.environ.get('SHADOW_MODEL_VERSION') or None
+SHADOW_SAMPLE_RATE = float(os.environ.get('SHADOW_SAMPLE_RATE', '0.05'))
+SHADOW_BACKEND = os.environ.get('SHADOW_BACKEND') or (
+	INFERENCE_BACKEND if INFERENCE_BACKEND != REMOTE_BACKEND else 'keras')
+SHADOW_MAX_PENDING = int(os.environ.get('SHADOW_MAX_PENDING', '8'))
+shadow = None
+_shadow_lock = threading.Lock()
+
+
+def _set_shadow(candidate):
+	global shadow
+	with _shadow_lock:
+		previous, shadow = shadow, candidate
+	if previous is not None:
+		previous.close()
+
+
+def _start_shadow(version: str, sample_rate: float) -> ShadowEvaluator:
+	manager = ModelManager(lambda: model_registry.load(version, SHADOW_BACKEND, num_threads=INFERENCE_THREADS))
+	manager.start_background()
+	candidate = ShadowEvaluator(manager, sample_rate, max_pending=SHADOW_MAX_PENDING)
+	_set_shadow(candidate)
+	return candidate
+
+
+if SHADOW_MODEL_VERSION:
+	_start_shadow(SHADOW_MODEL_VERSION, SHADOW_SAMPLE_RATE)
+
+
+# Model administration. With ADMIN_TOKEN set, these routes need
+# 'Authorization: Bearer <token>' (or an X-Admin-Token header).
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+
+def _admin_denied():
+	if not ADMIN_TOKEN:
+		return None
+	auth = request.headers.get('Authorization', '')
+	token = auth[len('Bearer '):] if auth.startswith('Bearer ') else request.headers.get('X-Admin-Token', '')
+	if hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+		return None
+	return jsonify({'error': 'Admin token required'}), 401
+
+
+@app.route('/admin/models', methods=['GET'])
+def admin_models():
+	denied = _admin_denied()
+	if denied is not None:
+		return denied
+	candidate = shadow
+	return jsonify({
+		'live': model_manager.status(),
+		'registry': model_registry.describe(),
+		'shadow': candidate.stats() if candidate is not None else None,
+	})
+
+
+@app.route('/admin/models/reload', methods=['POST'])
+def admin_reload():
+	# {"version": "..."} loads that registry version (default: the configured
+	# model); "promote": true also points CURRENT at it so other workers follow
+	denied = _admin_denied()
+	if denied is not None:
+		return denied
+	data = request.get_json(silent=True) or {}
+	version = data.get('version') or None
+	if version is not None and not model_registry.exists(str(version)):
+		return jsonify({'error': f'Unknown model version {version!r}'}), 404
+	if data.get('promote'):
+		if version is None:
+			return jsonify({'error': 'promote needs a version'}), 400
+		model_registry.set_current(str(version))
+	if INFERENCE_BACKEND == REMOTE_BACKEND:
+		# inference_server.py owns the model; the workers' watchers follow it
+		try:
+			result = model_manager.get_backend().reload(version)
+		except Exception as e:
+			return jsonify({'error': f'Inference server unavailable: {e}'}), 503
+		if not result['reloading']:
+			return jsonify({'error': 'A model load is already running', 'model': result['model']}), 409
+		return jsonify({'reloading': True, 'version': version, 'model': result['model']}), 202
+	if not model_manager.reload(lambda: _load_served(version)):
+		return jsonify({'error': 'A model load is already running', 'model': model_manager.status()}), 409
+	return jsonify({'reloading': True, 'version': version, 'model': model_manager.status()}), 202
+
+
+@app.route('/admin/shadow', methods=['GET', 'POST', 'DELETE'])
+def admin_shadow():
+	# POST {"version": "...", "sample_rate": 0.05} starts (or replaces) the
+	# shadow model, DELETE stops it, GET reports the comparison so far
+	denied = _admin_denied()
+	if denied is not None:
+		return denied
+	if request.method == 'POST':
+		data = request.get_json(silent=True) or {}
+		version = str(data.get('version') or '')
+		if not model_registry.exists(version):
+			return jsonify({'error': f'Unknown model version {version!r}'}), 404
+		try:
+			sample_rate = float(data.get('sample_rate', SHADOW_SAMPLE_RATE))
+		except (TypeError, ValueError):
+			return jsonify({'error': 'sample_rate must be a number'}), 400
+		return jsonify(dict(_start_shadow(version, sample_rate).stats(), enabled=True)), 202
+	if request.method == 'DELETE':
+		_set_shadow(None)
+		return jsonify({'enabled': False})
+	candidate = shadow
+	if candidate is None:
+		return jsonify({'enabled': False})
+	return jsonify(dict(candidate.stats(), enabled=True))
+
+
+# Orders live in SQLite; a legacy orders.json is imported once on first start.
+ORDERS_DB_PATH = os.environ.get('ORDERS_DB_PATH', os.path.join(BASE_DIR, 'orders.db'))
+order_store = OrderStore(ORDERS_DB_PATH, legacy_json_path=os.path.join(BASE_DIR, 'orders.json'))
 
 
 @app.route('/order', methods=['POST'])
@@ -174,18 +764,71 @@ def create_order():
 		'status': 'pending',
 		'created_at': int(time.time())
 	}
-	orders = _read_orders()
-	orders.append(order)
-	_write_orders(orders)
+	try:
+		with app_metrics.stage('db'):
+			order_store.create(order)
+	except Exception as e:
+		print('Failed to store order:', e)
+		return jsonify({'error': 'Could not save order'}), 500
 	if payment == 'online':
 		order['status'] = 'awaiting_payment'
 	return jsonify({'ok': True, 'order_id': order_id, 'order': order}), 200
 
 
+ORDERS_PAGE_DEFAULT = int(os.environ.get('ORDERS_PAGE_DEFAULT', '100'))
+ORDERS_PAGE_MAX = int(os.environ.get('ORDERS_PAGE_MAX', '1000'))
+
+
+def _order_filters(args):
+	filters = {
+		'status': args.get('status'),
+		'payment_method': args.get('payment_method'),
+		'email': args.get('email'),
+	}
+	for key in ('created_from', 'created_to'):
+		value = args.get(key)
+		filters[key] = int(value) if value not in (None, '') else None
+	return filters
+
+
 @app.route('/orders', methods=['GET'])
 def list_orders():
-	orders = _read_orders()
-	return jsonify({'count': len(orders), 'orders': orders})
+	# ?status=&payment_method=&email=&created_from=&created_to= filter,
+	# ?limit=&cursor= paginate, ?order=desc for newest first, ?format=ndjson streams all matches.
+	# count is computed for the first page only (later pages return null)
+	# unless ?count=1 asks for it again
+	try:
+		filters = _order_filters(request.args)
+		limit = min(max(1, int(request.args.get('limit', ORDERS_PAGE_DEFAULT))), ORDERS_PAGE_MAX)
+	except ValueError:
+		return jsonify({'error': 'created_from, created_to and limit must be integers'}), 400
+	descending = request.args.get('order', 'asc').lower() == 'desc'
+
+	if request.args.get('format') == 'ndjson':
+		def generate():
+			for data in order_store.iter_json(filters, descending=descending):
+				yield data + '\n'
+		return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+	try:
+		with app_metrics.stage('db'):
+			cursor = request.args.get('cursor')
+			orders, next_cursor = order_store.page(filters, limit=limit, cursor=cursor, descending=descending)
+			count = None
+			if not cursor or request.args.get('count') == '1':
+				count = order_store.count(filters)
+	except ValueError as e:
+		return jsonify({'error': str(e)}), 400
+	return jsonify({'count': count, 'orders': orders, 'next_cursor': next_cursor})
+
+
+@app.route('/orders/stats', methods=['GET'])
+def orders_stats():
+	try:
+		filters = _order_filters(request.args)
+	except ValueError:
+		return jsonify({'error': 'created_from and created_to must be integers'}), 400
+	return jsonify(order_store.aggregates(filters))
 
 
 def _extract_groq_text(resp_json):
@@ -250,6 +893,101 @@ def _extract_groq_text(resp_json):
 	return None
 
 
+# Shared keep-alive client for the Groq endpoint with retries on 429/5xx,
+# a circuit breaker and a bounded worker pool for upstream calls. Groq calls
+# (running or queued) may hold at most GROQ_MAX_CALLERS of a worker's
+# GUNICORN_THREADS request threads, half by default; callers beyond that get
+# 503 at once, so a slow upstream cannot starve /predict.
+REQUEST_THREADS = int(os.environ.get('GUNICORN_THREADS', '8'))
+GROQ_MAX_CALLERS = min(max(1, REQUEST_THREADS - 1),
+					   int(os.environ.get('GROQ_MAX_CALLERS', str(max(1, REQUEST_THREADS // 2)))))
+groq_client = UpstreamClient(
+	pool_size=int(os.environ.get('GROQ_POOL_SIZE', '10')),
+	max_retries=int(os.environ.get('GROQ_MAX_RETRIES', '2')),
+	backoff=float(os.environ.get('GROQ_RETRY_BACKOFF', '0.5')),
+	max_concurrency=int(os.environ.get('GROQ_MAX_CONCURRENCY', '8')),
+	max_pending=int(os.environ.get('GROQ_MAX_PENDING', '32')),
+	max_callers=GROQ_MAX_CALLERS,
+	breaker_threshold=int(os.environ.get('GROQ_BREAKER_THRESHOLD', '5')),
+	breaker_reset=float(os.environ.get('GROQ_BREAKER_RESET', '30')),
+)
+
+
+@app.route('/upstream/stats', methods=['GET'])
+def upstream_stats():
+	s = groq_client.stats()
+	s['chat_stream_ttft_ms'] = chat_ttft.summary()
+	return jsonify(s)
+
+
+def _extract_groq_delta(chunk):
+	# Text fragment carried by one streamed event, across the shapes we accept
+	if not isinstance(chunk, dict):
+		return None
+	# Responses-style events: only *.delta events carry new text; *.done and
+	# response.completed repeat the full answer
+	if 'type' in chunk:
+		delta = chunk.get('delta')
+		if str(chunk.get('type')).endswith('delta'):
+			if isinstance(delta, str):
+				return delta
+			if isinstance(delta, dict):
+				return delta.get('text') or delta.get('content')
+		return None
+	choices = chunk.get('choices')
+	if isinstance(choices, list) and choices and isinstance(choices[0], dict):
+		first = choices[0]
+		delta = first.get('delta')
+		if isinstance(delta, dict):
+			return delta.get('content') or delta.get('text')
+		return first.get('text')
+	return _extract_groq_text(chunk)
+
+
+def _iter_groq_stream(r):
+	# Yields text fragments from an SSE (or NDJSON) upstream body; a plain JSON
+	# body from an upstream that ignored 'stream' is yielded as one fragment
+	ctype = r.headers.get('Content-Type', '')
+	if 'event-stream' not in ctype and 'ndjson' not in ctype:
+		try:
+			jr = r.json()
+		except Exception:
+			jr = None
+		text = _extract_groq_text(jr) or (r.text if r.text else None)
+		if text:
+			yield text
+		return
+	for line in r.iter_lines(decode_unicode=True):
+		if not line:
+			continue
+		if line.startswith('data:'):
+			line = line[5:].strip()
+		elif line.startswith(('event:', 'id:', ':')):
+			continue
+		if line == '[DONE]':
+			break
+		try:
+			chunk = json.loads(line)
+		except ValueError:
+			continue
+		text = _extract_groq_delta(chunk)
+		if text:
+			yield text
+
+
+def _sse(obj):
+	return 'data: ' + json.dumps(obj) + '\n\n'
+
+
+def _stream_response(generate):
+	headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+	return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+
+# time from /chat?stream=1 arrival to the first forwarded token
+chat_ttft = LatencyWindow()
+
+
 @app.route('/verify-groq', methods=['GET'])
 def verify_groq():
 	groq_key = os.environ.get('GROQ_API_KEY')
@@ -259,16 +997,79 @@ def verify_groq():
 	try:
 		headers = {'Authorization': f'Bearer {groq_key}', 'Content-Type': 'application/json'}
 		payload = {'model': os.environ.get('GROQ_MODEL', 'gpt-4o-mini'), 'input': 'Verify Groq access'}
-		r = requests.post(groq_url, headers=headers, data=json.dumps(payload), timeout=15)
+		r = groq_client.post(groq_url, headers=headers, data=json.dumps(payload), timeout=15)
 		try:
 			j = r.json()
 		except Exception:
 			j = {'status_code': r.status_code, 'text': r.text}
 		return jsonify({'ok': r.status_code >= 200 and r.status_code < 300, 'groq_raw': j, 'status_code': r.status_code})
+	except (CircuitOpenError, UpstreamBusyError) as e:
+		return jsonify({'ok': False, 'error': str(e)}), 503
 	except Exception as e:
 		return jsonify({'ok': False, 'error': str(e)}), 500
 
 
+@app.route('/chat/cache/stats', methods=['GET'])
+def chat_cache_stats():
+	s = chat_cache.stats()
+	s['coalesced'] = chat_singleflight.coalesced
+	return jsonify(s)
+
+
+def _chat_stream(k, groq_url, headers, payload):
+	# Server-Sent Events: {'token': ...} per fragment, then {'done': true, ...}.
+	# The upstream call is made before the response starts so connection and
+	# HTTP errors still map to proper status codes.
+	started = time.perf_counter()
+	try:
+		with app_metrics.stage('upstream_connect'):
+			r = groq_client.post(groq_url, headers=headers, data=json.dumps(payload), timeout=30, stream=True)
+	except (CircuitOpenError, UpstreamBusyError) as e:
+		return jsonify({'error': str(e)}), 503
+	except Exception as e:
+		return jsonify({'error': str(e)}), 502
+	if r.status_code < 200 or r.status_code >= 300:
+		detail = r.text
+		r.close()
+		return jsonify({'error': f'Groq HTTP {r.status_code}', 'detail': detail}), 502
+
+	def generate():
+		parts = []
+		ttft_ms = None
+		try:
+			for text in _iter_groq_stream(r):
+				if ttft_ms is None:
+					ttft_ms = (time.perf_counter() - started) * 1000.0
+					chat_ttft.add(ttft_ms)
+					app_metrics.observe_stage('upstream_first_token', ttft_ms / 1000.0)
+				parts.append(text)
+				yield _sse({'token': text})
+		except Exception as e:
+			yield _sse({'error': str(e)})
+			return
+		finally:
+			r.close()
+		answer = ''.join(parts)
+		if not answer:
+			yield _sse({'error': 'Groq returned no text'})
+			return
+		cache_set(k, answer)
+		total_ms = (time.perf_counter() - started) * 1000.0
+		yield _sse({'done': True, 'source': 'groq', 'ttft_ms': round(ttft_ms, 3), 'total_ms': round(total_ms, 3)})
+
+	response = _stream_response(generate)
+	# a client that disconnects before the first token never starts
+	# generate(), so its finally cannot be relied on to free the upstream slot
+	response.call_on_close(r.close)
+	return response
+
+
+class ChatUpstreamError(Exception):
+	def __init__(self, payload):
+		super().__init__(payload.get('error'))
+		self.payload = payload
+
+
 @app.route('/chat', methods=['POST'])
 def chat():
 	data = request.get_json() or {}
@@ -281,31 +1082,204 @@ def chat():
 	if not groq_key or not groq_url:
 		return jsonify({'error': 'GROQ not configured on server'}), 400
 
+	stream = bool(data.get('stream')) or request.args.get('stream') == '1'
+
 	# basic cache check
 	k = question_key(question)
-	cached = cache_get(k)
+	with app_metrics.stage('cache'):
+		cached = cache_get(k)
 	if cached:
+		if stream:
+			return _stream_response(lambda: iter([_sse({'token': cached}), _sse({'done': True, 'cached': True, 'source': 'cache'})]))
 		return jsonify({'answer': cached, 'cached': True, 'source': 'cache'})
 
 	headers = {'Authorization': f'Bearer {groq_key}', 'Content-Type': 'application/json'}
 	payload = {'model': os.environ.get('GROQ_MODEL', 'gpt-4o-mini'), 'input': question}
-	try:
-		r = requests.post(groq_url, headers=headers, data=json.dumps(payload), timeout=30)
+
+	if stream:
+		return _chat_stream(k, groq_url, headers, dict(payload, stream=True))
+
+	def ask_groq():
+		r = groq_client.post(groq_url, headers=headers, data=json.dumps(payload), timeout=30)
 		if r.status_code < 200 or r.status_code >= 300:
-			return jsonify({'error': f'Groq HTTP {r.status_code}', 'detail': r.text}), 502
+			raise ChatUpstreamError({'error': f'Groq HTTP {r.status_code}', 'detail': r.text})
 		try:
 			jr = r.json()
 		except Exception:
 			jr = None
 		text = _extract_groq_text(jr) or (r.text if r.text else None)
 		if not text:
-			return jsonify({'error': 'Groq returned no text'}), 502
+			raise ChatUpstreamError({'error': 'Groq returned no text'})
 		cache_set(k, text)
-		return jsonify({'answer': text, 'source': 'groq'})
+		return text
+
+	try:
+		with app_metrics.stage('upstream'):
+			text, shared = chat_singleflight.do(k, ask_groq)
+		resp = {'answer': text, 'source': 'groq'}
+		if shared:
+			resp['coalesced'] = True
+		return jsonify(resp)
+	except ChatUpstreamError as e:
+		return jsonify(e.payload), 502
+	except (CircuitOpenError, UpstreamBusyError) as e:
+		return jsonify({'error': str(e)}), 503
 	except Exception as e:
 		return jsonify({'error': str(e)}), 502
 
 
+# Similar-image search over the training set: embeddings of the hidden layer
+# before the softmax, built with `python embedding_index.py extract` (and
+# optionally `build` for the IVF lists) and memory-mapped here.
+EMBEDDING_INDEX_DIR = os.environ.get('EMBEDDING_INDEX_DIR', os.path.join(BASE_DIR, 'embedding_index'))
+SIMILAR_MAX_K = int(os.environ.get('SIMILAR_MAX_K', '50'))
+embedding_index = None
+if os.path.exists(os.path.join(EMBEDDING_INDEX_DIR, 'meta.json')):
+	try:
+		from embedding_index import EmbeddingIndex
+		embedding_index = EmbeddingIndex(EMBEDDING_INDEX_DIR)
+		print(f'Loaded embedding index with {len(embedding_index)} images from', EMBEDDING_INDEX_DIR)
+	except Exception as e:
+		print('Failed to load embedding index:', e)
+		embedding_index = None
+# (served model, index, meta.json mtime) last checked by _index_for() and
+# the verdict; a swap, an index reload or a rebuilt index makes it stale
+_index_checked = (None, None, None, False)
+_index_lock = threading.Lock()
+
+
+def _keras_artifact(served):
+	# the Keras file the served model was exported from; embedding_index.py
+	# extracts with it, whichever backend serves the version
+	if served.version and model_registry.exists(served.version):
+		return model_registry.artifact(served.version)
+	if MODEL_PATH and MODEL_PATH.endswith('.h5'):
+		return MODEL_PATH
+	directory = os.path.dirname(os.path.abspath(MODEL_PATH)) if MODEL_PATH else BASE_DIR
+	return os.path.join(directory, 'dog_breed_model.h5')
+
+
+def _index_for(served):
+	"""The embedding index if it was built with `served`, else None. After a
+	model swap, or when meta.json changes, the index directory is re-read, so
+	an index rebuilt for the new version is picked up without a restart."""
+	global embedding_index, _index_checked
+	try:
+		meta_mtime = os.stat(os.path.join(EMBEDDING_INDEX_DIR, 'meta.json')).st_mtime
+	except OSError:
+		meta_mtime = None
+	checked_served, checked_index, checked_mtime, ok = _index_checked
+	if checked_served is served and checked_index is embedding_index and checked_mtime == meta_mtime:
+		return embedding_index if ok else None
+	with _index_lock:
+		index = embedding_index
+		ok = index is not None and index.matches_model(_keras_artifact(served), served.version)
+		if not ok and meta_mtime is not None:
+			try:
+				from embedding_index import EmbeddingIndex
+				fresh = EmbeddingIndex(EMBEDDING_INDEX_DIR)
+				if fresh.matches_model(_keras_artifact(served), served.version):
+					index, ok = fresh, True
+					embedding_index = fresh
+					print(f'Reloaded embedding index for model {served.version} ({len(fresh)} images)')
+			except Exception as e:
+				print('Failed to reload embedding index:', e)
+		if not ok:
+			print(f'Warning: embedding index was not built with model {served.version or _keras_artifact(served)}; '
+				  'rebuild it (python embedding_index.py extract)')
+		_index_checked = (served, index, meta_mtime, ok)
+	return index if ok else None
+
+
+# lists scanned per query when the index has IVF lists (0 = exact search)
+SIMILAR_NPROBE = int(os.environ.get('SIMILAR_NPROBE', '8' if embedding_index is not None and embedding_index.centroids is not None else '0'))
+
+
+@app.route('/similar', methods=['POST'])
+def similar():
+	# ?k= nearest training images to the upload, ?nprobe= overrides SIMILAR_NPROBE
+	if embedding_index is None:
+		return jsonify({'error': 'Similarity index not available on server'}), 503
+	unavailable = _model_unavailable()
+	if unavailable is not None:
+		return unavailable
+	served = model_manager.served
+	backend = served.backend
+	if not hasattr(backend, 'embed'):
+		return jsonify({'error': f'Backend {backend.name!r} does not expose embeddings; use keras'}), 501
+	index = _index_for(served)
+	if index is None:
+		# vectors from another model version would give confident but wrong neighbours
+		return jsonify({'error': f'Similarity index does not match model {served.version}; rebuild it'}), 503
+	if _upload_too_large():
+		return jsonify({'error': 'Image too large'}), 413
+	if 'image' not in request.files:
+		return jsonify({'error': "No image file provided (field 'image')"}), 400
+	try:
+		k = max(1, min(int(request.args.get('k', '5')), SIMILAR_MAX_K))
+		nprobe = max(0, int(request.args.get('nprobe', SIMILAR_NPROBE)))
+	except ValueError:
+		return jsonify({'error': 'k and nprobe must be integers'}), 400
+	try:
+		timings = {}
+		img_input = read_image_from_bytes(request.files['image'].read(), timings, _served_size(served))
+		app_metrics.observe_stage('decode', timings['decode'])
+		app_metrics.observe_stage('preprocess', timings['preprocess'])
+		with app_metrics.stage('embed'):
+			vector = backend.embed(img_input)[0]
+		t0 = time.perf_counter()
+		hits = index.search(vector, k, nprobe)
+		search_s = time.perf_counter() - t0
+		app_metrics.observe_stage('search', search_s)
+		return jsonify({
+			'results': index.describe(hits),
+			'exact': not (nprobe and index.centroids is not None),
+			'search_ms': round(search_s * 1000.0, 3),
+		})
+	except ImageTooLargeError as e:
+		return jsonify({'error': str(e)}), 413
+	except Exception as e:
+		return jsonify({'error': str(e)}), 500
+
+
+def _cache_gauge(cache, *path):
+	# scrape-time reader for a numeric field of a cache's stats()
+	def read():
+		if cache is None:
+			return None
+		value = cache.stats()
+		for key in path:
+			value = (value or {}).get(key)
+		return value
+	return read
+
+
+_registry = app_metrics.registry
+_registry.gauge_callback('app_prediction_cache_hit_ratio', 'Prediction cache hit ratio since start.',
+						 _cache_gauge(prediction_cache, 'hit_ratio'))
+_registry.gauge_callback('app_prediction_cache_entries', 'Prediction cache entries in memory.',
+						 _cache_gauge(prediction_cache, 'memory', 'entries'))
+_registry.gauge_callback('app_chat_cache_hit_ratio', 'Chat answer cache hit ratio since start.',
+						 _cache_gauge(chat_cache, 'hit_ratio'))
+_registry.gauge_callback('app_chat_cache_entries', 'Chat answer cache entries in memory.',
+						 _cache_gauge(chat_cache, 'entries'))
+_registry.gauge_callback('app_predict_queue_depth', 'Inputs waiting for a micro-batch.',
+						 lambda: predict_batcher.stats()['queue_depth'])
+_registry.gauge_callback('app_predict_batch_mean_size', 'Mean rows per model batch since start.',
+						 lambda: predict_batcher.stats()['mean_batch_size'])
+_registry.gauge_callback('app_model_ready', '1 once the model is loaded and warmed.',
+						 lambda: int(model_manager.ready))
+_registry.gauge_callback('app_model_swaps', 'Models swapped in by reloads since start.',
+						 lambda: model_manager.swaps)
+_registry.gauge_callback('app_upstream_breaker_open', '1 while the Groq circuit breaker is open.',
+						 lambda: int(groq_client.breaker.state == 'open'))
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+	return Response(_registry.render(), mimetype='text/plain; version=0.0.4')
+
+
 	app.run(host='0.0.0.0', port=int(os.environ.get('PORT', '5000')), debug=False)
 if __name__ == '__main__':
 	app.run(host='0.0.0.0', port=int(os.environ.get('PORT', '5000')), debug=False)
@@ -0,0 +1,123 @@
+"""Per-image preprocessing time and peak memory: the original
+read_image_from_bytes versus preprocess.preprocess_image.
+
+    python benchmarks/bench_preprocess.py                     # synthetic JPEGs
+    python benchmarks/bench_preprocess.py --images a.jpg b.png
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preprocess import preprocess_image  # noqa: E402
+
+SYNTHETIC_SIZES = [(640, 480), (1280, 960), (1920, 1080), (4032, 3024)]
+
+
+def legacy_read_image_from_bytes(file_bytes):
+    # app.py's implementation before preprocess.py, kept verbatim as the baseline
+    nparr = np.frombuffer(file_bytes, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError('Could not decode image')
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    img = cv2.resize(img, (224, 224))
+    img = img.astype(np.float32) / 255.0
+    img = np.expand_dims(img, axis=0)
+    return img
+
+
+def synthetic_jpeg(width, height, quality=90, seed=0):
+    # smooth gradients plus noise, so the JPEG is neither trivial nor random
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([xx / width, yy / height, (xx + yy) / (width + height)], axis=-1) * 200
+    img = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes()
+
+
+def peak_rss_mb():
+    # high-water mark of the process (Linux); None elsewhere
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def measure(fn, data, repeats):
+    fn(data)  # warm-up
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn(data)
+        times.append((time.perf_counter() - t0) * 1000.0)
+    tracemalloc.start()
+    fn(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'mean_ms': round(float(np.mean(times)), 3),
+        'p50_ms': round(float(np.percentile(times, 50)), 3),
+        'p95_ms': round(float(np.percentile(times, 95)), 3),
+        'peak_alloc_mb': round(peak / (1024 * 1024), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark upload preprocessing.')
+    parser.add_argument('--images', nargs='*', help='real image files (default: synthetic JPEGs)')
+    parser.add_argument('--repeats', type=int, default=30)
+    parser.add_argument('--threads', type=int, default=1, help='cv2.setNumThreads, 1 = per-request cost')
+    parser.add_argument('--out', default=None, help='also write the results as JSON')
+    args = parser.parse_args()
+
+    cv2.setNumThreads(args.threads)
+    if args.images:
+        cases = []
+        for path in args.images:
+            with open(path, 'rb') as f:
+                cases.append((os.path.basename(path), f.read()))
+    else:
+        cases = [(f'{w}x{h}.jpg', synthetic_jpeg(w, h)) for w, h in SYNTHETIC_SIZES]
+
+    out = np.empty((224, 224, 3), dtype=np.float32)
+    results = []
+    for name, data in cases:
+        legacy = measure(legacy_read_image_from_bytes, data, args.repeats)
+        new = measure(preprocess_image, data, args.repeats)
+        reused = measure(lambda d: preprocess_image(d, out=out), data, args.repeats)
+        diff = np.abs(legacy_read_image_from_bytes(data)[0] - preprocess_image(data))
+        row = {
+            'image': name,
+            'bytes': len(data),
+            'legacy': legacy,
+            'preprocess': new,
+            'preprocess_into_buffer': reused,
+            'speedup': round(legacy['mean_ms'] / max(new['mean_ms'], 1e-9), 2),
+            'mean_abs_diff': round(float(diff.mean()), 5),
+        }
+        results.append(row)
+        print(f"{name:>16}  legacy {legacy['mean_ms']:8.2f} ms {legacy['peak_alloc_mb']:7.2f} MB | "
+              f"new {new['mean_ms']:8.2f} ms {new['peak_alloc_mb']:7.2f} MB | "
+              f"buffer {reused['peak_alloc_mb']:6.2f} MB | x{row['speedup']} | diff {row['mean_abs_diff']}")
+
+    summary = {'threads': args.threads, 'repeats': args.repeats, 'peak_rss_mb': peak_rss_mb(), 'results': results}
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    print(f"peak RSS {summary['peak_rss_mb']} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,477 @@
+"""Load test for the Flask service: /predict, /chat, /order and /orders.
+
+Each scenario runs for --duration seconds (after --warmup) at every
+--concurrency level, with one keep-alive session per client thread. The
+results (requests/sec, latency percentiles, status counts and the server's
+peak RSS) are written as JSON; --compare prints the change against an
+earlier run, e.g. one taken on the previous commit.
+
+    # start a stub Groq endpoint and the app, then run every scenario
+    python benchmarks/load_test.py --spawn --concurrency 1 8 32 --out bench.json
+
+    # against a server that is already running (pass its pid for RSS)
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 --server-pid 1234
+
+    # gunicorn with the shared inference server
+    python benchmarks/load_test.py --spawn --server-cmd "gunicorn -c gunicorn.conf.py app:app"
+
+    python benchmarks/load_test.py --spawn --out new.json --compare old.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import shlex
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ('predict', 'chat', 'chat_stream', 'order', 'orders')
+DEFAULT_SCENARIOS = ('predict', 'chat', 'order', 'orders')
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+CHAT_POOL = [
+    'How much exercise does a Beagle need?',
+    'What should I feed a Labrador puppy?',
+    'Are Huskies good with children?',
+    'How often should I groom a Poodle?',
+    'Why does my dog eat grass?',
+    'How do I stop my puppy from biting?',
+    'What vaccines does a puppy need?',
+    'Is chocolate dangerous for dogs?',
+]
+
+
+# ---------------------------------------------------------------- corpus
+
+def load_corpus(images_dir, max_images, seed):
+    """Up to max_images files spread round-robin across breed folders, read
+    into memory so disk reads do not show up in the latencies."""
+    rng = random.Random(seed)
+    by_breed = []
+    for breed in sorted(os.listdir(images_dir)):
+        folder = os.path.join(images_dir, breed)
+        if not os.path.isdir(folder):
+            continue
+        files = sorted(f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTS))
+        rng.shuffle(files)
+        if files:
+            by_breed.append([os.path.join(folder, f) for f in files])
+    rng.shuffle(by_breed)
+    picked = []
+    depth = 0
+    while len(picked) < max_images and any(depth < len(files) for files in by_breed):
+        for files in by_breed:
+            if depth < len(files) and len(picked) < max_images:
+                picked.append(files[depth])
+        depth += 1
+    corpus = []
+    for path in picked:
+        with open(path, 'rb') as f:
+            corpus.append((os.path.basename(path), f.read()))
+    return corpus
+
+
+# ---------------------------------------------------------------- requests
+
+def make_request(scenario, rng, corpus, args):
+    """(method, path, requests kwargs) for one request of the scenario."""
+    if scenario == 'predict':
+        name, data = corpus[rng.randrange(len(corpus))]
+        return 'POST', '/predict', {'files': {'image': (name, data, 'image/jpeg')}}
+    if scenario in ('chat', 'chat_stream'):
+        # a share of repeated questions exercises the answer cache
+        if rng.random() < args.chat_repeat:
+            question = rng.choice(CHAT_POOL)
+        else:
+            question = f'{rng.choice(CHAT_POOL)} (#{rng.getrandbits(48):x})'
+        body = {'question': question}
+        if scenario == 'chat_stream':
+            body['stream'] = True
+            return 'POST', '/chat', {'json': body, 'stream': True}
+        return 'POST', '/chat', {'json': body}
+    if scenario == 'order':
+        n = rng.randint(1, 4)
+        body = {
+            'user': {'name': f'Load Test {rng.randrange(1000)}', 'address': '1 Bench Street',
+                     'email': f'load{rng.randrange(100)}@example.com'},
+            'items': [{'name': f'item-{rng.randrange(50)}', 'qty': rng.randint(1, 3),
+                       'price': round(rng.uniform(1, 80), 2)} for _ in range(n)],
+            'payment_method': rng.choice(('cod', 'online')),
+        }
+        return 'POST', '/order', {'json': body}
+    if scenario == 'orders':
+        params = {'limit': args.orders_limit, 'order': 'desc'}
+        if rng.random() < 0.5:
+            params['status'] = 'pending'
+        return 'GET', '/orders', {'params': params}
+    raise ValueError(f'unknown scenario {scenario!r}')
+
+
+def timed_request(session, base_url, method, path, kwargs, timeout):
+    """(status, total seconds, seconds to first byte); status 0 = failed."""
+    t0 = time.perf_counter()
+    try:
+        r = session.request(method, base_url + path, timeout=timeout, **kwargs)
+        if kwargs.get('stream'):
+            first = None
+            for _ in r.iter_content(chunk_size=None):
+                if first is None:
+                    first = time.perf_counter() - t0
+            r.close()
+        else:
+            r.content
+            first = None
+        return r.status_code, time.perf_counter() - t0, first
+    except requests.RequestException:
+        return 0, time.perf_counter() - t0, None
+
+
+# ---------------------------------------------------------------- memory
+
+def _status_kb(pid, field):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def process_tree(pid):
+    """pid plus all of its descendants (gunicorn workers, inference server)."""
+    pids, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        pids.append(p)
+        try:
+            for tid in os.listdir(f'/proc/{p}/task'):
+                with open(f'/proc/{p}/task/{tid}/children') as f:
+                    stack.extend(int(c) for c in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+class RssSampler:
+    """Samples the summed VmRSS of a process tree while a scenario runs;
+    VmHWM alone only gives the peak over the whole server lifetime."""
+
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        total = sum(_status_kb(p, 'VmRSS') or 0 for p in process_tree(self.pid))
+        self.peak_kb = max(self.peak_kb, total)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        if self.pid:
+            self._sample()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._sample()
+
+    @property
+    def peak_mb(self):
+        return round(self.peak_kb / 1024, 1) if self.pid else None
+
+
+def peak_rss_mb(pid):
+    """Lifetime peak (VmHWM) of each process in the tree, summed."""
+    if not pid:
+        return None
+    return round(sum(_status_kb(p, 'VmHWM') or 0 for p in process_tree(pid)) / 1024, 1)
+
+
+# ---------------------------------------------------------------- running
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    # nearest-rank
+    i = min(len(sorted_values) - 1, max(0, math.ceil(q / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[i]
+
+
+def latency_summary(seconds):
+    values = sorted(s * 1000 for s in seconds)
+    if not values:
+        return None
+    return {
+        'mean': round(sum(values) / len(values), 2),
+        'p50': round(percentile(values, 50), 2),
+        'p95': round(percentile(values, 95), 2),
+        'p99': round(percentile(values, 99), 2),
+        'max': round(values[-1], 2),
+    }
+
+
+def drive(scenario, concurrency, seconds, corpus, args, seed):
+    """Closed-loop clients: each thread sends its next request as soon as
+    the previous one finishes, until the deadline."""
+    deadline = time.perf_counter() + seconds
+
+    def client(i):
+        rng = random.Random(seed * 1000 + i)
+        samples = []
+        with requests.Session() as session:
+            while time.perf_counter() < deadline:
+                method, path, kwargs = make_request(scenario, rng, corpus, args)
+                samples.append(timed_request(session, args.url, method, path, kwargs, args.timeout))
+        return samples
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        t0 = time.perf_counter()
+        results = list(pool.map(client, range(concurrency)))
+        elapsed = time.perf_counter() - t0
+    return [s for r in results for s in r], elapsed
+
+
+def run_scenario(scenario, concurrency, corpus, args, server_pid):
+    if args.warmup > 0:
+        drive(scenario, concurrency, args.warmup, corpus, args, seed=args.seed + 1)
+    with RssSampler(server_pid) as rss:
+        samples, elapsed = drive(scenario, concurrency, args.duration, corpus, args, seed=args.seed)
+    statuses = Counter(str(status) for status, _, _ in samples)
+    ok = sum(1 for status, _, _ in samples if 200 <= status < 300)
+    result = {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'duration_s': round(elapsed, 2),
+        'requests': len(samples),
+        'ok': ok,
+        'errors': len(samples) - ok,
+        'status_counts': dict(sorted(statuses.items())),
+        'rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'ok_rps': round(ok / elapsed, 2) if elapsed else 0.0,
+        # latencies of successful responses only; failures are often fast
+        'latency_ms': latency_summary([t for status, t, _ in samples if 200 <= status < 300]),
+        'peak_rss_mb': rss.peak_mb,
+    }
+    if scenario == 'chat_stream':
+        result['ttfb_ms'] = latency_summary([f for status, _, f in samples if 200 <= status < 300 and f is not None])
+    return result
+
+
+# ---------------------------------------------------------------- spawning
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, timeout, ok=lambda r: r.status_code == 200, proc=None):
+    deadline = time.time() + timeout
+    last = None
+    while time.time() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f'process exited with code {proc.returncode} before {url} answered')
+        try:
+            last = requests.get(url, timeout=2)
+            if ok(last):
+                return last
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f'{url} not ready after {timeout}s' + (f' (last status {last.status_code})' if last else ''))
+
+
+def spawn(args, workdir):
+    """Start the stub Groq endpoint and the app; returns (procs, app pid)."""
+    procs = []
+    stub_port = args.stub_port or free_port()
+    stub_cmd = [sys.executable, os.path.join(BASE_DIR, 'benchmarks', 'stub_groq.py'),
+                '--port', str(stub_port), '--latency-ms', str(args.stub_latency_ms),
+                '--jitter-ms', str(args.stub_jitter_ms), '--shape', args.stub_shape]
+    procs.append(subprocess.Popen(stub_cmd, cwd=BASE_DIR))
+    wait_for(f'http://127.0.0.1:{stub_port}/stats', 15, proc=procs[-1])
+
+    port = args.port or free_port()
+    args.url = f'http://127.0.0.1:{port}'
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'GROQ_API_URL': f'http://127.0.0.1:{stub_port}/v1/responses',
+        'GROQ_API_KEY': env.get('GROQ_API_KEY') or 'stub',
+        # a fresh database per run so /orders timings do not depend on history
+        'ORDERS_DB_PATH': os.path.join(workdir, 'orders.db'),
+    })
+    # app.py and gunicorn.conf.py both listen on $PORT
+    cmd = shlex.split(args.server_cmd) if args.server_cmd else [sys.executable, os.path.join(BASE_DIR, 'app.py')]
+    app_proc = subprocess.Popen(cmd, cwd=BASE_DIR, env=env)
+    procs.append(app_proc)
+    wait_for(args.url + '/health', args.ready_timeout, proc=app_proc)
+    status = wait_for(args.url + '/ready', args.ready_timeout, proc=app_proc,
+                      ok=lambda r: r.status_code == 200 or (r.json() or {}).get('state') == 'failed')
+    if status.status_code != 200:
+        print(f'⚠️ Model failed to load ({status.json().get("error")}); /predict will return errors', flush=True)
+    return procs, app_proc.pid
+
+
+def stop(procs):
+    for p in reversed(procs):
+        if p.poll() is None:
+            p.terminate()
+    for p in reversed(procs):
+        try:
+            p.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+
+# ---------------------------------------------------------------- reporting
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BASE_DIR,
+                               capture_output=True, text=True).stdout.strip()
+        return out.stdout.strip() + ('-dirty' if dirty else '') if out.returncode == 0 else None
+    except OSError:
+        return None
+
+
+def print_table(results):
+    print(f'{"scenario":<12} {"conc":>4} {"req":>7} {"err":>5} {"rps":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"rss MB":>8}')
+    for r in results:
+        lat = r['latency_ms'] or {}
+        print(f'{r["scenario"]:<12} {r["concurrency"]:>4} {r["requests"]:>7} {r["errors"]:>5} {r["rps"]:>8.1f} '
+              f'{lat.get("p50", float("nan")):>8.1f} {lat.get("p95", float("nan")):>8.1f} '
+              f'{lat.get("p99", float("nan")):>8.1f} {r["peak_rss_mb"] if r["peak_rss_mb"] is not None else "-":>8}')
+
+
+def _change(new, old):
+    if new is None or not old:
+        return '     -'
+    return f'{(new - old) / old * 100:+6.1f}%'
+
+
+def print_comparison(report, baseline, file=sys.stdout):
+    old = {(r['scenario'], r['concurrency']): r for r in baseline.get('results', [])}
+    print(f'\nvs {baseline.get("meta", {}).get("commit") or "baseline"} '
+          f'(rps and latency changes; lower latency is better)', file=file)
+    print(f'{"scenario":<12} {"conc":>4} {"rps":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"rss":>8}', file=file)
+    for r in report['results']:
+        b = old.get((r['scenario'], r['concurrency']))
+        if b is None:
+            print(f'{r["scenario"]:<12} {r["concurrency"]:>4}   (not in baseline)', file=file)
+            continue
+        lat, blat = r['latency_ms'] or {}, b['latency_ms'] or {}
+        print(f'{r["scenario"]:<12} {r["concurrency"]:>4} {_change(r["rps"], b["rps"]):>8} '
+              f'{_change(lat.get("p50"), blat.get("p50")):>8} {_change(lat.get("p95"), blat.get("p95")):>8} '
+              f'{_change(lat.get("p99"), blat.get("p99")):>8} {_change(r["peak_rss_mb"], b.get("peak_rss_mb")):>8}', file=file)
+
+
+def build_parser():
+    p = argparse.ArgumentParser(description='Load test /predict, /chat, /order and /orders')
+    p.add_argument('--url', default='http://127.0.0.1:5000', help='server to test (ignored with --spawn)')
+    p.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(DEFAULT_SCENARIOS))
+    p.add_argument('--concurrency', nargs='+', type=int, default=[8], help='one run per level')
+    p.add_argument('--duration', type=float, default=15.0, help='measured seconds per run')
+    p.add_argument('--warmup', type=float, default=2.0, help='unmeasured seconds before each run')
+    p.add_argument('--timeout', type=float, default=60.0, help='per-request timeout')
+    p.add_argument('--images', default=os.path.join(BASE_DIR, 'images', 'Images'), help='breed folders for /predict')
+    p.add_argument('--max-images', type=int, default=200)
+    p.add_argument('--chat-repeat', type=float, default=0.5, help='share of /chat questions repeated from a small pool')
+    p.add_argument('--orders-limit', type=int, default=50)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--server-pid', type=int, help='pid of an already running server, for RSS')
+    p.add_argument('--spawn', action='store_true', help='start the stub Groq endpoint and the app')
+    p.add_argument('--server-cmd', help='command for --spawn instead of "python app.py"')
+    p.add_argument('--port', type=int, help='app port for --spawn (default: a free port)')
+    p.add_argument('--ready-timeout', type=float, default=300.0, help='seconds to wait for the model to load')
+    p.add_argument('--stub-port', type=int)
+    p.add_argument('--stub-latency-ms', type=float, default=300.0)
+    p.add_argument('--stub-jitter-ms', type=float, default=50.0)
+    p.add_argument('--stub-shape', default='responses')
+    p.add_argument('--out', help='write the JSON report here (default: stdout)')
+    p.add_argument('--compare', help='earlier JSON report to compare against')
+    return p
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    corpus = []
+    if 'predict' in args.scenarios:
+        if not os.path.isdir(args.images):
+            sys.exit(f'Image folder not found: {args.images}')
+        corpus = load_corpus(args.images, args.max_images, args.seed)
+        if not corpus:
+            sys.exit(f'No images under {args.images}')
+        print(f'📂 {len(corpus)} images, {sum(len(d) for _, d in corpus) / len(corpus) / 1024:.0f} KB on average',
+              file=sys.stderr)
+
+    procs = []
+    server_pid = args.server_pid
+    with tempfile.TemporaryDirectory(prefix='load-test-') as workdir:
+        try:
+            if args.spawn:
+                procs, server_pid = spawn(args, workdir)
+            results = []
+            for concurrency in args.concurrency:
+                for scenario in args.scenarios:
+                    print(f'🚀 {scenario} x{concurrency} for {args.duration:g}s', file=sys.stderr, flush=True)
+                    results.append(run_scenario(scenario, concurrency, corpus, args, server_pid))
+            server_hwm = peak_rss_mb(server_pid)
+        finally:
+            stop(procs)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': int(time.time()),
+            'url': args.url,
+            'spawned': args.spawn,
+            'server_cmd': args.server_cmd,
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'duration_s': args.duration,
+            'images': len(corpus),
+            'chat_repeat': args.chat_repeat,
+            'stub_latency_ms': args.stub_latency_ms if args.spawn else None,
+        },
+        'server_peak_rss_mb': server_hwm,
+        'results': results,
+    }
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print_table(results)
+        print(f'📊 Saved {args.out}')
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            print_comparison(report, json.load(f), file=sys.stdout if args.out else sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Local stand-in for the Groq endpoint used by /chat, for load tests.
+
+Answers every POST after a configurable delay with one of the response
+shapes app._extract_groq_text understands, and streams deltas (the shapes
+app._extract_groq_delta understands) when the payload has "stream": true.
+
+    python benchmarks/stub_groq.py --port 8900 --latency-ms 300 --shape responses
+    GROQ_API_URL=http://127.0.0.1:8900/v1/responses GROQ_API_KEY=stub python app.py
+
+GET /stats returns the request counters.
+"""
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ('dogs need daily exercise fresh water balanced food regular vet visits grooming and plenty '
+         'of attention most breeds enjoy walks puzzle toys and gentle training with treats').split()
+
+# non-streamed bodies, one per shape handled by _extract_groq_text
+SHAPES = {
+    'responses': lambda text: {'output': [{'type': 'message', 'role': 'assistant',
+                                           'content': [{'type': 'output_text', 'text': text}]}]},
+    'output_str': lambda text: {'output': text},
+    'output_dict': lambda text: {'output': {'text': text}},
+    'text': lambda text: {'text': text},
+    'choices_text': lambda text: {'choices': [{'index': 0, 'text': text}]},
+    'chat': lambda text: {'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}}]},
+}
+
+
+def stream_event(shape, fragment):
+    # Responses-style delta events for the 'output' shapes, chat-completion
+    # chunks for the 'choices' shapes
+    if shape in ('choices_text', 'chat'):
+        key = 'text' if shape == 'choices_text' else 'delta'
+        value = fragment if shape == 'choices_text' else {'content': fragment}
+        return {'object': 'chat.completion.chunk', 'choices': [{'index': 0, key: value}]}
+    return {'type': 'response.output_text.delta', 'delta': fragment}
+
+
+def answer_for(prompt, words):
+    # deterministic per prompt, so repeated questions get identical answers
+    rng = random.Random(hashlib.sha1(prompt.encode('utf-8')).digest())
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+class StubState:
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.streamed = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def enter(self, streamed):
+        with self.lock:
+            self.requests += 1
+            self.streamed += int(streamed)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def snapshot(self):
+        with self.lock:
+            return {'requests': self.requests, 'streamed': self.streamed, 'errors': self.errors,
+                    'in_flight': self.in_flight, 'peak_in_flight': self.peak_in_flight}
+
+
+def make_handler(state):
+    args = state.args
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, fmt, *a):
+            if args.verbose:
+                super().log_message(fmt, *a)
+
+        def _send_json(self, status, obj):
+            body = json.dumps(obj).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/stats':
+                self._send_json(200, state.snapshot())
+            else:
+                self._send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                payload = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                self._send_json(400, {'error': 'invalid json'})
+                return
+            stream = bool(payload.get('stream'))
+            state.enter(stream)
+            try:
+                if args.error_rate and random.random() < args.error_rate:
+                    with state.lock:
+                        state.errors += 1
+                    time.sleep(args.latency_ms / 1000.0)
+                    self._send_json(args.error_status, {'error': {'message': 'stub upstream error'}})
+                    return
+                prompt = str(payload.get('input') or payload.get('messages') or '')
+                text = answer_for(prompt, args.words)
+                delay = max(0.0, random.gauss(args.latency_ms, args.jitter_ms)) / 1000.0
+                if stream:
+                    self._stream(text, delay)
+                else:
+                    time.sleep(delay)
+                    self._send_json(200, SHAPES[args.shape](text))
+            finally:
+                state.leave()
+
+        def _stream(self, text, delay):
+            # time to first token is the configured latency; the remaining
+            # words follow every --token-interval-ms
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            time.sleep(delay)
+            words = text.split(' ')
+            try:
+                for i, word in enumerate(words):
+                    if i:
+                        time.sleep(args.token_interval_ms / 1000.0)
+                    fragment = word if i == 0 else ' ' + word
+                    self.wfile.write(b'data: ' + json.dumps(stream_event(args.shape, fragment)).encode('utf-8') + b'\n\n')
+                    self.wfile.flush()
+                self.wfile.write(b'data: [DONE]\n\n')
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return Handler
+
+
+def build_parser():
+    p = argparse.ArgumentParser(description='Stub Groq/OpenAI-style endpoint for load tests')
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8900)
+    p.add_argument('--latency-ms', type=float, default=300.0, help='mean response time (time to first token when streaming)')
+    p.add_argument('--jitter-ms', type=float, default=50.0, help='standard deviation of the response time')
+    p.add_argument('--token-interval-ms', type=float, default=20.0, help='delay between streamed words')
+    p.add_argument('--words', type=int, default=40, help='answer length in words')
+    p.add_argument('--shape', choices=sorted(SHAPES), default='responses', help='non-streamed response shape')
+    p.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with --error-status')
+    p.add_argument('--error-status', type=int, default=503)
+    p.add_argument('--verbose', action='store_true', help='log every request')
+    return p
+
+
+def serve(args):
+    state = StubState(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    print(f'🐶 Stub Groq listening on http://{args.host}:{server.server_address[1]} '
+          f'(shape={args.shape}, latency={args.latency_ms:g}ms)', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    serve(build_parser().parse_args())
@@ -0,0 +1,472 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+# imagehash is optional here; without it only exact byte matches are cached
+try:
+	import imagehash
+	from PIL import Image
+	imagehash_available = True
+except Exception:
+	imagehash_available = False
+
+
+class BoundedLRU:
+	"""Thread-safe LRU map bounded by entry count and (optionally) total bytes."""
+
+	def __init__(self, max_entries: int = 1024, max_bytes: Optional[int] = None):
+		self.max_entries = max(1, int(max_entries))
+		self.max_bytes = max_bytes
+		self._data = OrderedDict()
+		self._lock = threading.Lock()
+		self.bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def __len__(self):
+		return len(self._data)
+
+	def get(self, key):
+		with self._lock:
+			entry = self._data.get(key)
+			if entry is None:
+				self.misses += 1
+				return None
+			self._data.move_to_end(key)
+			self.hits += 1
+			return entry[0]
+
+	def set(self, key, value, size: int = 0):
+		with self._lock:
+			old = self._data.pop(key, None)
+			if old is not None:
+				self.bytes -= old[1]
+			self._data[key] = (value, size)
+			self.bytes += size
+			while self._data and (len(self._data) > self.max_entries or
+								  (self.max_bytes is not None and self.bytes > self.max_bytes)):
+				_, (_, evicted_size) = self._data.popitem(last=False)
+				self.bytes -= evicted_size
+				self.evictions += 1
+
+	def pop(self, key):
+		with self._lock:
+			entry = self._data.pop(key, None)
+			if entry is None:
+				return None
+			self.bytes -= entry[1]
+			return entry[0]
+
+	def remove_if(self, predicate) -> int:
+		"""Drops every entry whose value matches `predicate`; returns the count."""
+		with self._lock:
+			doomed = [k for k, (v, _) in self._data.items() if predicate(v)]
+			for k in doomed:
+				_, size = self._data.pop(k)
+				self.bytes -= size
+			return len(doomed)
+
+	def stats(self):
+		lookups = self.hits + self.misses
+		return {
+			'entries': len(self._data),
+			'max_entries': self.max_entries,
+			'bytes': self.bytes,
+			'max_bytes': self.max_bytes,
+			'hits': self.hits,
+			'misses': self.misses,
+			'evictions': self.evictions,
+			'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+		}
+
+
+class PredictionCache:
+	"""Caches model output rows keyed by upload content.
+
+	Entries are looked up first by the sha256 of the raw bytes and, when
+	`perceptual` is on, by a pHash of the decoded model input so re-encoded
+	copies of the same photo also hit. An optional directory tier keeps
+	entries across restarts, so keys must name the model that produced the
+	row (app.py appends ServedModel.identity). When the tier passes
+	`disk_max_entries` it is pruned on a background thread, at most once
+	per `prune_interval` seconds, so it may briefly run over the limit.
+	"""
+
+	def __init__(self, max_entries: int = 2048, disk_dir: Optional[str] = None,
+				 disk_max_entries: int = 100000, perceptual: bool = False, prune_interval: float = 30.0):
+		self.memory = BoundedLRU(max_entries)
+		self.disk_dir = disk_dir
+		self.disk_max_entries = max(1, int(disk_max_entries))
+		self.perceptual = perceptual and imagehash_available
+		# request-level counters; a request may probe several keys
+		self.hits = 0
+		self.misses = 0
+		self.disk_hits = 0
+		self.disk_writes = 0
+		self.disk_evictions = 0
+		self.perceptual_hits = 0
+		# counters and the disk entry count; gunicorn workers are threaded
+		self._lock = threading.Lock()
+		self._disk_count = 0
+		self.prune_interval = prune_interval
+		self._pruning = False
+		self._next_prune = 0.0
+		if disk_dir:
+			os.makedirs(disk_dir, exist_ok=True)
+			self._disk_count = sum(1 for _, _, files in os.walk(disk_dir) for name in files if name.endswith('.json'))
+
+	@staticmethod
+	def content_key(data: bytes) -> str:
+		return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+	def perceptual_key(self, img_input) -> Optional[str]:
+		# img_input is the float32 (1, H, W, 3) model input in [0, 1]
+		if not self.perceptual:
+			return None
+		arr = np.asarray(img_input)
+		if arr.ndim == 4:
+			arr = arr[0]
+		img = Image.fromarray(np.clip(arr * 255.0, 0, 255).astype(np.uint8))
+		return 'phash:' + str(imagehash.phash(img, hash_size=16))
+
+	def _disk_path(self, key: str) -> str:
+		digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+		return os.path.join(self.disk_dir, digest[:2], digest + '.json')
+
+	def _disk_get(self, key: str):
+		p = self._disk_path(key)
+		try:
+			with open(p, 'r', encoding='utf-8') as f:
+				row = np.asarray(json.load(f)['probs'], dtype=np.float32)
+			os.utime(p, None)
+			return row
+		except Exception:
+			return None
+
+	def _disk_set(self, key: str, row):
+		p = self._disk_path(key)
+		tmp = p + '.tmp'
+		try:
+			os.makedirs(os.path.dirname(p), exist_ok=True)
+			is_new = not os.path.exists(p)
+			with open(tmp, 'w', encoding='utf-8') as f:
+				json.dump({'key': key, 'probs': [float(v) for v in row]}, f)
+			os.replace(tmp, p)
+		except Exception as e:
+			print('Failed to write prediction cache entry:', e)
+			return
+		with self._lock:
+			self.disk_writes += 1
+			if is_new:
+				self._disk_count += 1
+			prune = (self._disk_count > self.disk_max_entries and not self._pruning
+					 and time.monotonic() >= self._next_prune)
+			if prune:
+				self._pruning = True
+		if prune:
+			threading.Thread(target=self._prune_disk, name='prediction-cache-prune', daemon=True).start()
+
+	def _prune_disk(self):
+		# drop the least recently used ~10% (by mtime, refreshed on hits);
+		# .tmp files are writes in progress, or leftovers of a crash once old.
+		# The walk and unlinks run without the lock; entries written since the
+		# walk began are left alone and stay counted by _disk_set.
+		with self._lock:
+			started, started_count = time.time(), self._disk_count
+		entries, removed = [], 0
+		try:
+			stale_before = started - 3600
+			for root, _, files in os.walk(self.disk_dir):
+				for name in files:
+					fp = os.path.join(root, name)
+					try:
+						mtime = os.path.getmtime(fp)
+						if name.endswith('.json'):
+							if mtime < started:
+								entries.append((mtime, fp))
+						elif name.endswith('.tmp') and mtime < stale_before:
+							os.remove(fp)
+					except OSError:
+						continue
+			entries.sort()
+			target = int(self.disk_max_entries * 0.9)
+			for _, fp in entries[:max(0, len(entries) - target)]:
+				try:
+					os.remove(fp)
+					removed += 1
+				except OSError:
+					pass
+		finally:
+			with self._lock:
+				self.disk_evictions += removed
+				written = self._disk_count - started_count
+				self._disk_count = max(0, len(entries) - removed + written)
+				self._pruning = False
+				self._next_prune = time.monotonic() + self.prune_interval
+
+	def get(self, key: Optional[str]):
+		"""Returns (probs_row, tier) or None."""
+		if not key:
+			return None
+		row = self.memory.get(key)
+		if row is not None:
+			with self._lock:
+				if key.startswith('phash:'):
+					self.perceptual_hits += 1
+				self.hits += 1
+			return row, 'memory'
+		if self.disk_dir:
+			row = self._disk_get(key)
+			if row is not None:
+				with self._lock:
+					self.disk_hits += 1
+					self.hits += 1
+				self.memory.set(key, row, row.nbytes)
+				return row, 'disk'
+		return None
+
+	def record_miss(self):
+		with self._lock:
+			self.misses += 1
+
+	def set(self, key: Optional[str], row, perceptual_key: Optional[str] = None):
+		row = np.asarray(row, dtype=np.float32)
+		for k in (key, perceptual_key):
+			if not k:
+				continue
+			self.memory.set(k, row, row.nbytes)
+			if self.disk_dir:
+				self._disk_set(k, row)
+
+	def stats(self):
+		with self._lock:
+			hits, misses = self.hits, self.misses
+			s = {
+				'hits': hits,
+				'misses': misses,
+				'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+				'perceptual': self.perceptual,
+				'perceptual_hits': self.perceptual_hits,
+				'disk': None,
+			}
+			if self.disk_dir:
+				s['disk'] = {
+					'dir': self.disk_dir,
+					'entries': self._disk_count,
+					'max_entries': self.disk_max_entries,
+					'hits': self.disk_hits,
+					'writes': self.disk_writes,
+					'evictions': self.disk_evictions,
+					'pruning': self._pruning,
+				}
+		s['memory'] = self.memory.stats()
+		return s
+
+
+class SingleFlight:
+	"""Coalesces concurrent calls for the same key into one execution."""
+
+	class _Call:
+		__slots__ = ('done', 'result', 'error')
+
+		def __init__(self):
+			self.done = threading.Event()
+			self.result = None
+			self.error = None
+
+	def __init__(self):
+		self._calls = {}
+		self._lock = threading.Lock()
+		self.coalesced = 0
+
+	def do(self, key, fn):
+		"""Returns (result, shared) where shared is True for callers that
+		waited on another caller's execution."""
+		with self._lock:
+			call = self._calls.get(key)
+			if call is not None:
+				self.coalesced += 1
+				leader = False
+			else:
+				call = self._Call()
+				self._calls[key] = call
+				leader = True
+		if not leader:
+			call.done.wait()
+			if call.error is not None:
+				raise call.error
+			return call.result, True
+		try:
+			call.result = fn()
+		except Exception as e:
+			call.error = e
+			raise
+		finally:
+			with self._lock:
+				self._calls.pop(key, None)
+			call.done.set()
+		return call.result, False
+
+
+class SQLiteTTLStore:
+	"""Small key/value table with expiry, shared by every process using the file."""
+
+	def __init__(self, path: str, max_entries: int = 50000):
+		self.path = path
+		self.max_entries = max(1, int(max_entries))
+		self._local = threading.local()
+		self._conn().execute(
+			'CREATE TABLE IF NOT EXISTS kv_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+		)
+		self._conn().execute('CREATE INDEX IF NOT EXISTS idx_kv_cache_expires ON kv_cache(expires_at)')
+
+	def _conn(self):
+		conn = getattr(self._local, 'conn', None)
+		if conn is None:
+			conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+			conn.execute('PRAGMA journal_mode=WAL')
+			conn.execute('PRAGMA synchronous=NORMAL')
+			self._local.conn = conn
+		return conn
+
+	def get(self, key: str):
+		row = self._conn().execute(
+			'SELECT value, expires_at FROM kv_cache WHERE key = ? AND expires_at > ?', (key, time.time())
+		).fetchone()
+		return (row[0], row[1]) if row else None
+
+	def set(self, key: str, value: str, expires_at: float):
+		self._conn().execute('INSERT OR REPLACE INTO kv_cache VALUES (?, ?, ?)', (key, value, expires_at))
+
+	def sweep(self) -> int:
+		conn = self._conn()
+		removed = conn.execute('DELETE FROM kv_cache WHERE expires_at <= ?', (time.time(),)).rowcount
+		count = conn.execute('SELECT COUNT(*) FROM kv_cache').fetchone()[0]
+		if count > self.max_entries:
+			removed += conn.execute(
+				'DELETE FROM kv_cache WHERE key IN (SELECT key FROM kv_cache ORDER BY expires_at LIMIT ?)',
+				(count - self.max_entries,),
+			).rowcount
+		return removed
+
+	def count(self) -> int:
+		return self._conn().execute('SELECT COUNT(*) FROM kv_cache').fetchone()[0]
+
+
+class ChatCache:
+	"""TTL cache for chat answers: a bounded in-process LRU in front of an
+	optional SQLite file shared by all workers. Expired entries are removed by
+	a periodic sweep rather than only when they are next read."""
+
+	def __init__(self, ttl: int = 300, max_entries: int = 2048, max_bytes: Optional[int] = None,
+				 shared_path: Optional[str] = None, shared_max_entries: int = 50000,
+				 sweep_seconds: float = 60.0):
+		self.ttl = ttl
+		self.memory = BoundedLRU(max_entries, max_bytes)
+		self.shared = SQLiteTTLStore(shared_path, shared_max_entries) if shared_path else None
+		self.sweep_seconds = sweep_seconds
+		self.hits = 0
+		self.shared_hits = 0
+		self.misses = 0
+		self.expired = 0
+		# counters; gunicorn workers are threaded
+		self._lock = threading.Lock()
+		self._sweeper = None
+		self._sweeper_lock = threading.Lock()
+
+	def _ensure_sweeper(self):
+		if self.sweep_seconds <= 0 or (self._sweeper is not None and self._sweeper.is_alive()):
+			return
+		with self._sweeper_lock:
+			if self._sweeper is not None and self._sweeper.is_alive():
+				return
+			self._sweeper = threading.Thread(target=self._sweep_loop, name='chat-cache-sweeper', daemon=True)
+			self._sweeper.start()
+
+	def _sweep_loop(self):
+		while True:
+			time.sleep(self.sweep_seconds)
+			try:
+				self.sweep()
+			except Exception as e:
+				print('Chat cache sweep failed:', e)
+
+	def sweep(self) -> int:
+		now = time.time()
+		removed = self.memory.remove_if(lambda entry: entry[1] <= now)
+		with self._lock:
+			self.expired += removed
+		if self.shared is not None:
+			self.shared.sweep()
+		return removed
+
+	def get(self, key: str) -> Optional[str]:
+		self._ensure_sweeper()
+		entry = self.memory.get(key)
+		if entry is not None:
+			value, expires = entry
+			if time.time() <= expires:
+				with self._lock:
+					self.hits += 1
+				return value
+			self.memory.pop(key)
+			with self._lock:
+				self.expired += 1
+		if self.shared is not None:
+			try:
+				row = self.shared.get(key)
+			except Exception as e:
+				print('Shared chat cache read failed:', e)
+				row = None
+			if row is not None:
+				value, expires = row
+				self.memory.set(key, (value, expires), len(value.encode('utf-8')))
+				with self._lock:
+					self.hits += 1
+					self.shared_hits += 1
+				return value
+		with self._lock:
+			self.misses += 1
+		return None
+
+	def set(self, key: str, value: str, ttl: Optional[int] = None):
+		self._ensure_sweeper()
+		expires = time.time() + (self.ttl if ttl is None else ttl)
+		self.memory.set(key, (value, expires), len(value.encode('utf-8')))
+		if self.shared is not None:
+			try:
+				self.shared.set(key, value, expires)
+			except Exception as e:
+				print('Shared chat cache write failed:', e)
+
+	def stats(self):
+		with self._lock:
+			hits, shared_hits, misses, expired = self.hits, self.shared_hits, self.misses, self.expired
+		lookups = hits + misses
+		mem = self.memory.stats()
+		s = {
+			'ttl': self.ttl,
+			'hits': hits,
+			'shared_hits': shared_hits,
+			'misses': misses,
+			'hit_ratio': round(hits / lookups, 4) if lookups else None,
+			'expired': expired,
+			'entries': mem['entries'],
+			'bytes': mem['bytes'],
+			'evictions': mem['evictions'],
+			'shared': None,
+		}
+		if self.shared is not None:
+			try:
+				s['shared'] = {'path': self.shared.path, 'entries': self.shared.count()}
+			except Exception as e:
+				s['shared'] = {'path': self.shared.path, 'error': str(e)}
+		return s
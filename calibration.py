@@ -0,0 +1,108 @@
+import json
+import math
+import os
+from typing import Optional
+
+import numpy as np
+
+# Temperature scaling for the softmax output: p_i ∝ exp(log(p_i) / T).
+# T is fitted once on the validation split (train_dog_breed_model.py) and
+# stored as calibration.json next to the model; T > 1 softens overconfident
+# predictions. The argmax never changes, only the confidence values.
+CALIBRATION_FILE = 'calibration.json'
+_EPS = 1e-12
+
+
+def _scaled_log_probs(probs, temperature: float):
+	z = np.log(np.clip(np.asarray(probs, dtype=np.float64), _EPS, 1.0)) / temperature
+	z -= z.max(axis=-1, keepdims=True)
+	return z - np.log(np.exp(z).sum(axis=-1, keepdims=True))
+
+
+def apply_temperature(probs, temperature: float = 1.0):
+	"""Recalibrated probabilities for a (C,) row or an (n, C) batch."""
+	if temperature == 1.0:
+		return probs
+	return np.exp(_scaled_log_probs(probs, temperature)).astype(np.float32)
+
+
+def nll(probs, labels, temperature: float = 1.0) -> float:
+	logp = _scaled_log_probs(probs, temperature)
+	return float(-logp[np.arange(len(labels)), labels].mean())
+
+
+def fit_temperature(probs, labels, low: float = 0.05, high: float = 20.0, iters: int = 60) -> float:
+	"""Temperature minimising the negative log-likelihood of `labels`
+	(golden-section search over log T; the NLL is unimodal in T)."""
+	probs = np.asarray(probs)
+	labels = np.asarray(labels, dtype=np.int64)
+	a, b = math.log(low), math.log(high)
+	g = (math.sqrt(5) - 1) / 2
+	c, d = b - g * (b - a), a + g * (b - a)
+	fc, fd = nll(probs, labels, math.exp(c)), nll(probs, labels, math.exp(d))
+	for _ in range(iters):
+		if fc < fd:
+			b, d, fd = d, c, fc
+			c = b - g * (b - a)
+			fc = nll(probs, labels, math.exp(c))
+		else:
+			a, c, fc = c, d, fd
+			d = a + g * (b - a)
+			fd = nll(probs, labels, math.exp(d))
+	return float(math.exp((a + b) / 2))
+
+
+def expected_calibration_error(probs, labels, bins: int = 15) -> float:
+	probs = np.asarray(probs)
+	conf = probs.max(axis=1)
+	correct = probs.argmax(axis=1) == np.asarray(labels)
+	edges = np.linspace(0.0, 1.0, bins + 1)
+	ece = 0.0
+	for lo, hi in zip(edges[:-1], edges[1:]):
+		in_bin = (conf > lo) & (conf <= hi)
+		if in_bin.any():
+			ece += in_bin.mean() * abs(correct[in_bin].mean() - conf[in_bin].mean())
+	return float(ece)
+
+
+def calibration_report(probs, labels, temperature: float) -> dict:
+	return {
+		'temperature': round(temperature, 5),
+		'samples': int(len(labels)),
+		'nll_before': round(nll(probs, labels), 5),
+		'nll_after': round(nll(probs, labels, temperature), 5),
+		'ece_before': round(expected_calibration_error(probs, labels), 5),
+		'ece_after': round(expected_calibration_error(apply_temperature(probs, temperature), labels), 5),
+	}
+
+
+def save_calibration(path: str, report: dict, model_path: Optional[str] = None):
+	data = dict(report)
+	if model_path:
+		data['model'] = os.path.basename(model_path)
+	tmp = path + '.tmp'
+	with open(tmp, 'w', encoding='utf-8') as f:
+		json.dump(data, f, indent=2)
+	os.replace(tmp, path)
+
+
+def load_temperature(path: str) -> float:
+	"""Stored temperature, or 1.0 (no recalibration) when there is none."""
+	try:
+		with open(path, 'r', encoding='utf-8') as f:
+			t = float(json.load(f).get('temperature', 1.0))
+		return t if t > 0 else 1.0
+	except (OSError, ValueError, TypeError, AttributeError):
+		return 1.0
+
+
+def top_k(probs, k: int):
+	"""(indices, values) of the k largest entries per row of an (n, C)
+	batch, best first. argpartition is O(C) per row; only the k picked
+	entries are sorted."""
+	probs = np.asarray(probs)
+	k = max(1, min(int(k), probs.shape[-1]))
+	idx = np.argpartition(-probs, k - 1, axis=-1)[..., :k]
+	vals = np.take_along_axis(probs, idx, axis=-1)
+	order = np.argsort(-vals, axis=-1)
+	return np.take_along_axis(idx, order, axis=-1), np.take_along_axis(vals, order, axis=-1)
@@ -0,0 +1,396 @@
+"""Headless bulk classification.
+
+    python classify_images.py images/Images --out predictions.jsonl
+    python classify_images.py "uploads/**/*.jpg" --out predictions.csv --top-k 3
+    python classify_images.py --file-list todo.txt --out predictions.jsonl --resume
+    python classify_images.py images/Images --out eval.jsonl --report eval_report.json
+
+Images are decoded by a thread pool (cv2 releases the GIL) straight into one
+of two preallocated batch arrays, so the next batch decodes while the model
+runs on the current one and memory stays at two batches whatever the input
+size. Results are appended and flushed per batch; --resume skips paths that
+are already in the output file. When an image sits in a folder named after a
+breed, that breed is its ground truth and accuracy, top-k accuracy, a
+confusion matrix and images/sec are reported at the end.
+"""
+import os
+import csv
+import sys
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+from calibration import CALIBRATION_FILE, apply_temperature, load_temperature, top_k
+from inference_backends import BACKEND_ARTIFACTS, load_backend
+from model_registry import ModelRegistry
+from preprocess import preprocess_image
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(BASE_DIR, 'images', 'Images')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+# ---------------- INPUTS ---------------- #
+def iter_paths(inputs, file_list=None):
+    """Image paths from directories (recursive, sorted), glob patterns, single
+    files and a file list ('-' = stdin), generated lazily."""
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for f in sorted(files):
+                    if f.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(root, f)
+        elif glob.has_magic(item):
+            for path in sorted(glob.iglob(item, recursive=True)):
+                if os.path.isfile(path):
+                    yield path
+        else:
+            yield item
+    if file_list:
+        f = sys.stdin if file_list == '-' else open(file_list, 'r', encoding='utf-8')
+        try:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield line
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+def load_labels(path, data_dir=DEFAULT_DATA_DIR):
+    """Breed names in class-index order: breed_labels.json, or the sorted
+    breed folders for models trained before it was written."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            names = json.load(f)
+        if isinstance(names, list) and names:
+            return [str(n) for n in names]
+    except (OSError, ValueError):
+        pass
+    if os.path.isdir(data_dir):
+        return sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+    return []
+
+
+# ---------------- OUTPUT ---------------- #
+class ResultWriter:
+    """Appends one row per image to a .jsonl or .csv file, flushed per batch."""
+
+    def __init__(self, path, fmt, k, resume):
+        self.path = path
+        self.fmt = fmt
+        self.k = k
+        self.fields = ['path', 'truth', 'breed', 'confidence'] + \
+            [f'top{i}_{c}' for i in range(1, k + 1) for c in ('breed', 'confidence')] + \
+            ['decode_ms', 'infer_ms', 'error']
+        exists = resume and os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            _truncate_partial_line(path)
+        self._f = open(path, 'a' if exists else 'w', encoding='utf-8', newline='')
+        self._csv = None
+        if fmt == 'csv':
+            self._csv = csv.DictWriter(self._f, fieldnames=self.fields, extrasaction='ignore')
+            if not exists:
+                self._csv.writeheader()
+
+    def write(self, row):
+        if self._csv is None:
+            self._f.write(json.dumps(row) + '\n')
+            return
+        flat = dict(row)
+        for i, cand in enumerate(row.get('top_k') or [], 1):
+            flat[f'top{i}_breed'] = cand['breed']
+            flat[f'top{i}_confidence'] = cand['confidence']
+        self._csv.writerow(flat)
+
+    def flush(self):
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def _truncate_partial_line(path):
+    # an interrupted run can leave half a row at the end of the file
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        pos = end
+        while pos > 0:
+            start = max(0, pos - 65536)
+            f.seek(start)
+            chunk = f.read(pos - start)
+            if pos == end and chunk.endswith(b'\n'):
+                return
+            cut = chunk.rfind(b'\n')
+            if cut >= 0:
+                f.truncate(start + cut + 1)
+                return
+            pos = start
+        f.truncate(0)
+
+
+def read_previous(path, fmt):
+    """Rows of an earlier run: paths to skip and (truth, breed, ranked
+    breeds) for rebuilding the evaluation."""
+    done = set()
+    rows = []
+    if not os.path.exists(path):
+        return done, rows
+    # drop a torn last row first, so it is classified again rather than
+    # counted as done (ResultWriter would cut it off anyway)
+    _truncate_partial_line(path)
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            for r in csv.DictReader(f):
+                ranked = [r[k] for k in sorted(r) if k.startswith('top') and k.endswith('_breed') and r[k]]
+                done.add(r['path'])
+                rows.append((r.get('truth') or None, r.get('breed') or None, ranked))
+        else:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                except ValueError:
+                    continue
+                done.add(r['path'])
+                rows.append((r.get('truth'), r.get('breed'), [c['breed'] for c in r.get('top_k') or []]))
+    return done, rows
+
+
+# ---------------- EVALUATION ---------------- #
+class Evaluation:
+    """Accuracy and confusion matrix over images whose folder names a breed."""
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.index = {name: i for i, name in enumerate(labels)}
+        self.confusion = np.zeros((len(labels), len(labels)), dtype=np.int64)
+        self.top_k_hits = 0
+        self.failed = 0
+
+    def truth_for(self, path):
+        return os.path.basename(os.path.dirname(os.path.abspath(path))) if self.index else None
+
+    def add(self, truth, breed, ranked):
+        t = self.index.get(truth)
+        if t is None:
+            return
+        p = self.index.get(breed)
+        if p is None:
+            self.failed += 1
+            return
+        self.confusion[t, p] += 1
+        self.top_k_hits += truth in ranked
+
+    @property
+    def total(self):
+        return int(self.confusion.sum())
+
+    def report(self):
+        n = self.total
+        if not n:
+            return None
+        correct = np.diag(self.confusion)
+        support = self.confusion.sum(axis=1)
+        predicted = self.confusion.sum(axis=0)
+        per_breed = []
+        for i, name in enumerate(self.labels):
+            if support[i] or predicted[i]:
+                per_breed.append({
+                    'breed': name,
+                    'support': int(support[i]),
+                    'recall': round(float(correct[i] / support[i]), 4) if support[i] else None,
+                    'precision': round(float(correct[i] / predicted[i]), 4) if predicted[i] else None,
+                })
+        # most frequent off-diagonal cells
+        off = self.confusion.copy()
+        np.fill_diagonal(off, 0)
+        pairs = np.argwhere(off > 0)
+        pairs = sorted(pairs.tolist(), key=lambda ij: -off[ij[0], ij[1]])[:20]
+        return {
+            'images': n,
+            'unreadable': self.failed,
+            'accuracy': round(float(correct.sum() / n), 4),
+            'top_k_accuracy': round(self.top_k_hits / n, 4),
+            'per_breed': per_breed,
+            'top_confusions': [{'truth': self.labels[i], 'predicted': self.labels[j], 'count': int(off[i, j])}
+                               for i, j in pairs],
+            'confusion': {'labels': self.labels, 'matrix': self.confusion.tolist()},
+        }
+
+
+# ---------------- CLASSIFY ---------------- #
+def _decode(path, size, out):
+    t0 = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            preprocess_image(f.read(), size, out=out)
+        return None, (time.perf_counter() - t0) * 1000
+    except Exception as e:
+        return str(e) or type(e).__name__, (time.perf_counter() - t0) * 1000
+
+
+def classify(paths, backend, labels, writer, evaluation, batch_size=32, workers=None, k=3, temperature=1.0,
+             progress_every=10):
+    """Streams paths through decode and inference; returns (images, errors,
+    decode seconds, inference seconds)."""
+    h, w = backend.input_size
+    buffers = [np.empty((batch_size, h, w, 3), dtype=np.float32) for _ in range(2)]
+    paths = iter(paths)
+    images = errors = 0
+    decode_s = infer_s = 0.0
+    batches = 0
+    t_start = time.perf_counter()
+
+    def submit(pool, buffer):
+        chunk = list(islice(paths, batch_size))
+        return chunk, [pool.submit(_decode, p, (w, h), buffer[i]) for i, p in enumerate(chunk)]
+
+    with ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1)) as pool:
+        chunk, futures = submit(pool, buffers[0])
+        current = 0
+        while chunk:
+            decoded = [f.result() for f in futures]
+            # start decoding the next batch into the other buffer before inference
+            next_chunk, next_futures = submit(pool, buffers[1 - current])
+            ok = [i for i, (err, _) in enumerate(decoded) if err is None]
+            infer_ms = 0.0
+            ranked = None
+            if ok:
+                batch = buffers[current][:len(ok)] if len(ok) == len(chunk) else buffers[current][ok]
+                t0 = time.perf_counter()
+                probs = apply_temperature(backend.predict(batch), temperature)
+                infer_ms = (time.perf_counter() - t0) * 1000
+                infer_s += infer_ms / 1000
+                ranked = top_k(probs, k)
+            row_of = {i: r for r, i in enumerate(ok)}
+            for i, path in enumerate(chunk):
+                err, dec_ms = decoded[i]
+                decode_s += dec_ms / 1000
+                truth = evaluation.truth_for(path)
+                row = {'path': path, 'truth': truth if truth in evaluation.index else None,
+                       'decode_ms': round(dec_ms, 2)}
+                if err is not None:
+                    errors += 1
+                    row.update({'breed': None, 'confidence': None, 'top_k': [], 'error': err})
+                else:
+                    r = row_of[i]
+                    cands = [{'breed': labels[j] if j < len(labels) else str(j), 'confidence': round(float(v) * 100, 3)}
+                             for j, v in zip(ranked[0][r], ranked[1][r])]
+                    row.update({'breed': cands[0]['breed'], 'confidence': cands[0]['confidence'], 'top_k': cands,
+                                'infer_ms': round(infer_ms / len(ok), 3)})
+                writer.write(row)
+                evaluation.add(row['truth'], row['breed'], [c['breed'] for c in row['top_k']])
+            writer.flush()
+            images += len(chunk)
+            batches += 1
+            if progress_every and batches % progress_every == 0:
+                elapsed = time.perf_counter() - t_start
+                print(f'⚡ {images} images, {images / elapsed:.1f} img/s, {errors} errors', flush=True)
+            chunk, futures = next_chunk, next_futures
+            current = 1 - current
+    return images, errors, decode_s, infer_s
+
+
+# ---------------- MAIN ---------------- #
+def build_parser():
+    p = argparse.ArgumentParser(description='Classify images in bulk and optionally evaluate against folder labels.')
+    p.add_argument('inputs', nargs='*', help='image files, directories (recursive) or glob patterns')
+    p.add_argument('--file-list', help="file with one image path per line ('-' for stdin)")
+    p.add_argument('--out', required=True, help='results file, .jsonl or .csv')
+    p.add_argument('--format', choices=('jsonl', 'csv'), help='default: from the --out extension')
+    p.add_argument('--resume', action='store_true', help='skip paths already in --out and append')
+    p.add_argument('--backend', default=os.environ.get('INFERENCE_BACKEND', 'keras'),
+                   choices=sorted(BACKEND_ARTIFACTS) + ['remote'])
+    p.add_argument('--model', default=os.environ.get('MODEL_PATH') or None,
+                   help='model file (default: the registry version, else the backend artifact)')
+    p.add_argument('--version', help='model registry version (default: CURRENT, unless --model is given)')
+    p.add_argument('--registry-dir', default=os.environ.get('MODEL_REGISTRY_DIR', os.path.join(BASE_DIR, 'models')))
+    p.add_argument('--labels', help='breed_labels.json (default: next to the model)')
+    p.add_argument('--calibration', help='calibration.json (default: next to the model)')
+    p.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='breed folders, when there is no labels file')
+    p.add_argument('--top-k', type=int, default=3)
+    p.add_argument('--batch-size', type=int, default=32)
+    p.add_argument('--workers', type=int, default=None, help='decode threads (default: min(8, cores))')
+    p.add_argument('--threads', type=int, default=None, help='inference threads')
+    p.add_argument('--report', help='write accuracy, per-breed metrics and the confusion matrix here (JSON)')
+    return p
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not args.inputs and not args.file_list:
+        sys.exit('Nothing to classify: give image paths, directories, globs or --file-list')
+    fmt = args.format or ('csv' if args.out.lower().endswith('.csv') else 'jsonl')
+
+    print('🔄 Loading model...')
+    registry = ModelRegistry(args.registry_dir)
+    version = args.version or (None if args.model or args.backend == 'remote' else registry.current())
+    if version:
+        backend = registry.load(version, args.backend, num_threads=args.threads).backend
+        model_dir = registry.path(version)
+    else:
+        backend = load_backend(args.backend, args.model, base_dir=BASE_DIR, num_threads=args.threads)
+        # the remote backend's path is the inference server address
+        local = args.backend != 'remote' and getattr(backend, 'path', None)
+        model_dir = os.path.dirname(os.path.abspath(backend.path)) if local else BASE_DIR
+    labels = load_labels(args.labels or os.path.join(model_dir, 'breed_labels.json'), args.data_dir)
+    temperature = load_temperature(args.calibration or os.path.join(model_dir, CALIBRATION_FILE))
+    print(f'✅ {backend.name} backend, input {backend.input_size}, {len(labels)} breeds, temperature {temperature:.3f}')
+
+    evaluation = Evaluation(labels)
+    done = set()
+    if args.resume:
+        done, previous = read_previous(args.out, fmt)
+        for truth, breed, ranked in previous:
+            evaluation.add(truth, breed, ranked)
+        if done:
+            print(f'⏩ Resuming: {len(done)} images already in {args.out}')
+    paths = (p for p in iter_paths(args.inputs, args.file_list) if p not in done)
+
+    writer = ResultWriter(args.out, fmt, args.top_k, args.resume)
+    t0 = time.perf_counter()
+    try:
+        images, errors, decode_s, infer_s = classify(
+            paths, backend, labels, writer, evaluation,
+            batch_size=args.batch_size, workers=args.workers, k=args.top_k, temperature=temperature)
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - t0
+
+    summary = {
+        'images': images,
+        'errors': errors,
+        'seconds': round(elapsed, 2),
+        'images_per_sec': round(images / elapsed, 2) if elapsed else None,
+        'decode_ms_per_image': round(decode_s * 1000 / images, 2) if images else None,
+        'infer_ms_per_image': round(infer_s * 1000 / max(images - errors, 1), 3),
+        'backend': backend.name,
+        'model_version': version,
+        'batch_size': args.batch_size,
+        'top_k': args.top_k,
+        'temperature': temperature,
+    }
+    print(f'\n📊 {images} images in {elapsed:.1f}s ({summary["images_per_sec"]} img/s), {errors} unreadable')
+    result = evaluation.report()
+    if result is not None:
+        print(f'🎯 Accuracy {result["accuracy"] * 100:.2f}%, top-{args.top_k} {result["top_k_accuracy"] * 100:.2f}% '
+              f'over {result["images"]} labelled images')
+        for c in result['top_confusions'][:5]:
+            print(f'   {c["truth"]} → {c["predicted"]}: {c["count"]}')
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'evaluation': result}, f, indent=2)
+        print(f'✅ Report saved to {args.report}')
+    print(f'✅ Results in {args.out}')
+
+
+if __name__ == '__main__':
+    main()
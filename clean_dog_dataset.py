@@ -1,19 +1,26 @@
 import os
-import cv2
+import io
+import json
+import argparse
 import shutil
-import imagehash
 import numpy as np
+from multiprocessing import Pool, cpu_count
 from PIL import Image, ImageDraw
 from tqdm import tqdm
 
+from dup_index import DuplicateIndex, image_hash
+from quality_scores import ScoreStore, laplacian_sharpness
+
 # ---------------- SETTINGS ---------------- #
 dataset_path = r"C:\Users\saraswathi\Downloads\archive\images\images"
 placeholder_path = r"C:\Users\saraswathi\Downloads\archive\placeholder.jpg"
 target_size = (224, 224)
 blur_threshold = 100
 batch_size = 1000
-hashes = {}
+dup_distance = 4          # max pHash Hamming distance counted as a duplicate (0 = exact)
 log_file = "cleaning_log.txt"
+checkpoint_file = "cleaning_checkpoint.jsonl"
+scores_db = "quality_scores.db"   # sharpness scores shared with reduce_dataset_safe.py
 
 # ---------------- HELPER ---------------- #
 def create_placeholder():
@@ -26,70 +33,173 @@ def create_placeholder():
         img.save(placeholder_path)
         print(f"✅ Created at: {placeholder_path}")
 
+
+def load_checkpoint(path):
+    """Returns (processed paths, [(path, hash)] of kept images) from a previous run."""
+    processed = set()
+    kept_hashes = []
+    if not os.path.exists(path):
+        return processed, kept_hashes
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interruption
+            processed.add(entry["path"])
+            if entry.get("hash") and entry.get("verdict") in ("ok", "blurry_replaced"):
+                kept_hashes.append((entry["path"], entry["hash"]))
+    return processed, kept_hashes
+
+
+# ---------------- WORKER ---------------- #
+def analyze_image(task):
+    """Decodes one image once and derives every check from that copy.
+
+    Runs in a worker process. The resized image is written back (unless
+    dry-run, or the file is already RGB at the target size) and the perceptual
+    hash and Laplacian blur score are computed from the same in-memory pixels,
+    so the file is read and decoded exactly once. `cached_blur` is a score from
+    the shared quality table for the file as it is on disk; it is used when the
+    file is not rewritten. The last item is the score row to store, or None.
+    """
+    file_path, size, dry_run, cached_blur = task
+    try:
+        with open(file_path, "rb") as f:
+            data = f.read()
+        img = Image.open(io.BytesIO(data))
+        img.load()  # full decode: raises on corrupt or truncated files
+        unchanged = img.mode == "RGB" and img.size == tuple(size)
+        if not unchanged:
+            img = img.convert("RGB").resize(size)
+            if not dry_run:
+                img.save(file_path)
+        img_hash = format(image_hash(img, "phash"), "x")
+        if unchanged and cached_blur is not None:
+            fm = cached_blur
+        else:
+            fm = laplacian_sharpness(np.asarray(img.convert("L")))
+        record = None
+        if unchanged or not dry_run:
+            # the score describes the file now on disk
+            st = os.stat(file_path)
+            record = (file_path, st.st_mtime_ns, st.st_size, fm, size[0], size[1])
+        return file_path, img_hash, fm, None, record
+    except Exception as e:
+        return file_path, None, None, str(e), None
+
+
 # ---------------- CLEANING FUNCTION ---------------- #
-def clean_images():
-    create_placeholder()
+def clean_images(workers=None, dry_run=False, restart=False):
+    if not dry_run:
+        create_placeholder()
 
-    # Collect all image file paths recursively
+    # Collect all image file paths recursively (sorted so runs are repeatable)
     all_files = []
     for root, _, files in os.walk(dataset_path):
         for f in files:
             if f.lower().endswith(('.jpg', '.jpeg', '.png')):
                 all_files.append(os.path.join(root, f))
+    all_files.sort()
+
+    # Resume from the checkpoint unless this is a dry run or a forced restart
+    use_checkpoint = not dry_run
+    if use_checkpoint and restart and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    processed, kept_hashes = load_checkpoint(checkpoint_file) if use_checkpoint else (set(), [])
+    # BK-tree over the hashes of kept images, so near-duplicates (re-encoded,
+    # slightly cropped) are caught, not only exact hash collisions
+    dup_index = DuplicateIndex("phash")
+    for path, h in kept_hashes:
+        dup_index.add(path, int(h, 16))
+    pending = [p for p in all_files if p not in processed]
 
-    print(f"📂 Found {len(all_files)} images. Starting cleaning...")
-
-    with open(log_file, "w", encoding="utf-8") as log:
-        log.write("file_path,reason\n")
-
-        for start in range(0, len(all_files), batch_size):
-            batch = all_files[start:start + batch_size]
-            print(f"\n⚡ Processing batch {start // batch_size + 1} ({len(batch)} images)...")
-
-            for file_path in tqdm(batch, desc=f"Batch {start // batch_size + 1}", ncols=90):
-                try:
-                    # Step 1: Corruption check
-                    img = Image.open(file_path)
-                    img.verify()
-
-                    # Reload image after verify
-                    img = Image.open(file_path)
-                    img = img.convert("RGB")
-                    img = img.resize(target_size)
-                    img.save(file_path)
-
-                    # Step 2: Duplicate detection
-                    img_hash = imagehash.average_hash(img)
-                    if img_hash in hashes:
-                        shutil.copy(placeholder_path, file_path)
-                        log.write(f"{file_path},duplicate_replaced\n")
-                        continue
+    workers = workers or cpu_count()
+    mode = "DRY RUN, no files will be changed" if dry_run else "cleaning"
+    print(f"📂 Found {len(all_files)} images, {len(processed)} already done. "
+          f"Processing {len(pending)} on {workers} workers ({mode})...")
+
+    resuming = use_checkpoint and bool(processed) and os.path.exists(log_file)
+    counts = {}
+    ckpt = open(checkpoint_file, "a", encoding="utf-8") if use_checkpoint else None
+    store = ScoreStore(scores_db) if scores_db else None
+    try:
+        with open(log_file, "a" if resuming else "w", encoding="utf-8") as log, Pool(workers) as pool:
+            if not resuming:
+                log.write("file_path,reason\n")
+
+            for start in range(0, len(pending), batch_size):
+                batch = pending[start:start + batch_size]
+                print(f"\n⚡ Processing batch {start // batch_size + 1} ({len(batch)} images)...")
+                cached = store.get_many(batch) if store is not None else {}
+                tasks = [(p, target_size, dry_run, cached[p][0] if p in cached else None) for p in batch]
+                results = pool.imap(analyze_image, tasks, chunksize=16)
+                records = []
+
+                for file_path, img_hash, fm, error, record in tqdm(results, total=len(batch),
+                                                                   desc=f"Batch {start // batch_size + 1}", ncols=90):
+                    if record is not None:
+                        records.append(record)
+                    # Verdicts are decided here, in file order, so duplicate
+                    # detection sees the same "first copy" as a serial run
+                    if error is not None:
+                        verdict = f"error:{error}"
+                    elif dup_index.query(int(img_hash, 16), dup_distance, exclude=file_path):
+                        verdict = "duplicate_replaced"
                     else:
-                        hashes[img_hash] = file_path
-
-                    # Step 3: Blur detection
-                    cv_img = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
-                    if cv_img is None:
-                        shutil.copy(placeholder_path, file_path)
-                        log.write(f"{file_path},corrupted_replaced\n")
-                        continue
-
-                    fm = cv2.Laplacian(cv_img, cv2.CV_64F).var()
-                    if fm < blur_threshold:
-                        shutil.copy(placeholder_path, file_path)
-                        log.write(f"{file_path},blurry_replaced\n")
-                        continue
-
-                except Exception as e:
-                    # If anything fails, safely replace with placeholder
-                    try:
-                        shutil.copy(placeholder_path, file_path)
-                        log.write(f"{file_path},error:{str(e)}\n")
-                    except Exception:
-                        pass
-
-    print("\n✅ Cleaning complete! Check 'cleaning_log.txt' for details.")
+                        dup_index.add(file_path, int(img_hash, 16))
+                        verdict = "blurry_replaced" if fm < blur_threshold else "ok"
+
+                    if verdict != "ok":
+                        if not dry_run:
+                            try:
+                                shutil.copy(placeholder_path, file_path)
+                            except Exception:
+                                pass
+                            if record is not None:
+                                records.pop()  # the file is now the placeholder
+                        log.write(f"{file_path},{verdict}\n")
+                    kind = verdict.split(":")[0]
+                    counts[kind] = counts.get(kind, 0) + 1
+                    if ckpt is not None:
+                        ckpt.write(json.dumps({"path": file_path, "hash": img_hash, "blur": fm, "verdict": verdict}) + "\n")
+
+                # Persist progress once per batch
+                if store is not None and records:
+                    store.put_many(records)
+                log.flush()
+                if ckpt is not None:
+                    ckpt.flush()
+                    os.fsync(ckpt.fileno())
+    finally:
+        if ckpt is not None:
+            ckpt.close()
+
+    print(f"\n📊 Summary: {counts}")
+    print(f"\n✅ Cleaning complete! Check '{log_file}' for details.")
 
 # ---------------- MAIN ---------------- #
 if __name__ == "__main__":
-    clean_images()
+    parser = argparse.ArgumentParser(description="Clean the dog dataset: corrupt, duplicate and blurry images.")
+    parser.add_argument("--dataset", default=dataset_path)
+    parser.add_argument("--placeholder", default=placeholder_path)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--blur-threshold", type=float, default=blur_threshold)
+    parser.add_argument("--dup-distance", type=int, default=dup_distance,
+                        help="pHash Hamming distance treated as duplicate (0 = exact match)")
+    parser.add_argument("--log", default=log_file)
+    parser.add_argument("--checkpoint", default=checkpoint_file)
+    parser.add_argument("--scores", default=scores_db,
+                        help="quality score database shared with reduce_dataset_safe.py ('' to disable)")
+    parser.add_argument("--dry-run", action="store_true", help="only write the log; do not modify any image")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+    args = parser.parse_args()
+
+    dataset_path = args.dataset
+    placeholder_path = args.placeholder
+    blur_threshold = args.blur_threshold
+    dup_distance = args.dup_distance
+    log_file = args.log
+    checkpoint_file = args.checkpoint
+    scores_db = args.scores
+    clean_images(workers=args.workers, dry_run=args.dry_run, restart=args.restart)
@@ -0,0 +1,262 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+from multiprocessing import Pool, cpu_count
+
+import cv2
+import numpy as np
+
+# ✅ Layout of a cache directory
+#   images-<n>.u8  raw uint8 array of shape (N, H, W, 3), read with np.memmap
+#   index.json     size, class names, per-folder signatures, the name of its
+#                  images file and one [relative path, label, mtime, size]
+#                  entry per row
+# A rebuild writes a new images file next to the old one and then replaces
+# index.json in one rename, so a crash at any point leaves an index that
+# matches its images; files no index points at are removed on the next build.
+IMAGES_FILE = "images.u8"   # caches built before images files were versioned
+INDEX_FILE = "index.json"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def _list_dataset(data_dir):
+    """Returns (class_names, {breed: [(relpath, mtime, size), ...]})."""
+    class_names = sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+    folders = {}
+    for breed in class_names:
+        files = []
+        for name in sorted(os.listdir(os.path.join(data_dir, breed))):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                st = os.stat(os.path.join(data_dir, breed, name))
+                files.append((f"{breed}/{name}", st.st_mtime_ns, st.st_size))
+        folders[breed] = files
+    return class_names, folders
+
+
+def _folder_signature(files):
+    h = hashlib.sha1()
+    for rel, mtime, size in files:
+        h.update(f"{rel}|{mtime}|{size}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _decode(task):
+    path, size = task
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def load_index(cache_dir):
+    path = os.path.join(cache_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _images_path(cache_dir, index):
+    return os.path.join(cache_dir, index.get("images_file", IMAGES_FILE))
+
+
+def _cache_consistent(cache_dir, index):
+    w, h = index["size"]
+    path = _images_path(cache_dir, index)
+    expected = max(1, len(index["entries"])) * h * w * 3
+    return os.path.exists(path) and os.path.getsize(path) == expected
+
+
+def open_images(cache_dir, index=None):
+    index = index or load_index(cache_dir)
+    w, h = index["size"]
+    n = len(index["entries"])
+    if n == 0:
+        return np.zeros((0, h, w, 3), dtype=np.uint8)
+    if not _cache_consistent(cache_dir, index):
+        raise ValueError(f"Dataset cache in {cache_dir} is incomplete; rebuild it")
+    return np.memmap(_images_path(cache_dir, index), dtype=np.uint8, mode="r", shape=(n, h, w, 3))
+
+
+def _remove_unreferenced(cache_dir, images_file):
+    # images files of earlier builds and leftovers of interrupted ones
+    for name in os.listdir(cache_dir):
+        stale = (name.startswith("images") and name.endswith((".u8", ".u8.tmp")) and name != images_file) \
+            or name == INDEX_FILE + ".tmp"
+        if stale:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+
+def build_cache(data_dir, cache_dir, size=(224, 224), workers=None):
+    """Decodes and resizes every image once into `cache_dir`.
+
+    Rebuilds are incremental: rows of breed folders whose file listing
+    (name, mtime, size) is unchanged are copied from the previous cache, and
+    inside a changed folder only new or modified files are decoded again.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    class_names, folders = _list_dataset(data_dir)
+    old = load_index(cache_dir)
+    old_images = None
+    old_rows = {}
+    if old is not None and not _cache_consistent(cache_dir, old):
+        print("⚠️ Cache files are out of sync (interrupted build?); rebuilding from scratch")
+        old = None
+    if old is not None and tuple(old["size"]) == tuple(size):
+        old_images = open_images(cache_dir, old)
+        for row, (rel, _label, mtime, fsize) in enumerate(old["entries"]):
+            old_rows[rel] = (row, mtime, fsize)
+        unchanged = [b for b in class_names if old.get("folders", {}).get(b) == _folder_signature(folders[b])]
+        print(f"♻️ Reusing cache: {len(unchanged)}/{len(class_names)} breed folders unchanged")
+
+    entries = []
+    for label, breed in enumerate(class_names):
+        for rel, mtime, fsize in folders[breed]:
+            entries.append([rel, label, mtime, fsize])
+
+    images_file = f"images-{time.time_ns()}.u8"
+    tmp_path = os.path.join(cache_dir, images_file + ".tmp")
+    w, h = size
+    out = np.memmap(tmp_path, dtype=np.uint8, mode="w+", shape=(max(1, len(entries)), h, w, 3))
+    todo = []
+    reused = 0
+    for row, (rel, _label, mtime, fsize) in enumerate(entries):
+        prev = old_rows.get(rel)
+        if old_images is not None and prev is not None and prev[1:] == (mtime, fsize):
+            out[row] = old_images[prev[0]]
+            reused += 1
+        else:
+            todo.append(row)
+
+    print(f"📂 {len(entries)} images: {reused} reused, {len(todo)} to decode")
+    bad = set()
+    if todo:
+        tasks = [(os.path.join(data_dir, entries[row][0]), size) for row in todo]
+        with Pool(workers or cpu_count()) as pool:
+            for row, img in zip(todo, pool.imap(_decode, tasks, chunksize=32)):
+                if img is None:
+                    bad.add(row)
+                else:
+                    out[row] = img
+    out.flush()
+    del out
+    old_images = None
+
+    if bad:
+        # drop undecodable files by compacting the array
+        print(f"⚠️ Skipping {len(bad)} undecodable images")
+        keep = [r for r in range(len(entries)) if r not in bad]
+        src = np.memmap(tmp_path, dtype=np.uint8, mode="r+", shape=(len(entries), h, w, 3))
+        for dst_row, src_row in enumerate(keep):
+            if dst_row != src_row:
+                src[dst_row] = src[src_row]
+        src.flush()
+        del src
+        entries = [entries[r] for r in keep]
+        with open(tmp_path, "r+b") as f:
+            f.truncate(max(1, len(entries)) * h * w * 3)
+
+    os.replace(tmp_path, os.path.join(cache_dir, images_file))
+    index = {
+        "size": [w, h],
+        "data_dir": os.path.abspath(data_dir),
+        "class_names": class_names,
+        "folders": {b: _folder_signature(folders[b]) for b in class_names},
+        "images_file": images_file,
+        "entries": entries,
+    }
+    # publishing step: until this rename the old index and images stay in use
+    index_tmp = os.path.join(cache_dir, INDEX_FILE + ".tmp")
+    with open(index_tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(index_tmp, os.path.join(cache_dir, INDEX_FILE))
+    _remove_unreferenced(cache_dir, images_file)
+    print(f"✅ Dataset cache ready in {cache_dir}")
+    return index
+
+
+def split_indices(labels, validation_split=0.2, seed=123):
+    """Deterministic per-class split into (train_rows, val_rows)."""
+    rng = np.random.default_rng(seed)
+    train, val = [], []
+    labels = np.asarray(labels)
+    for label in np.unique(labels):
+        rows = np.flatnonzero(labels == label)
+        rng.shuffle(rows)
+        n_val = int(round(len(rows) * validation_split))
+        val.extend(rows[:n_val])
+        train.extend(rows[n_val:])
+    return np.array(sorted(train), dtype=np.int64), np.array(sorted(val), dtype=np.int64)
+
+
+def augmentation_layers():
+    """On-the-fly augmentation roughly matching the old ImageDataGenerator
+    settings (rotation 20°, shifts 0.1, zoom 0.2, horizontal flip)."""
+    import tensorflow as tf
+    return tf.keras.Sequential([
+        tf.keras.layers.RandomFlip("horizontal"),
+        tf.keras.layers.RandomRotation(20 / 360),
+        tf.keras.layers.RandomTranslation(0.1, 0.1),
+        tf.keras.layers.RandomZoom(0.2),
+    ], name="augmentation")
+
+
+def make_dataset(cache_dir, rows, batch_size, num_classes, augment=False, shuffle=False, seed=123):
+    """tf.data pipeline over cache rows: batched memmap reads on parallel
+    threads, scaling to [0, 1], optional augmentation, prefetching."""
+    import tensorflow as tf
+    index = load_index(cache_dir)
+    images = open_images(cache_dir, index)
+    labels = np.array([e[1] for e in index["entries"]], dtype=np.int32)
+    w, h = index["size"]
+
+    def read_batch(batch_rows):
+        order = np.sort(batch_rows)  # sequential reads are kinder to the page cache
+        return images[order], labels[order]
+
+    ds = tf.data.Dataset.from_tensor_slices(np.asarray(rows, dtype=np.int64))
+    if shuffle:
+        ds = ds.shuffle(len(rows), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+
+    def load(batch_rows):
+        x, y = tf.numpy_function(read_batch, [batch_rows], (tf.uint8, tf.int32))
+        x.set_shape((None, h, w, 3))
+        y.set_shape((None,))
+        return tf.cast(x, tf.float32) / 255.0, tf.one_hot(y, num_classes)
+
+    ds = ds.map(load, num_parallel_calls=tf.data.AUTOTUNE)
+    if augment:
+        aug = augmentation_layers()
+        ds = ds.map(lambda x, y: (aug(x, training=True), y), num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+def make_datasets(cache_dir, batch_size, validation_split=0.2, seed=123):
+    """Returns (train_ds, val_ds, class_names) from a built cache."""
+    index = load_index(cache_dir)
+    labels = [e[1] for e in index["entries"]]
+    num_classes = len(index["class_names"])
+    train_rows, val_rows = split_indices(labels, validation_split, seed)
+    train_ds = make_dataset(cache_dir, train_rows, batch_size, num_classes, augment=True, shuffle=True, seed=seed)
+    val_ds = make_dataset(cache_dir, val_rows, batch_size, num_classes)
+    print(f"📂 Cache: {len(train_rows)} training / {len(val_rows)} validation images, {num_classes} classes")
+    return train_ds, val_ds, index["class_names"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or refresh the preprocessed training image cache.")
+    parser.add_argument("--data-dir", required=True, help="folder with one sub-folder per breed")
+    parser.add_argument("--cache-dir", default="dataset_cache")
+    parser.add_argument("--size", type=int, default=224)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    build_cache(args.data_dir, args.cache_dir, (args.size, args.size), args.workers)
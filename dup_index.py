@@ -0,0 +1,274 @@
+import argparse
+import csv
+import json
+import os
+from multiprocessing import Pool, cpu_count
+from typing import Optional
+
+import numpy as np
+import imagehash
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+HASH_FUNCS = {
+	'phash': imagehash.phash,
+	'dhash': imagehash.dhash,
+	'ahash': imagehash.average_hash,
+}
+
+
+def image_hash(img, kind: str = 'phash', hash_size: int = 8) -> int:
+	"""Perceptual hash of a PIL image (or uint8/float [0, 1] RGB array) as an int."""
+	if not isinstance(img, Image.Image):
+		arr = np.asarray(img)
+		if arr.ndim == 4:
+			arr = arr[0]
+		if arr.dtype != np.uint8:
+			arr = np.clip(arr * 255.0, 0, 255).astype(np.uint8)
+		img = Image.fromarray(arr)
+	return int(str(HASH_FUNCS[kind](img, hash_size=hash_size)), 16)
+
+
+def hamming(a: int, b: int) -> int:
+	return bin(a ^ b).count('1')
+
+
+class BKTree:
+	"""Burkhard-Keller tree over integer hashes under Hamming distance.
+
+	Each node is [hash, ids, children] with children keyed by distance; a
+	radius-k search only descends into children whose edge distance lies in
+	[d - k, d + k], which prunes most of the tree for small k.
+	"""
+
+	def __init__(self):
+		self.root = None
+
+	def add(self, h: int, item_id: int):
+		if self.root is None:
+			self.root = [h, [item_id], {}]
+			return
+		node = self.root
+		while True:
+			d = hamming(h, node[0])
+			if d == 0:
+				node[1].append(item_id)
+				return
+			child = node[2].get(d)
+			if child is None:
+				node[2][d] = [h, [item_id], {}]
+				return
+			node = child
+
+	def search(self, h: int, k: int):
+		"""Returns [(item_id, distance)] for every hash within distance k."""
+		if self.root is None:
+			return []
+		out = []
+		stack = [self.root]
+		while stack:
+			node = stack.pop()
+			d = hamming(h, node[0])
+			if d <= k:
+				out.extend((i, d) for i in node[1])
+			lo, hi = d - k, d + k
+			for edge, child in node[2].items():
+				if lo <= edge <= hi:
+					stack.append(child)
+		return out
+
+
+class DuplicateIndex:
+	"""Persistent perceptual-hash index of dataset images.
+
+	Entries remember the file's mtime and size so `update_from_dir` only
+	hashes new or changed files. Replaced entries stay in the tree but are
+	masked out of results.
+	"""
+
+	def __init__(self, kind: str = 'phash', hash_size: int = 8):
+		if kind not in HASH_FUNCS:
+			raise ValueError(f'unknown hash kind {kind!r}')
+		self.kind = kind
+		self.hash_size = hash_size
+		self.paths = []
+		self.hashes = []
+		self.stats = []
+		self.alive = []
+		self.by_path = {}
+		self.tree = BKTree()
+
+	def __len__(self):
+		return len(self.by_path)
+
+	def add(self, path: str, h: int, mtime: Optional[float] = None, size: Optional[int] = None) -> int:
+		old = self.by_path.get(path)
+		if old is not None:
+			if self.hashes[old] == h:
+				self.stats[old] = (mtime, size)
+				return old
+			self.alive[old] = False
+		idx = len(self.paths)
+		self.paths.append(path)
+		self.hashes.append(h)
+		self.stats.append((mtime, size))
+		self.alive.append(True)
+		self.by_path[path] = idx
+		self.tree.add(h, idx)
+		return idx
+
+	def query(self, h: int, k: int, exclude: Optional[str] = None):
+		"""Returns [(path, distance)] within Hamming distance k, closest first."""
+		hits = [(self.paths[i], d) for i, d in self.tree.search(h, k)
+				if self.alive[i] and self.paths[i] != exclude]
+		hits.sort(key=lambda x: (x[1], x[0]))
+		return hits
+
+	def query_image(self, img, k: int, exclude: Optional[str] = None):
+		return self.query(image_hash(img, self.kind, self.hash_size), k, exclude)
+
+	def clusters(self, k: int):
+		"""Groups of paths connected by pairs within distance k (union-find)."""
+		parent = {}
+
+		def find(x):
+			while parent.get(x, x) != x:
+				parent[x] = parent.get(parent[x], parent[x])
+				x = parent[x]
+			return x
+
+		for idx, alive in enumerate(self.alive):
+			if not alive:
+				continue
+			for other, _ in self.tree.search(self.hashes[idx], k):
+				if other != idx and self.alive[other]:
+					ra, rb = find(idx), find(other)
+					if ra != rb:
+						parent[max(ra, rb)] = min(ra, rb)
+		groups = {}
+		for idx in parent:
+			groups.setdefault(find(idx), set()).add(idx)
+		return [sorted(self.paths[i] for i in members | {root}) for root, members in sorted(groups.items())]
+
+	def save(self, path: str):
+		entries = [[self.paths[i], format(self.hashes[i], 'x'), self.stats[i][0], self.stats[i][1]]
+				   for i in range(len(self.paths)) if self.alive[i]]
+		tmp = path + '.tmp'
+		with open(tmp, 'w', encoding='utf-8') as f:
+			json.dump({'kind': self.kind, 'hash_size': self.hash_size, 'entries': entries}, f)
+		os.replace(tmp, path)
+
+	@classmethod
+	def load(cls, path: str):
+		with open(path, 'r', encoding='utf-8') as f:
+			data = json.load(f)
+		index = cls(data.get('kind', 'phash'), data.get('hash_size', 8))
+		for p, h, mtime, size in data.get('entries', []):
+			index.add(p, int(h, 16), mtime, size)
+		return index
+
+	def is_current(self, path: str, mtime: float, size: int) -> bool:
+		idx = self.by_path.get(path)
+		return idx is not None and self.stats[idx] == (mtime, size)
+
+	def update_from_dir(self, root: str, workers: Optional[int] = None) -> int:
+		"""Hashes new or changed images under `root`; returns how many were added."""
+		todo = []
+		seen = set()
+		for dirpath, _, files in os.walk(root):
+			for name in files:
+				if not name.lower().endswith(IMAGE_EXTENSIONS):
+					continue
+				fp = os.path.join(dirpath, name)
+				seen.add(fp)
+				st = os.stat(fp)
+				if not self.is_current(fp, st.st_mtime, st.st_size):
+					todo.append((fp, st.st_mtime, st.st_size, self.kind, self.hash_size))
+		for p in list(self.by_path):
+			if p.startswith(root) and p not in seen:
+				self.alive[self.by_path.pop(p)] = False
+		if not todo:
+			return 0
+		with Pool(workers or cpu_count()) as pool:
+			for fp, mtime, size, h in pool.imap_unordered(_hash_file, todo, chunksize=32):
+				if h is not None:
+					self.add(fp, h, mtime, size)
+		return len(todo)
+
+
+def _hash_file(task):
+	fp, mtime, size, kind, hash_size = task
+	try:
+		with Image.open(fp) as img:
+			return fp, mtime, size, image_hash(img.convert('RGB'), kind, hash_size)
+	except Exception:
+		return fp, mtime, size, None
+
+
+def write_cluster_report(index: DuplicateIndex, k: int, out_path: str, dataset_root: str):
+	groups = index.clusters(k)
+	cross = 0
+	with open(out_path, 'w', newline='', encoding='utf-8') as f:
+		w = csv.writer(f)
+		w.writerow(['cluster_id', 'size', 'cross_breed', 'breed', 'path', 'distance_to_first'])
+		for cid, paths in enumerate(groups):
+			breeds = [os.path.basename(os.path.dirname(p)) for p in paths]
+			is_cross = len(set(breeds)) > 1
+			cross += is_cross
+			first = index.hashes[index.by_path[paths[0]]]
+			for p, breed in zip(paths, breeds):
+				d = hamming(first, index.hashes[index.by_path[p]])
+				w.writerow([cid, len(paths), int(is_cross), breed, os.path.relpath(p, dataset_root), d])
+	return len(groups), cross
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Near-duplicate index for the dog dataset.')
+	parser.add_argument('--index', default='dup_index.json')
+	sub = parser.add_subparsers(dest='cmd', required=True)
+
+	b = sub.add_parser('build', help='create or incrementally update the index')
+	b.add_argument('--dataset', default=os.path.join('images', 'Images'))
+	b.add_argument('--kind', choices=sorted(HASH_FUNCS), default='phash')
+	b.add_argument('--hash-size', type=int, default=8)
+	b.add_argument('--workers', type=int, default=None)
+
+	r = sub.add_parser('report', help='write duplicate clusters to CSV')
+	r.add_argument('--distance', type=int, default=4)
+	r.add_argument('--dataset', default=os.path.join('images', 'Images'))
+	r.add_argument('--out', default='duplicate_clusters.csv')
+
+	q = sub.add_parser('query', help='find indexed images close to the given ones')
+	q.add_argument('images', nargs='+')
+	q.add_argument('--distance', type=int, default=4)
+
+	args = parser.parse_args()
+
+	if args.cmd == 'build':
+		if os.path.exists(args.index):
+			index = DuplicateIndex.load(args.index)
+			if index.kind != args.kind or index.hash_size != args.hash_size:
+				print(f'⚠️ Existing index uses {index.kind}/{index.hash_size}; rebuilding')
+				index = DuplicateIndex(args.kind, args.hash_size)
+		else:
+			index = DuplicateIndex(args.kind, args.hash_size)
+		added = index.update_from_dir(os.path.abspath(args.dataset), args.workers)
+		index.save(args.index)
+		print(f'✅ Indexed {added} new/changed images; {len(index)} total in {args.index}')
+		return
+
+	index = DuplicateIndex.load(args.index)
+	if args.cmd == 'report':
+		n, cross = write_cluster_report(index, args.distance, args.out, os.path.abspath(args.dataset))
+		print(f'✅ {n} duplicate clusters ({cross} spanning several breeds) written to {args.out}')
+	elif args.cmd == 'query':
+		for p in args.images:
+			with Image.open(p) as img:
+				hits = index.query_image(img.convert('RGB'), args.distance)
+			print(f'{p}: {len(hits)} match(es)')
+			for path, d in hits:
+				print(f'  {d:>2}  {path}')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,373 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+from preprocess import preprocess_image
+
+# Layout of an index directory
+#   vectors-<ns>.npy  (N, D) L2-normalised embeddings (float32 or float16), memory-mapped
+#   meta.json         model signature and registry version, dtype, the vectors
+#                     and IVF file names, and one [relative path, breed] per row
+#   ivf-<ns>.npz      optional inverted file: centroids (nlist, D), row ids grouped
+#                     by list (order) and list boundaries (offsets, nlist + 1)
+# Files are written under fresh names and meta.json is replaced last, so a
+# reader sees either the old index or the new one. Indexes written before
+# the names were recorded use vectors.npy and ivf.npz.
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+EMBEDDING_LAYER = 'head_hidden'
+VECTORS_FILE = 'vectors.npy'
+META_FILE = 'meta.json'
+IVF_FILE = 'ivf.npz'
+DEFAULT_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR', 'models')
+
+
+def embedding_model(model, layer: str = EMBEDDING_LAYER):
+	"""Keras model mapping images to the 128-d hidden layer before the softmax
+	(falls back to the second-to-last layer for models without named heads)."""
+	import tensorflow as tf
+	try:
+		out = model.get_layer(layer).output
+	except ValueError:
+		out = model.layers[-2].output
+	return tf.keras.Model(model.input, out)
+
+
+def _normalise(x):
+	x = np.asarray(x, dtype=np.float32)
+	return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+def model_signature(model_path: str) -> dict:
+	st = os.stat(model_path)
+	return {'model': os.path.basename(model_path), 'mtime': st.st_mtime, 'size': st.st_size}
+
+
+def resolve_model(model_path: Optional[str], version: Optional[str], registry_dir: str):
+	"""(Keras file, registry version) the same way the server picks its model:
+	--version, else --model, else the registry's CURRENT, else dog_breed_model.h5."""
+	from model_registry import ModelRegistry
+	registry = ModelRegistry(registry_dir)
+	version = version or (None if model_path else registry.current())
+	if version:
+		if not registry.exists(version):
+			raise SystemExit(f'❌ Model version {version!r} not found in {registry_dir}')
+		return registry.artifact(version), version
+	return model_path or 'dog_breed_model.h5', None
+
+
+def _write_meta(index_dir: str, meta: dict):
+	# the single rename that publishes a new index
+	path = os.path.join(index_dir, META_FILE)
+	with open(path + '.tmp', 'w', encoding='utf-8') as f:
+		json.dump(meta, f)
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(path + '.tmp', path)
+
+
+def _remove_unreferenced(index_dir: str, meta: dict):
+	# vectors and IVF files of earlier builds, and leftovers of interrupted ones
+	keep = {meta.get('vectors_file'), meta.get('ivf_file')}
+	for name in os.listdir(index_dir):
+		stale = name.startswith(('vectors', 'ivf')) and name.endswith(('.npy', '.npz', '.tmp', '.tmp2')) \
+			and name not in keep
+		if stale:
+			try:
+				os.remove(os.path.join(index_dir, name))
+			except OSError:
+				pass
+
+
+def list_images(data_dir: str):
+	rows = []
+	for breed in sorted(os.listdir(data_dir)):
+		folder = os.path.join(data_dir, breed)
+		if not os.path.isdir(folder):
+			continue
+		for name in sorted(os.listdir(folder)):
+			if name.lower().endswith(IMAGE_EXTENSIONS):
+				rows.append([f'{breed}/{name}', breed])
+	return rows
+
+
+def extract(model_path: str, data_dir: str, out_dir: str, batch_size: int = 64, workers: Optional[int] = None,
+			dtype: str = 'float32', version: Optional[str] = None):
+	"""Embeds every dataset image into a new vectors file in out_dir (written
+	through a memmap, so memory stays at one batch) and publishes it by
+	replacing meta.json. `version`: the registry version of model_path,
+	recorded so servers can tell which model the index fits."""
+	import tensorflow as tf
+	model = tf.keras.models.load_model(model_path)
+	embed = embedding_model(model)
+	h, w = int(model.input_shape[1] or 224), int(model.input_shape[2] or 224)
+	rows = list_images(data_dir)
+	os.makedirs(out_dir, exist_ok=True)
+	vectors_file = f'vectors-{time.time_ns()}.npy'
+	tmp = os.path.join(out_dir, vectors_file + '.tmp')
+	vectors = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=(len(rows), embed.output_shape[-1]))
+	keep = np.ones(len(rows), dtype=bool)
+
+	def load(i):
+		try:
+			with open(os.path.join(data_dir, rows[i][0]), 'rb') as f:
+				return preprocess_image(f.read(), (w, h))
+		except Exception:
+			return None
+
+	t0 = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1)) as pool:
+		for start in range(0, len(rows), batch_size):
+			idx = list(range(start, min(start + batch_size, len(rows))))
+			images = list(pool.map(load, idx))
+			ok = [i for i, img in zip(idx, images) if img is not None]
+			keep[[i for i, img in zip(idx, images) if img is None]] = False
+			if ok:
+				batch = np.stack([img for img in images if img is not None])
+				vectors[ok] = _normalise(embed(batch, training=False).numpy()).astype(dtype)
+	vectors.flush()
+	elapsed = time.perf_counter() - t0
+
+	if not keep.all():
+		print(f'⚠️ Skipping {int((~keep).sum())} undecodable images')
+		compact = np.lib.format.open_memmap(tmp + '2', mode='w+', dtype=dtype, shape=(int(keep.sum()), vectors.shape[1]))
+		compact[:] = vectors[keep]
+		compact.flush()
+		del compact
+		del vectors
+		os.replace(tmp + '2', tmp)
+		rows = [r for r, k in zip(rows, keep) if k]
+	else:
+		del vectors
+	os.replace(tmp, os.path.join(out_dir, vectors_file))
+	# no IVF yet: the previous one was built for the previous vectors
+	meta = dict(model_signature(model_path), version=version, layer=EMBEDDING_LAYER, dtype=dtype,
+				vectors_file=vectors_file, ivf_file=None, rows=rows, extract_seconds=round(elapsed, 2))
+	_write_meta(out_dir, meta)
+	_remove_unreferenced(out_dir, meta)
+	print(f'✅ Embedded {len(rows)} images in {elapsed:.1f}s ({len(rows) / max(elapsed, 1e-9):.1f} img/s) into {out_dir}')
+	return meta
+
+
+def _chunked_scores(vectors, q, chunk: int = 16384):
+	# q: (m, D) float32; float16 rows are widened one chunk at a time
+	if vectors.dtype == np.float32:
+		return np.asarray(vectors) @ q.T
+	out = np.empty((len(vectors), len(q)), dtype=np.float32)
+	for start in range(0, len(vectors), chunk):
+		out[start:start + chunk] = np.asarray(vectors[start:start + chunk], dtype=np.float32) @ q.T
+	return out
+
+
+def _top(scores, k):
+	k = min(k, len(scores))
+	if k <= 0:
+		return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+	idx = np.argpartition(-scores, k - 1)[:k]
+	idx = idx[np.argsort(-scores[idx])]
+	return idx, scores[idx]
+
+
+def build_ivf(vectors, nlist: Optional[int] = None, iters: int = 15, seed: int = 0, sample: int = 50000):
+	"""Spherical k-means (cosine) coarse quantiser. Returns (centroids, order,
+	offsets): rows of list j are order[offsets[j]:offsets[j + 1]]."""
+	n = len(vectors)
+	nlist = min(n, nlist or max(1, int(round(np.sqrt(n)))))
+	rng = np.random.default_rng(seed)
+	train = np.asarray(vectors[np.sort(rng.choice(n, max(nlist, min(n, sample)), replace=False))], dtype=np.float32)
+	centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+	for _ in range(iters):
+		assign = np.argmax(train @ centroids.T, axis=1)
+		sums = np.zeros_like(centroids)
+		np.add.at(sums, assign, train)
+		counts = np.bincount(assign, minlength=nlist)
+		empty = counts == 0
+		sums[empty] = train[rng.choice(len(train), int(empty.sum()), replace=False)]  # re-seed empty lists
+		centroids = _normalise(sums)
+	assign = np.empty(n, dtype=np.int32)
+	for start in range(0, n, 16384):
+		assign[start:start + 16384] = np.argmax(_chunked_scores(vectors[start:start + 16384], centroids), axis=1)
+	order = np.argsort(assign, kind='stable').astype(np.int32)
+	offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+	return centroids, order, offsets
+
+
+class EmbeddingIndex:
+	"""Memory-mapped embedding table with exact (brute-force) and IVF search."""
+
+	def __init__(self, index_dir: str):
+		self.dir = index_dir
+		with open(os.path.join(index_dir, META_FILE), 'r', encoding='utf-8') as f:
+			self.meta = json.load(f)
+		self.rows = self.meta['rows']
+		self.vectors = np.load(os.path.join(index_dir, self.meta.get('vectors_file', VECTORS_FILE)), mmap_mode='r')
+		self.centroids = self.order = self.offsets = None
+		ivf_file = self.meta.get('ivf_file', IVF_FILE if 'vectors_file' not in self.meta else None)
+		ivf_path = os.path.join(index_dir, ivf_file) if ivf_file else None
+		if ivf_path and os.path.exists(ivf_path):
+			with np.load(ivf_path) as ivf:
+				self.centroids = ivf['centroids']
+				self.order = ivf['order']
+				self.offsets = ivf['offsets']
+
+	def __len__(self):
+		return len(self.rows)
+
+	@property
+	def dim(self) -> int:
+		return int(self.vectors.shape[1])
+
+	def matches_model(self, model_path: str, version: Optional[str] = None) -> bool:
+		# registry versions compare by name, so the check also holds for
+		# backends that serve an export of the version (tflite, onnx, remote)
+		if version and self.meta.get('version'):
+			return self.meta['version'] == version
+		try:
+			sig = model_signature(model_path)
+		except OSError:
+			return False
+		return all(self.meta.get(k) == v for k, v in sig.items())
+
+	def save_ivf(self, centroids, order, offsets):
+		ivf_file = f'ivf-{time.time_ns()}.npz'
+		tmp = os.path.join(self.dir, ivf_file + '.tmp')
+		with open(tmp, 'wb') as f:
+			np.savez(f, centroids=centroids, order=order, offsets=offsets)
+		os.replace(tmp, os.path.join(self.dir, ivf_file))
+		meta = dict(self.meta, vectors_file=self.meta.get('vectors_file', VECTORS_FILE), ivf_file=ivf_file)
+		_write_meta(self.dir, meta)
+		_remove_unreferenced(self.dir, meta)
+		self.meta = meta
+		self.centroids, self.order, self.offsets = centroids, order, offsets
+
+	def search(self, query, k: int = 5, nprobe: int = 0, exclude: Optional[int] = None):
+		"""[(row, cosine similarity)] for the k nearest rows. nprobe > 0 scans
+		only the nprobe closest IVF lists (approximate); 0 scans everything."""
+		q = _normalise(np.asarray(query, dtype=np.float32).reshape(1, -1))
+		extra = 1 if exclude is not None else 0
+		if nprobe and self.centroids is not None:
+			lists = _top((self.centroids @ q.T)[:, 0], nprobe)[0]
+			candidates = np.concatenate([self.order[self.offsets[j]:self.offsets[j + 1]] for j in lists])
+			candidates.sort()  # sequential reads from the memmap
+			scores = _chunked_scores(self.vectors[candidates], q)[:, 0]
+			idx, vals = _top(scores, k + extra)
+			idx = candidates[idx]
+		else:
+			idx, vals = _top(_chunked_scores(self.vectors, q)[:, 0], k + extra)
+		hits = [(int(i), float(v)) for i, v in zip(idx, vals) if i != exclude]
+		return hits[:k]
+
+	def describe(self, hits):
+		return [{'path': self.rows[i][0], 'breed': self.rows[i][1], 'similarity': round(s, 5)} for i, s in hits]
+
+
+def bench(index: EmbeddingIndex, k: int = 5, queries: int = 200, nprobes=(1, 4, 8, 16), seed: int = 0):
+	"""Query latency (exact vs IVF) and IVF recall@k against exact search,
+	using dataset rows as queries."""
+	rng = np.random.default_rng(seed)
+	rows = rng.choice(len(index), min(queries, len(index)), replace=False)
+	qs = np.asarray(index.vectors[np.sort(rows)], dtype=np.float32)
+
+	def run(nprobe):
+		times, results = [], []
+		for row, q in zip(np.sort(rows), qs):
+			t0 = time.perf_counter()
+			hits = index.search(q, k, nprobe, exclude=int(row))
+			times.append((time.perf_counter() - t0) * 1000.0)
+			results.append({i for i, _ in hits})
+		return times, results
+
+	report = {'rows': len(index), 'dim': index.dim, 'dtype': str(index.vectors.dtype), 'k': k, 'queries': len(rows)}
+	exact_times, exact = run(0)
+	report['exact'] = {'p50_ms': round(float(np.percentile(exact_times, 50)), 3),
+					   'p95_ms': round(float(np.percentile(exact_times, 95)), 3)}
+	if index.centroids is not None:
+		report['ivf'] = {'nlist': int(len(index.centroids))}
+		for nprobe in nprobes:
+			times, approx = run(nprobe)
+			recall = np.mean([len(a & e) / max(1, len(e)) for a, e in zip(approx, exact)])
+			report['ivf'][f'nprobe_{nprobe}'] = {
+				'p50_ms': round(float(np.percentile(times, 50)), 3),
+				'p95_ms': round(float(np.percentile(times, 95)), 3),
+				f'recall_at_{k}': round(float(recall), 4),
+			}
+	return report
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Embedding index of the dog dataset for similar-image search.')
+	parser.add_argument('--index-dir', default='embedding_index')
+	sub = parser.add_subparsers(dest='cmd', required=True)
+
+	e = sub.add_parser('extract', help='embed every dataset image with the trained model')
+	e.add_argument('--model', default=None, help='Keras model (default: the registry version, else dog_breed_model.h5)')
+	e.add_argument('--version', help='model registry version (default: CURRENT, unless --model is given)')
+	e.add_argument('--registry-dir', default=DEFAULT_REGISTRY_DIR)
+	e.add_argument('--dataset', default=os.path.join('images', 'Images'))
+	e.add_argument('--batch-size', type=int, default=64)
+	e.add_argument('--workers', type=int, default=None)
+	e.add_argument('--dtype', choices=['float32', 'float16'], default='float32')
+
+	b = sub.add_parser('build', help='build the IVF coarse quantiser')
+	b.add_argument('--nlist', type=int, default=None, help='number of lists (default: sqrt(N))')
+	b.add_argument('--iters', type=int, default=15)
+
+	m = sub.add_parser('bench', help='query latency and IVF recall; includes IVF build time')
+	m.add_argument('--k', type=int, default=5)
+	m.add_argument('--queries', type=int, default=200)
+	m.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16])
+	m.add_argument('--rebuild', action='store_true', help='time an IVF build first')
+	m.add_argument('--out', default=None)
+
+	q = sub.add_parser('query', help='nearest dataset images for the given files')
+	q.add_argument('images', nargs='+')
+	q.add_argument('--model', default=None, help='Keras model (default: the registry version, else dog_breed_model.h5)')
+	q.add_argument('--version', help='model registry version (default: CURRENT, unless --model is given)')
+	q.add_argument('--registry-dir', default=DEFAULT_REGISTRY_DIR)
+	q.add_argument('--k', type=int, default=5)
+	q.add_argument('--nprobe', type=int, default=0)
+
+	args = parser.parse_args()
+
+	if args.cmd in ('extract', 'query'):
+		args.model, version = resolve_model(args.model, args.version, args.registry_dir)
+	if args.cmd == 'extract':
+		extract(args.model, args.dataset, args.index_dir, args.batch_size, args.workers, args.dtype, version)
+		return
+
+	index = EmbeddingIndex(args.index_dir)
+	if args.cmd == 'build' or (args.cmd == 'bench' and args.rebuild):
+		t0 = time.perf_counter()
+		index.save_ivf(*build_ivf(index.vectors, getattr(args, 'nlist', None), getattr(args, 'iters', 15)))
+		build_s = time.perf_counter() - t0
+		print(f'✅ IVF with {len(index.centroids)} lists over {len(index)} vectors built in {build_s:.2f}s')
+		if args.cmd == 'build':
+			return
+	if args.cmd == 'bench':
+		report = bench(index, args.k, args.queries, args.nprobe)
+		if args.rebuild:
+			report['ivf_build_seconds'] = round(build_s, 3)
+		print(json.dumps(report, indent=2))
+		if args.out:
+			with open(args.out, 'w', encoding='utf-8') as f:
+				json.dump(report, f, indent=2)
+	elif args.cmd == 'query':
+		import tensorflow as tf
+		model = tf.keras.models.load_model(args.model)
+		embed = embedding_model(model)
+		h, w = int(model.input_shape[1] or 224), int(model.input_shape[2] or 224)
+		for path in args.images:
+			with open(path, 'rb') as f:
+				x = preprocess_image(f.read(), (w, h))[np.newaxis]
+			hits = index.search(embed(x, training=False).numpy()[0], args.k, args.nprobe)
+			print(path)
+			for hit in index.describe(hits):
+				print(f"  {hit['similarity']:.4f}  {hit['path']}")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import random
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from inference_backends import BACKEND_ARTIFACTS, load_backend
+from model_registry import ModelRegistry
+from preprocess import preprocess_image
+
+# ✅ Defaults
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODEL = os.path.join(BASE_DIR, BACKEND_ARTIFACTS['keras'])
+DEFAULT_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR', os.path.join(BASE_DIR, 'models'))
+DEFAULT_DATA_DIR = os.path.join(BASE_DIR, 'images', 'Images')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def load_image(path, size):
+    """The server's preprocessing (preprocess.preprocess_image), so the
+    calibration and evaluation samples match what the exported model is fed;
+    None for files it rejects."""
+    try:
+        with open(path, 'rb') as f:
+            return preprocess_image(f.read(), size)
+    except (OSError, ValueError):
+        return None
+
+
+def sample_dataset(data_dir, calib_samples, eval_samples, seed=0):
+    """Returns disjoint (path, label) lists for calibration and evaluation,
+    drawn evenly across breed folders (labels follow sorted folder order)."""
+    breeds = sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+    per_breed = []
+    for label, breed in enumerate(breeds):
+        folder = os.path.join(data_dir, breed)
+        files = sorted(f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+        per_breed.append([(os.path.join(folder, f), label) for f in files])
+    rng = random.Random(seed)
+    for files in per_breed:
+        rng.shuffle(files)
+    # round-robin across breeds so small samples still cover every class
+    ordered = []
+    depth = max((len(f) for f in per_breed), default=0)
+    for i in range(depth):
+        for files in per_breed:
+            if i < len(files):
+                ordered.append(files[i])
+    return ordered[:calib_samples], ordered[calib_samples:calib_samples + eval_samples]
+
+
+def export_tflite(model, out_path, quantization, calib, size):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantization == 'fp16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        def representative_dataset():
+            for path, _ in calib:
+                img = load_image(path, size)
+                if img is not None:
+                    yield [img[np.newaxis]]
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    with open(out_path, 'wb') as f:
+        f.write(converter.convert())
+
+
+def export_onnx(model, out_path, size):
+    import tf2onnx
+    spec = (tf.TensorSpec((None, size[1], size[0], 3), tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=13, output_path=out_path)
+
+
+def evaluate(backend, samples, size, reference=None, batch_size=16, warmup=3):
+    """Accuracy, agreement with a reference backend and CPU latency."""
+    images, labels = [], []
+    for path, label in samples:
+        img = load_image(path, size)
+        if img is not None:
+            images.append(img)
+            labels.append(label)
+    images = np.stack(images)
+    labels = np.asarray(labels)
+
+    for _ in range(warmup):
+        backend.predict(images[:1])
+    single_ms = []
+    for img in images[:min(len(images), 100)]:
+        t0 = time.perf_counter()
+        backend.predict(img[np.newaxis])
+        single_ms.append((time.perf_counter() - t0) * 1000.0)
+
+    preds = []
+    t0 = time.perf_counter()
+    for start in range(0, len(images), batch_size):
+        preds.append(np.asarray(backend.predict(images[start:start + batch_size])))
+    elapsed = time.perf_counter() - t0
+    preds = np.concatenate(preds)
+    top1 = preds.argmax(axis=1)
+
+    report = {
+        'backend': backend.name,
+        'path': backend.path,
+        'size_mb': round(os.path.getsize(backend.path) / (1024 * 1024), 3),
+        'samples': int(len(images)),
+        'top1_accuracy': round(float((top1 == labels).mean()), 4),
+        'latency_batch1_ms': {
+            'mean': round(float(np.mean(single_ms)), 3),
+            'p50': round(float(np.percentile(single_ms, 50)), 3),
+            'p95': round(float(np.percentile(single_ms, 95)), 3),
+        },
+        f'throughput_batch{batch_size}_img_s': round(len(images) / elapsed, 2),
+    }
+    if reference is not None:
+        report['top1_agreement'] = round(float((top1 == reference.argmax(axis=1)).mean()), 4)
+        report['max_abs_prob_diff'] = round(float(np.abs(preds - reference).max()), 5)
+    return report, preds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the trained model to optimized inference formats and compare them.')
+    parser.add_argument('--model', default=None,
+                        help=f'trained Keras .h5 model (default: the registry version, else {DEFAULT_MODEL})')
+    parser.add_argument('--version', help='model registry version (default: CURRENT, unless --model is given)')
+    parser.add_argument('--registry-dir', default=DEFAULT_REGISTRY_DIR)
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='breed folders used for calibration and evaluation')
+    parser.add_argument('--out-dir', default=None,
+                        help='where the artifacts go (default: the registry version directory, else next to the script)')
+    parser.add_argument('--formats', nargs='+', default=['tflite', 'tflite-int8'],
+                        choices=['tflite', 'tflite-int8', 'onnx'],
+                        help='tflite = float16 weights, tflite-int8 = full integer quantization')
+    parser.add_argument('--calib-samples', type=int, default=200)
+    parser.add_argument('--eval-samples', type=int, default=600)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--report', default=None, help='JSON report path (default: <out-dir>/export_report.json)')
+    args = parser.parse_args()
+
+    # ✅ Export the registry's CURRENT version into its own directory, where
+    # servers with INFERENCE_BACKEND=tflite/onnx look for the artifacts
+    registry = ModelRegistry(args.registry_dir)
+    version = args.version or (None if args.model else registry.current())
+    if version:
+        if not registry.exists(version):
+            raise SystemExit(f"❌ Model version {version!r} not found in {args.registry_dir}")
+        args.model = registry.artifact(version)
+        args.out_dir = args.out_dir or registry.path(version)
+        print(f"📦 Registry version {version}")
+    args.model = args.model or DEFAULT_MODEL
+    args.out_dir = args.out_dir or BASE_DIR
+
+    print(f"\n🔄 Loading model from {args.model}...")
+    model = tf.keras.models.load_model(args.model)
+    size = (int(model.input_shape[2]), int(model.input_shape[1]))
+
+    calib, eval_set = sample_dataset(args.data_dir, args.calib_samples, args.eval_samples)
+    print(f"📂 {len(calib)} calibration / {len(eval_set)} evaluation images")
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    artifacts = {}
+    for fmt in args.formats:
+        out_path = os.path.join(args.out_dir, BACKEND_ARTIFACTS[fmt])
+        print(f"\n⚙️ Exporting {fmt} -> {out_path}")
+        t0 = time.perf_counter()
+        try:
+            if fmt == 'onnx':
+                export_onnx(model, out_path, size)
+            else:
+                export_tflite(model, out_path, 'int8' if fmt == 'tflite-int8' else 'fp16', calib, size)
+        except Exception as e:
+            print(f"⚠️ {fmt} export failed: {e}")
+            continue
+        print(f"✅ Exported in {time.perf_counter() - t0:.1f}s")
+        artifacts[fmt] = out_path
+
+    print("\n🔍 Comparing backends...")
+    reports = []
+    keras_backend = load_backend('keras', args.model, num_threads=args.threads)
+    ref_report, reference = evaluate(keras_backend, eval_set, size, batch_size=args.batch_size)
+    reports.append(ref_report)
+    for fmt, path in artifacts.items():
+        try:
+            backend = load_backend(fmt, path, num_threads=args.threads)
+        except Exception as e:
+            print(f"⚠️ Could not load {fmt}: {e}")
+            continue
+        report, _ = evaluate(backend, eval_set, size, reference=reference, batch_size=args.batch_size)
+        reports.append(report)
+
+    print("\n============================")
+    print(f"{'backend':<12} {'size MB':>8} {'top1':>7} {'agree':>7} {'p50 ms':>8} {'img/s':>8}")
+    tp_key = f'throughput_batch{args.batch_size}_img_s'
+    for r in reports:
+        agree = r.get('top1_agreement', 1.0)
+        print(f"{r['backend']:<12} {r['size_mb']:>8.2f} {r['top1_accuracy']:>7.3f} {agree:>7.3f} "
+              f"{r['latency_batch1_ms']['p50']:>8.2f} {r[tp_key]:>8.1f}")
+    print("============================")
+
+    report_path = args.report or os.path.join(args.out_dir, 'export_report.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({'model': args.model, 'version': version, 'eval_samples': len(eval_set), 'results': reports}, f, indent=2)
+    print(f"\n📝 Report written to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import argparse
+import itertools
+
+import numpy as np
+
+from dataset_cache import load_index, open_images, split_indices, augmentation_layers
+
+# ✅ Layout of a feature store directory
+#   features_seed<k>.npy  float16 (N, 1280) pooled MobileNetV2 features for
+#                         augmentation seed k (seed 0 = un-augmented)
+#   meta.json             dataset cache signature, labels and stored seeds
+META_FILE = "meta.json"
+
+
+def _cache_signature(index):
+    return {"size": index["size"], "rows": len(index["entries"]), "folders": index["folders"]}
+
+
+def _feature_path(store_dir, seed):
+    return os.path.join(store_dir, f"features_seed{seed}.npy")
+
+
+def build_backbone(input_size, alpha=1.0):
+    import tensorflow as tf
+    w, h = input_size
+    base = tf.keras.applications.MobileNetV2(weights="imagenet", include_top=False, alpha=alpha,
+                                             input_shape=(h, w, 3), pooling="avg")
+    base.trainable = False
+    return base
+
+
+def extract_features(cache_dir, store_dir, seeds=(0,), batch_size=64, alpha=1.0):
+    """Runs the frozen backbone (MobileNetV2 with width multiplier `alpha`)
+    once per (image, augmentation seed) and stores the GlobalAveragePooling2D
+    output as float16. Seeds already stored for the same dataset cache and
+    backbone are skipped."""
+    import tensorflow as tf
+    os.makedirs(store_dir, exist_ok=True)
+    index = load_index(cache_dir)
+    images = open_images(cache_dir, index)
+    meta = load_meta(store_dir)
+    signature = _cache_signature(index)
+    if meta is None or meta.get("cache") != signature or meta.get("alpha", 1.0) != alpha:
+        meta = {"cache": signature, "alpha": alpha, "seeds": [],
+                "labels": [e[1] for e in index["entries"]],
+                "class_names": index["class_names"]}
+
+    base = None
+    for seed in seeds:
+        if seed in meta["seeds"] and os.path.exists(_feature_path(store_dir, seed)):
+            print(f"♻️ Features for seed {seed} already stored")
+            continue
+        if base is None:
+            base = build_backbone(index["size"], alpha)
+        aug = None
+        if seed:
+            tf.keras.utils.set_random_seed(seed)
+            aug = augmentation_layers()
+        out = np.lib.format.open_memmap(_feature_path(store_dir, seed) + ".tmp", mode="w+",
+                                        dtype=np.float16, shape=(len(images), base.output_shape[-1]))
+        t0 = time.perf_counter()
+        for start in range(0, len(images), batch_size):
+            x = tf.convert_to_tensor(images[start:start + batch_size], dtype=tf.float32) / 255.0
+            if aug is not None:
+                x = aug(x, training=True)
+            out[start:start + len(x)] = base(x, training=False).numpy().astype(np.float16)
+        out.flush()
+        del out
+        os.replace(_feature_path(store_dir, seed) + ".tmp", _feature_path(store_dir, seed))
+        elapsed = time.perf_counter() - t0
+        print(f"✅ Seed {seed}: {len(images)} images in {elapsed:.1f}s ({len(images) / max(elapsed, 1e-9):.1f} img/s)")
+        meta["seeds"] = sorted(set(meta["seeds"]) | {seed})
+        with open(os.path.join(store_dir, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+    return meta
+
+
+def load_meta(store_dir):
+    path = os.path.join(store_dir, META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_features(store_dir, seed):
+    return np.load(_feature_path(store_dir, seed), mmap_mode="r")
+
+
+def build_head(feature_dim, num_classes, dropout=0.3, hidden=128):
+    """Same head as train_dog_breed_model.py, on pooled features."""
+    import tensorflow as tf
+    inputs = tf.keras.Input(shape=(feature_dim,))
+    x = tf.keras.layers.Dropout(dropout)(inputs)
+    x = tf.keras.layers.Dense(hidden, activation="relu", name="head_hidden")(x)
+    outputs = tf.keras.layers.Dense(num_classes, activation="softmax", name="head_output")(x)
+    return tf.keras.Model(inputs, outputs)
+
+
+def head_datasets(store_dir, validation_split=0.2, split_seed=123):
+    """(x_train, y_train, x_val, y_val) as float32 arrays; every stored seed
+    contributes one augmented copy of the training rows, validation uses the
+    un-augmented seed 0 features when available."""
+    meta = load_meta(store_dir)
+    labels = np.asarray(meta["labels"])
+    train_rows, val_rows = split_indices(labels, validation_split, split_seed)
+    xs, ys = [], []
+    for seed in meta["seeds"]:
+        feats = load_features(store_dir, seed)
+        xs.append(np.asarray(feats[train_rows], dtype=np.float32))
+        ys.append(labels[train_rows])
+    val_seed = 0 if 0 in meta["seeds"] else meta["seeds"][0]
+    x_val = np.asarray(load_features(store_dir, val_seed)[val_rows], dtype=np.float32)
+    return np.concatenate(xs), np.concatenate(ys), x_val, labels[val_rows]
+
+
+def train_head(data, num_classes, dropout=0.3, hidden=128, lr=1e-4, epochs=5, batch_size=64, verbose=1):
+    import tensorflow as tf
+    x_train, y_train, x_val, y_val = data
+    head = build_head(x_train.shape[1], num_classes, dropout, hidden)
+    head.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=lr),
+                 loss="sparse_categorical_crossentropy",
+                 metrics=["accuracy"])
+    history = head.fit(x_train, y_train, validation_data=(x_val, y_val),
+                       epochs=epochs, batch_size=batch_size, verbose=verbose)
+    return head, history
+
+
+def copy_head_weights(head, model, hidden_layer="head_hidden", output_layer="head_output"):
+    """Loads a feature-trained head into the full model's matching layers."""
+    for name in (hidden_layer, output_layer):
+        model.get_layer(name).set_weights(head.get_layer(name).get_weights())
+
+
+def sweep(store_dir, dropouts, hiddens, lrs, epochs, batch_size=64):
+    meta = load_meta(store_dir)
+    num_classes = len(meta["class_names"])
+    data = head_datasets(store_dir)
+    results = []
+    for dropout, hidden, lr in itertools.product(dropouts, hiddens, lrs):
+        t0 = time.perf_counter()
+        _, history = train_head(data, num_classes, dropout, hidden, lr, epochs, batch_size, verbose=0)
+        val_acc = history.history["val_accuracy"]
+        results.append({
+            "dropout": dropout, "hidden": hidden, "lr": lr, "epochs": epochs,
+            "best_val_accuracy": round(float(max(val_acc)), 4),
+            "best_epoch": int(np.argmax(val_acc)) + 1,
+            "seconds": round(time.perf_counter() - t0, 2),
+        })
+        print(f"🔍 dropout={dropout} hidden={hidden} lr={lr}: val acc {max(val_acc) * 100:.2f}%")
+    results.sort(key=lambda r: r["best_val_accuracy"], reverse=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Frozen-backbone feature store for fast head training.")
+    parser.add_argument("--cache-dir", default="dataset_cache")
+    parser.add_argument("--store-dir", default="feature_store")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    e = sub.add_parser("extract", help="compute pooled features for the given augmentation seeds")
+    e.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2])
+    e.add_argument("--batch-size", type=int, default=64)
+    e.add_argument("--alpha", type=float, default=1.0, help="MobileNetV2 width multiplier")
+
+    s = sub.add_parser("sweep", help="grid-search head hyperparameters on stored features")
+    s.add_argument("--dropout", type=float, nargs="+", default=[0.2, 0.3, 0.5])
+    s.add_argument("--hidden", type=int, nargs="+", default=[64, 128, 256])
+    s.add_argument("--lr", type=float, nargs="+", default=[1e-3, 1e-4])
+    s.add_argument("--epochs", type=int, default=10)
+    s.add_argument("--out", default="head_sweep.json")
+
+    args = parser.parse_args()
+    if args.cmd == "extract":
+        extract_features(args.cache_dir, args.store_dir, args.seeds, args.batch_size, args.alpha)
+    else:
+        results = sweep(args.store_dir, args.dropout, args.hidden, args.lr, args.epochs)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        best = results[0]
+        print(f"\n🎯 Best: dropout={best['dropout']} hidden={best['hidden']} lr={best['lr']} "
+              f"-> {best['best_val_accuracy'] * 100:.2f}% (written to {args.out})")
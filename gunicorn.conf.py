@@ -0,0 +1,59 @@
+import os
+import sys
+import subprocess
+import time
+
+# Production launch: gunicorn -c gunicorn.conf.py app:app
+#
+# By default the model is served by one dedicated inference_server.py process
+# started here, and every HTTP worker uses INFERENCE_BACKEND=remote, so adding
+# workers adds request-handling cores without another copy of the model in
+# RAM. Set INFERENCE_SPAWN_SERVER=0 to run the inference server separately
+# (e.g. its own container) or to load a small model in every worker.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', str(min(4, os.cpu_count() or 1))))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+# app.py sizes the Groq admission limit (GROQ_MAX_CALLERS) from this
+os.environ['GUNICORN_THREADS'] = str(threads)
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+# workers import app.py themselves: TensorFlow state does not survive fork()
+preload_app = False
+
+SPAWN_SERVER = os.environ.get('INFERENCE_SPAWN_SERVER', '1') != '0'
+if SPAWN_SERVER:
+	# the inference server loads the configured model; workers talk to it
+	os.environ.setdefault('INFERENCE_SERVER_BACKEND', os.environ.get('INFERENCE_BACKEND', 'keras'))
+	if os.environ['INFERENCE_SERVER_BACKEND'] == 'remote':
+		os.environ['INFERENCE_SERVER_BACKEND'] = 'keras'
+	os.environ['INFERENCE_BACKEND'] = 'remote'
+	# batching happens once, across all workers, in the inference server
+	os.environ.setdefault('PREDICT_BATCH_MAX_WAIT_MS', '0')
+
+_inference_process = None
+
+
+def on_starting(server):
+	global _inference_process
+	if not SPAWN_SERVER:
+		return
+	_inference_process = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, 'inference_server.py')],
+										  cwd=BASE_DIR, env=os.environ.copy())
+	server.log.info('Started inference server (pid %s, backend %s)',
+					_inference_process.pid, os.environ['INFERENCE_SERVER_BACKEND'])
+
+
+def on_exit(server):
+	if _inference_process is None or _inference_process.poll() is not None:
+		return
+	_inference_process.terminate()
+	deadline = time.monotonic() + 15
+	while _inference_process.poll() is None and time.monotonic() < deadline:
+		time.sleep(0.1)
+	if _inference_process.poll() is None:
+		_inference_process.kill()
+	server.log.info('Stopped inference server')
@@ -0,0 +1,259 @@
+import os
+import time
+import threading
+from multiprocessing.connection import Client
+from typing import Optional
+
+import numpy as np
+
+from inference_batcher import QueueFullError
+from model_manager import ModelNotReady
+
+# Each backend exposes predict(batch) -> probs for a float32 (n, H, W, 3)
+# batch in [0, 1], plus `name`, `path` and `input_size` (H, W).
+# 'remote' is not an artifact: it forwards batches to inference_server.py.
+
+BACKEND_ARTIFACTS = {
+	'keras': 'dog_breed_model.h5',
+	'tflite': 'dog_breed_model_fp16.tflite',
+	'tflite-int8': 'dog_breed_model_int8.tflite',
+	'onnx': 'dog_breed_model.onnx',
+}
+
+
+REMOTE_BACKEND = 'remote'
+# where inference_server.py listens: a UNIX socket path or host:port
+INFERENCE_ADDRESS = os.environ.get('INFERENCE_ADDRESS', '/tmp/dog-breed-inference.sock')
+INFERENCE_AUTHKEY = os.environ.get('INFERENCE_AUTHKEY', 'dog-breed-inference').encode('utf-8')
+
+
+def parse_address(address: str):
+	"""'host:port' -> (host, port) for TCP; anything else is a UNIX socket path."""
+	host, sep, port = address.rpartition(':')
+	if sep and port.isdigit() and '/' not in address:
+		return host or '127.0.0.1', int(port)
+	return address
+
+
+def _configure_tf_threads(tf, num_threads: Optional[int], inter_op_threads: Optional[int] = None):
+	try:
+		if num_threads:
+			tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+		if inter_op_threads:
+			tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+	except RuntimeError:
+		# already initialised; TF only accepts this before the first op runs
+		pass
+
+
+class KerasBackend:
+	name = 'keras'
+
+	def __init__(self, path: str, num_threads: Optional[int] = None, inter_op_threads: Optional[int] = None):
+		import tensorflow as tf
+		_configure_tf_threads(tf, num_threads, inter_op_threads)
+		self.path = path
+		self.model = tf.keras.models.load_model(path)
+		shape = self.model.input_shape
+		self.input_size = (int(shape[1] or 224), int(shape[2] or 224))
+		self._embedder = None
+
+	def predict(self, batch):
+		# calling the model directly skips the per-call setup done by predict()
+		return self.model(batch, training=False).numpy()
+
+	def embed(self, batch):
+		# hidden-layer embeddings used by /similar (see embedding_index.py);
+		# only this backend exposes them, exported models end at the softmax
+		if self._embedder is None:
+			from embedding_index import embedding_model
+			self._embedder = embedding_model(self.model)
+		return self._embedder(batch, training=False).numpy()
+
+
+class TFLiteBackend:
+	name = 'tflite'
+
+	def __init__(self, path: str, num_threads: Optional[int] = None):
+		try:
+			from tflite_runtime.interpreter import Interpreter
+		except Exception:
+			import tensorflow as tf
+			Interpreter = tf.lite.Interpreter
+		self.path = path
+		self.interpreter = Interpreter(model_path=path, num_threads=num_threads)
+		self.interpreter.allocate_tensors()
+		self._input = self.interpreter.get_input_details()[0]
+		self._output = self.interpreter.get_output_details()[0]
+		self._batch = int(self._input['shape'][0])
+		self.input_size = (int(self._input['shape'][1]), int(self._input['shape'][2]))
+		# the interpreter is not re-entrant
+		self._lock = threading.Lock()
+
+	def predict(self, batch):
+		batch = np.asarray(batch, dtype=np.float32)
+		with self._lock:
+			if len(batch) != self._batch:
+				self.interpreter.resize_tensor_input(self._input['index'], [len(batch), *self._input['shape'][1:]])
+				self.interpreter.allocate_tensors()
+				self._input = self.interpreter.get_input_details()[0]
+				self._output = self.interpreter.get_output_details()[0]
+				self._batch = len(batch)
+			in_dtype = self._input['dtype']
+			if in_dtype != np.float32:
+				scale, zero_point = self._input['quantization']
+				batch = np.round(batch / scale + zero_point).astype(in_dtype)
+			self.interpreter.set_tensor(self._input['index'], batch)
+			self.interpreter.invoke()
+			out = self.interpreter.get_tensor(self._output['index'])
+			if self._output['dtype'] != np.float32:
+				scale, zero_point = self._output['quantization']
+				out = (out.astype(np.float32) - zero_point) * scale
+			return np.array(out, dtype=np.float32)
+
+
+class ONNXBackend:
+	name = 'onnx'
+
+	def __init__(self, path: str, num_threads: Optional[int] = None, inter_op_threads: Optional[int] = None):
+		import onnxruntime as ort
+		opts = ort.SessionOptions()
+		if num_threads:
+			opts.intra_op_num_threads = num_threads
+		if inter_op_threads:
+			opts.inter_op_num_threads = inter_op_threads
+		self.path = path
+		self.session = ort.InferenceSession(path, sess_options=opts, providers=['CPUExecutionProvider'])
+		inp = self.session.get_inputs()[0]
+		self._input_name = inp.name
+		h, w = inp.shape[1], inp.shape[2]
+		self.input_size = (int(h) if isinstance(h, int) else 224, int(w) if isinstance(w, int) else 224)
+
+	def predict(self, batch):
+		return self.session.run(None, {self._input_name: np.asarray(batch, dtype=np.float32)})[0]
+
+
+class RemoteBackend:
+	"""Client of inference_server.py: the model lives in that one process and
+	every HTTP worker sends it batches over a local socket, so the model's
+	memory is not duplicated per worker.
+
+	Each calling thread gets its own connection (a connection carries one
+	request at a time); the server batches across connections. The server
+	can swap its model at any time, so `server_version` and `input_size`
+	are updated from every reply rather than fixed at connect time.
+	"""
+	name = REMOTE_BACKEND
+
+	def __init__(self, address: str = INFERENCE_ADDRESS, authkey: bytes = INFERENCE_AUTHKEY,
+				 connect_timeout: float = 300.0):
+		self.path = address
+		self._address = parse_address(address)
+		self._authkey = authkey
+		self._local = threading.local()
+		# wait for the server to come up and finish loading its model
+		deadline = time.monotonic() + connect_timeout
+		while True:
+			try:
+				info = self._call(('info',))
+				if info['ready']:
+					break
+				if info['state'] == 'failed':
+					raise RuntimeError(f"inference server failed to load its model: {info.get('error')}")
+			except (OSError, EOFError):
+				self._drop()
+			if time.monotonic() > deadline:
+				raise TimeoutError(f'inference server at {address} not ready after {connect_timeout:.0f}s')
+			time.sleep(0.5)
+		self.server_backend = info['backend']
+		self._apply(info)
+
+	def _apply(self, model):
+		# registry version live in the server (None for a plain model file)
+		self.server_version = model.get('version')
+		self.input_size = tuple(model['input_size'])
+
+	def _conn(self):
+		conn = getattr(self._local, 'conn', None)
+		if conn is None:
+			conn = Client(self._address, authkey=self._authkey)
+			self._local.conn = conn
+		return conn
+
+	def _drop(self):
+		conn = getattr(self._local, 'conn', None)
+		self._local.conn = None
+		if conn is not None:
+			try:
+				conn.close()
+			except OSError:
+				pass
+
+	def _call(self, message, payload=None):
+		conn = self._conn()
+		conn.send(message)
+		if payload is not None:
+			conn.send_bytes(payload)
+		reply = conn.recv()
+		if reply[0] == 'error':
+			_, kind, detail = reply
+			if kind == 'QueueFullError':
+				raise QueueFullError(detail)
+			if kind == 'ModelNotReady':
+				raise ModelNotReady(detail)
+			raise RuntimeError(f'inference server: {detail}')
+		if reply[0] == 'array':
+			_, shape, dtype, model = reply
+			out = np.frombuffer(conn.recv_bytes(), dtype=dtype).reshape(shape)
+			self._apply(model)
+			return out
+		return reply[1]
+
+	def predict(self, batch):
+		batch = np.ascontiguousarray(batch, dtype=np.float32)
+		message = ('predict', batch.shape, batch.dtype.str)
+		try:
+			return self._call(message, memoryview(batch).cast('B'))
+		except (OSError, EOFError):
+			# the server restarted or the connection went stale: retry once
+			self._drop()
+			return self._call(message, memoryview(batch).cast('B'))
+
+	def refresh(self) -> dict:
+		"""Asks the server what it is serving now and returns its status."""
+		try:
+			info = self._call(('info',))
+		except (OSError, EOFError):
+			self._drop()
+			info = self._call(('info',))
+		self._apply(info)
+		return info
+
+	def reload(self, version: Optional[str] = None) -> dict:
+		"""Has the server load `version` (None: its configured model) and swap
+		it in once warm; returns {'reloading': bool, 'model': status}."""
+		return self._call(('reload', version))
+
+	def stats(self):
+		return self._call(('stats',))
+
+
+def load_backend(kind: str, path: Optional[str] = None, base_dir: str = '.', num_threads: Optional[int] = None,
+				 inter_op_threads: Optional[int] = None):
+	kind = (kind or 'keras').lower()
+	if kind == REMOTE_BACKEND:
+		return RemoteBackend(path or INFERENCE_ADDRESS)
+	if kind not in BACKEND_ARTIFACTS:
+		raise ValueError(f'Unknown inference backend {kind!r}; expected one of {sorted(BACKEND_ARTIFACTS) + [REMOTE_BACKEND]}')
+	if not path:
+		path = os.path.join(base_dir, BACKEND_ARTIFACTS[kind])
+	if not os.path.exists(path):
+		raise FileNotFoundError(f'Model artifact not found: {path}')
+	if kind == 'keras':
+		backend = KerasBackend(path, num_threads, inter_op_threads)
+	elif kind in ('tflite', 'tflite-int8'):
+		backend = TFLiteBackend(path, num_threads)
+	else:
+		backend = ONNXBackend(path, num_threads, inter_op_threads)
+	backend.name = kind
+	return backend
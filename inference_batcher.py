@@ -0,0 +1,176 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional
+
+import numpy as np
+
+from latency import LatencyWindow
+
+
+class QueueFullError(RuntimeError):
+	pass
+
+
+class _Item:
+	__slots__ = ('x', 'future', 'enqueued', 'target')
+
+	def __init__(self, x, future, enqueued, target=None):
+		self.x = x
+		self.future = future
+		self.enqueued = enqueued
+		self.target = target
+
+
+class InferenceBatcher:
+	"""Collects inputs from concurrent callers and runs them as one batch.
+
+	`predict_fn` receives a stacked array of shape (n, ...) and must return an
+	array whose first dimension is n. Each submitted input may itself hold
+	several rows; callers get back exactly the rows they submitted.
+
+	An input may name a `target` (any object with predict(batch)) to run on
+	instead of `predict_fn`; inputs are only batched with inputs for the same
+	target, so a model swapped in mid-flight never shares a batch with the
+	one it replaced.
+	"""
+
+	def __init__(self, predict_fn, max_batch_size: int = 16, max_wait_ms: float = 5.0,
+				 max_queue: int = 256, name: str = 'predict'):
+		self.predict_fn = predict_fn
+		self.max_batch_size = max(1, int(max_batch_size))
+		self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+		self.name = name
+		self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+		self._thread = None
+		self._start_lock = threading.Lock()
+		self._stop = threading.Event()
+		# first input of the next batch, when it was for a different target
+		self._carry = None
+		# statistics
+		self._stats_lock = threading.Lock()
+		self.batches = 0
+		self.items = 0
+		self.rows = 0
+		self.errors = 0
+		self.rejected = 0
+		self.batch_sizes = {}
+		self.request_latency = LatencyWindow()
+		self.queue_wait = LatencyWindow()
+		self.compute_latency = LatencyWindow()
+
+	def start(self):
+		with self._start_lock:
+			if self._thread is not None and self._thread.is_alive():
+				return
+			self._stop.clear()
+			self._thread = threading.Thread(target=self._run, name=f'{self.name}-batcher', daemon=True)
+			self._thread.start()
+
+	def stop(self, timeout: float = 5.0):
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join(timeout)
+
+	def submit(self, x, target=None) -> Future:
+		if self._thread is None or not self._thread.is_alive():
+			self.start()
+		x = np.asarray(x)
+		if x.ndim == 0:
+			raise ValueError('batcher input must have a leading batch dimension')
+		fut = Future()
+		try:
+			self._queue.put_nowait(_Item(x, fut, time.perf_counter(), target))
+		except queue.Full:
+			with self._stats_lock:
+				self.rejected += 1
+			raise QueueFullError(f'{self.name} queue is full')
+		return fut
+
+	def predict(self, x, timeout: Optional[float] = None, target=None):
+		t0 = time.perf_counter()
+		out = self.submit(x, target).result(timeout=timeout)
+		self.request_latency.add((time.perf_counter() - t0) * 1000.0)
+		return out
+
+	def _collect(self, first):
+		batch = [first]
+		rows = len(first.x)
+		deadline = time.perf_counter() + self.max_wait
+		while rows < self.max_batch_size:
+			remaining = deadline - time.perf_counter()
+			try:
+				if remaining <= 0:
+					item = self._queue.get_nowait()
+				else:
+					item = self._queue.get(timeout=remaining)
+			except queue.Empty:
+				break
+			if item.target is not first.target:
+				self._carry = item
+				break
+			batch.append(item)
+			rows += len(item.x)
+		return batch, rows
+
+	def _run(self):
+		while not self._stop.is_set():
+			first, self._carry = self._carry, None
+			if first is None:
+				try:
+					first = self._queue.get(timeout=0.5)
+				except queue.Empty:
+					continue
+			batch, rows = self._collect(first)
+			started = time.perf_counter()
+			for item in batch:
+				self.queue_wait.add((started - item.enqueued) * 1000.0)
+			try:
+				if len(batch) == 1:
+					stacked = batch[0].x
+				else:
+					stacked = np.concatenate([item.x for item in batch], axis=0)
+				predict_fn = self.predict_fn if first.target is None else first.target.predict
+				out = np.asarray(predict_fn(stacked))
+				if len(out) != rows:
+					raise RuntimeError(f'predict_fn returned {len(out)} rows for a batch of {rows}')
+			except Exception as e:
+				with self._stats_lock:
+					self.errors += 1
+				for item in batch:
+					item.future.set_exception(e)
+				continue
+			self.compute_latency.add((time.perf_counter() - started) * 1000.0)
+			offset = 0
+			for item in batch:
+				n = len(item.x)
+				item.future.set_result(out[offset:offset + n])
+				offset += n
+			with self._stats_lock:
+				self.batches += 1
+				self.items += len(batch)
+				self.rows += rows
+				self.batch_sizes[rows] = self.batch_sizes.get(rows, 0) + 1
+
+	def stats(self):
+		with self._stats_lock:
+			batches = self.batches
+			rows = self.rows
+			s = {
+				'max_batch_size': self.max_batch_size,
+				'max_wait_ms': self.max_wait * 1000.0,
+				'queue_depth': self._queue.qsize(),
+				'batches': batches,
+				'requests': self.items,
+				'rows': rows,
+				'errors': self.errors,
+				'rejected': self.rejected,
+				'batch_size_histogram': {str(k): v for k, v in sorted(self.batch_sizes.items())},
+			}
+		s['mean_batch_size'] = round(rows / batches, 3) if batches else None
+		s['mean_batch_fill'] = round(rows / (batches * self.max_batch_size), 3) if batches else None
+		s['request_latency_ms'] = self.request_latency.summary()
+		s['queue_wait_ms'] = self.queue_wait.summary()
+		s['compute_ms'] = self.compute_latency.summary()
+		return s
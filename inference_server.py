@@ -0,0 +1,204 @@
+import os
+import signal
+import threading
+import time
+from multiprocessing.connection import Listener
+
+import numpy as np
+
+from inference_backends import INFERENCE_ADDRESS, INFERENCE_AUTHKEY, load_backend, parse_address
+from inference_batcher import InferenceBatcher
+from model_manager import ModelManager
+from model_registry import ModelRegistry
+
+# Dedicated inference process for multi-worker serving (see gunicorn.conf.py):
+# the model is loaded once here, HTTP workers use INFERENCE_BACKEND=remote and
+# send batches over INFERENCE_ADDRESS, and requests from all workers are
+# micro-batched together.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _env_int(name, default):
+	return int(os.environ.get(name, str(default)) or default)
+
+
+class InferenceServer:
+	"""Serves one backend to any number of local clients.
+
+	Protocol (multiprocessing.connection, one request in flight per
+	connection): ('info',) and ('stats',) return ('ok', dict);
+	('reload', version) loads that registry version (None: the configured
+	model) next to the live one and returns ('ok', {'reloading': bool,
+	'model': info}); ('predict', shape, dtype) followed by the raw array
+	bytes returns ('array', shape, dtype, model) followed by the
+	probabilities, where model holds the live version and input_size;
+	failures return ('error', exception class name, message).
+
+	`loader` takes a registry version (or None) and returns what the
+	manager's loader returns; without it 'reload' is refused.
+	"""
+
+	def __init__(self, manager: ModelManager, address=INFERENCE_ADDRESS, authkey: bytes = INFERENCE_AUTHKEY,
+				 max_batch_size: int = 32, max_wait_ms: float = 5.0, max_queue: int = 512,
+				 predict_timeout: float = 30.0, loader=None):
+		self.manager = manager
+		self.loader = loader
+		self.address = address
+		self.authkey = authkey
+		self.predict_timeout = predict_timeout
+		self.batcher = InferenceBatcher(
+			manager.predict,
+			max_batch_size=max_batch_size,
+			max_wait_ms=max_wait_ms,
+			max_queue=max_queue,
+			name='inference-server',
+		)
+		self.connections = 0
+		self._conn_lock = threading.Lock()
+		self._listener = None
+		self._closing = threading.Event()
+
+	def _model(self):
+		# read on every reply, so clients follow a reload without reconnecting
+		served = self.manager.served
+		if served is None:
+			return {'version': None, 'input_size': [224, 224]}
+		return {'version': served.version, 'input_size': list(served.input_size)}
+
+	def _info(self):
+		status = self.manager.status()
+		status.update(self._model())
+		return status
+
+	def _reload(self, version):
+		if self.loader is None:
+			raise ValueError('this inference server cannot reload its model')
+		reloading = self.manager.reload(lambda: self.loader(version))
+		return {'reloading': reloading, 'model': self._info()}
+
+	def _handle(self, conn):
+		with self._conn_lock:
+			self.connections += 1
+		try:
+			while not self._closing.is_set():
+				try:
+					message = conn.recv()
+				except (EOFError, OSError):
+					return
+				op = message[0]
+				try:
+					if op == 'predict':
+						_, shape, dtype = message
+						x = np.frombuffer(conn.recv_bytes(), dtype=dtype).reshape(shape)
+						probs = np.ascontiguousarray(self.batcher.predict(x, timeout=self.predict_timeout),
+													 dtype=np.float32)
+						conn.send(('array', probs.shape, probs.dtype.str, self._model()))
+						conn.send_bytes(memoryview(probs).cast('B'))
+					elif op == 'info':
+						conn.send(('ok', self._info()))
+					elif op == 'reload':
+						conn.send(('ok', self._reload(message[1] if len(message) > 1 else None)))
+					elif op == 'stats':
+						stats = self.batcher.stats()
+						stats['connections'] = self.connections
+						conn.send(('ok', stats))
+					else:
+						conn.send(('error', 'ValueError', f'unknown operation {op!r}'))
+				except (EOFError, OSError):
+					return
+				except Exception as e:
+					detail = getattr(e, 'state', None) or str(e)
+					conn.send(('error', type(e).__name__, detail))
+		finally:
+			with self._conn_lock:
+				self.connections -= 1
+			conn.close()
+
+	def serve_forever(self):
+		address = parse_address(self.address)
+		if isinstance(address, str) and os.path.exists(address):
+			os.unlink(address)  # stale socket from a previous run
+		self._listener = Listener(address, authkey=self.authkey)
+		print(f'Inference server listening on {self.address}')
+		self.batcher.start()
+		try:
+			while not self._closing.is_set():
+				try:
+					conn = self._listener.accept()
+				except Exception:
+					# closed by close(), or a client failed authentication
+					if self._closing.is_set():
+						break
+					continue
+				threading.Thread(target=self._handle, args=(conn,), name='inference-conn', daemon=True).start()
+		finally:
+			self.batcher.stop()
+			if isinstance(address, str) and os.path.exists(address):
+				os.unlink(address)
+
+	def close(self):
+		self._closing.set()
+		if self._listener is not None:
+			self._listener.close()
+
+
+def _watch_registry(manager: ModelManager, registry: ModelRegistry, loader, seconds: float):
+	# same policy as app.py's watcher: reload when CURRENT moves, and retry a
+	# busy reload (or the first load) on the next poll
+	seen = registry.current()
+	while True:
+		time.sleep(seconds)
+		current = registry.current()
+		if not current or current == seen:
+			continue
+		live = getattr(manager.served, 'version', None)
+		if current == live:
+			seen = current
+		elif manager.reload(lambda version=current: loader(version)):
+			print(f'Model registry: CURRENT is now {current}, reloading')
+			seen = current
+
+
+def main():
+	kind = os.environ.get('INFERENCE_SERVER_BACKEND', 'keras')
+	intra = _env_int('INFERENCE_INTRA_OP_THREADS', _env_int('INFERENCE_THREADS', 0)) or None
+	inter = _env_int('INFERENCE_INTER_OP_THREADS', 0) or None
+	model_path = os.environ.get('MODEL_PATH') or None
+	registry = ModelRegistry(os.environ.get('MODEL_REGISTRY_DIR', os.path.join(BASE_DIR, 'models')))
+
+	pinned = os.environ.get('MODEL_VERSION') or None
+	watch_seconds = float(os.environ.get('MODEL_WATCH_SECONDS', '10'))
+
+	def loader(version=None):
+		# same precedence as app.py: an explicit version (reload), then
+		# MODEL_VERSION, then MODEL_PATH, then CURRENT
+		version = version or pinned or (None if model_path else registry.current())
+		if version:
+			return registry.load(version, kind, num_threads=intra, inter_op_threads=inter)
+		return load_backend(kind, model_path, base_dir=BASE_DIR, num_threads=intra, inter_op_threads=inter)
+
+	manager = ModelManager(loader, warmup_batch=_env_int('INFERENCE_MAX_BATCH_SIZE', 32))
+	# accept connections straight away; clients wait for 'ready' in 'info'
+	manager.start_background()
+	server = InferenceServer(
+		manager,
+		address=INFERENCE_ADDRESS,
+		max_batch_size=_env_int('INFERENCE_MAX_BATCH_SIZE', 32),
+		max_wait_ms=float(os.environ.get('INFERENCE_MAX_WAIT_MS', '5')),
+		max_queue=_env_int('INFERENCE_QUEUE_MAX', 512),
+		predict_timeout=float(os.environ.get('PREDICT_TIMEOUT', '30')),
+		loader=loader,
+	)
+	# the HTTP workers follow this process's model, so CURRENT is watched here
+	if watch_seconds > 0 and not (pinned or model_path):
+		threading.Thread(target=_watch_registry, args=(manager, registry, loader, watch_seconds),
+						 name='model-registry-watch', daemon=True).start()
+	signal.signal(signal.SIGTERM, lambda *_: server.close())
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		server.close()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,36 @@
+import threading
+from collections import deque
+
+
+class LatencyWindow:
+	"""Thread-safe rolling window of latency samples (milliseconds)."""
+
+	def __init__(self, size: int = 2048):
+		self._samples = deque(maxlen=size)
+		self._lock = threading.Lock()
+		self.count = 0
+		self.total_ms = 0.0
+
+	def add(self, ms: float):
+		with self._lock:
+			self._samples.append(ms)
+			self.count += 1
+			self.total_ms += ms
+
+	def percentiles(self, qs=(50, 95, 99)):
+		with self._lock:
+			values = sorted(self._samples)
+		if not values:
+			return {f'p{q}': None for q in qs}
+		out = {}
+		last = len(values) - 1
+		for q in qs:
+			idx = min(last, int(round(q / 100.0 * last)))
+			out[f'p{q}'] = round(values[idx], 3)
+		return out
+
+	def summary(self):
+		s = {'count': self.count}
+		s['mean_ms'] = round(self.total_ms / self.count, 3) if self.count else None
+		s.update(self.percentiles())
+		return s
@@ -0,0 +1,293 @@
+import os
+import sys
+import time
+import threading
+from bisect import bisect_left
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from typing import Optional
+
+# Minimal Prometheus-style metrics: counters, histograms and scrape-time
+# gauges kept in plain dicts keyed by label values, rendered in the text
+# exposition format. Recording is a dict lookup and an add under a lock.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(9))  # 1 KiB .. 64 MiB
+
+
+def _escape(value) -> str:
+	return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra: str = '') -> str:
+	parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+	if extra:
+		parts.append(extra)
+	return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value) -> str:
+	if value == float('inf'):
+		return '+Inf'
+	return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+	def __init__(self, name: str, help_text: str, labelnames=()):
+		self.name = name
+		self.help = help_text
+		self.labelnames = tuple(labelnames)
+		self._values = {}
+		self._lock = threading.Lock()
+
+	def inc(self, *labels, amount: float = 1):
+		with self._lock:
+			self._values[labels] = self._values.get(labels, 0) + amount
+
+	def render(self):
+		yield f'# HELP {self.name} {self.help}'
+		yield f'# TYPE {self.name} counter'
+		with self._lock:
+			items = sorted(self._values.items())
+		for labels, value in items:
+			yield f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}'
+
+
+class Histogram:
+	def __init__(self, name: str, help_text: str, labelnames=(), buckets=LATENCY_BUCKETS):
+		self.name = name
+		self.help = help_text
+		self.labelnames = tuple(labelnames)
+		self.buckets = tuple(sorted(buckets))
+		# labels -> [per-bucket counts (last = +Inf), sum, count]
+		self._series = {}
+		self._lock = threading.Lock()
+
+	def observe(self, value: float, *labels):
+		i = bisect_left(self.buckets, value)
+		with self._lock:
+			series = self._series.get(labels)
+			if series is None:
+				series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+			series[0][i] += 1
+			series[1] += value
+			series[2] += 1
+
+	def render(self):
+		yield f'# HELP {self.name} {self.help}'
+		yield f'# TYPE {self.name} histogram'
+		with self._lock:
+			items = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self._series.items())
+		for labels, (counts, total, count) in items:
+			cumulative = 0
+			for bound, n in zip(self.buckets + (float('inf'),), counts):
+				cumulative += n
+				le = 'le="' + _number(bound) + '"'
+				yield f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}'
+			yield f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}'
+			yield f'{self.name}_count{_labels(self.labelnames, labels)} {count}'
+
+
+class GaugeCallback:
+	"""Gauge read at scrape time: `fn` returns a number, or an iterable of
+	(label values tuple, number); None values are skipped."""
+
+	def __init__(self, name: str, help_text: str, fn, labelnames=()):
+		self.name = name
+		self.help = help_text
+		self.labelnames = tuple(labelnames)
+		self.fn = fn
+
+	def render(self):
+		try:
+			value = self.fn()
+		except Exception:
+			return
+		yield f'# HELP {self.name} {self.help}'
+		yield f'# TYPE {self.name} gauge'
+		rows = [((), value)] if isinstance(value, (int, float)) or value is None else value
+		for labels, v in rows:
+			if v is not None:
+				yield f'{self.name}{_labels(self.labelnames, labels)} {_number(v)}'
+
+
+class Registry:
+	def __init__(self):
+		self._metrics = []
+
+	def _add(self, metric):
+		self._metrics.append(metric)
+		return metric
+
+	def counter(self, name, help_text, labelnames=()):
+		return self._add(Counter(name, help_text, labelnames))
+
+	def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+		return self._add(Histogram(name, help_text, labelnames, buckets))
+
+	def gauge_callback(self, name, help_text, fn, labelnames=()):
+		return self._add(GaugeCallback(name, help_text, fn, labelnames))
+
+	def render(self) -> str:
+		lines = []
+		for metric in self._metrics:
+			lines.extend(metric.render())
+		return '\n'.join(lines) + '\n'
+
+
+class SlowRequestProfiler:
+	"""Opt-in sampling profiler for tail latency.
+
+	A daemon thread samples the Python stacks of in-flight request threads
+	every `interval_ms` via sys._current_frames(). When a request takes
+	longer than `threshold_ms`, its samples are written to `out_dir` as
+	collapsed stacks (one 'frame;frame;... count' line per stack, the input
+	format of flamegraph.pl and speedscope). Only registered threads are
+	walked, so idle cost is one dict copy per interval.
+	"""
+
+	def __init__(self, threshold_ms: float, out_dir: str, interval_ms: float = 5.0, max_files: int = 200):
+		self.threshold = threshold_ms / 1000.0
+		self.out_dir = out_dir
+		self.interval = max(0.001, interval_ms / 1000.0)
+		self.max_files = max_files
+		self.written = 0
+		self._active = {}
+		self._lock = threading.Lock()
+		self._thread = None
+
+	def _ensure_thread(self):
+		if self._thread is None or not self._thread.is_alive():
+			self._thread = threading.Thread(target=self._run, name='slow-request-profiler', daemon=True)
+			self._thread.start()
+
+	def _run(self):
+		while True:
+			time.sleep(self.interval)
+			with self._lock:
+				active = dict(self._active)
+			if not active:
+				continue
+			frames = sys._current_frames()
+			for ident, tally in active.items():
+				frame = frames.get(ident)
+				if frame is None:
+					continue
+				stack = []
+				while frame is not None:
+					code = frame.f_code
+					stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+					frame = frame.f_back
+				tally[';'.join(reversed(stack))] += 1
+
+	def begin(self):
+		self._ensure_thread()
+		with self._lock:
+			self._active[threading.get_ident()] = _Tally()
+
+	def end(self, route: str, seconds: float) -> Optional[str]:
+		with self._lock:
+			tally = self._active.pop(threading.get_ident(), None)
+		if tally is None or seconds < self.threshold or not tally or self.written >= self.max_files:
+			return None
+		os.makedirs(self.out_dir, exist_ok=True)
+		safe_route = route.strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'root'
+		path = os.path.join(self.out_dir, f'{time.strftime("%Y%m%d-%H%M%S")}_{safe_route}_{int(seconds * 1000)}ms.folded')
+		with open(path, 'w', encoding='utf-8') as f:
+			for stack, n in tally.most_common():
+				f.write(f'{stack} {n}\n')
+		self.written += 1
+		return path
+
+
+class FlaskMetrics:
+	"""Per-route request metrics for a Flask app plus named stage timers.
+
+	Route labels use the URL rule ('/orders', not '/orders?limit=5') so the
+	label set stays bounded. For streamed responses the recorded duration
+	ends when the response starts, not when the stream finishes.
+	"""
+
+	def __init__(self, registry: Optional[Registry] = None, profiler: Optional[SlowRequestProfiler] = None):
+		self.registry = registry or Registry()
+		self.profiler = profiler
+		r = self.registry
+		self.requests = r.counter('app_http_requests_total', 'HTTP requests by route, method and status.',
+								  ('route', 'method', 'status'))
+		self.latency = r.histogram('app_http_request_duration_seconds', 'Time to produce the response.',
+								   ('route', 'method'))
+		self.request_bytes = r.histogram('app_http_request_size_bytes', 'Request body size.', ('route',), SIZE_BUCKETS)
+		self.response_bytes = r.histogram('app_http_response_size_bytes', 'Response body size (non-streamed).',
+										  ('route',), SIZE_BUCKETS)
+		self.errors = r.counter('app_http_errors_total',
+								'Error responses by kind (client = 4xx, server = 5xx, exception = unhandled).',
+								('route', 'kind'))
+		self.stages = r.histogram('app_stage_duration_seconds', 'Time spent in named stages of a request.',
+								  ('route', 'stage'))
+		self.in_flight = 0
+		self._in_flight_lock = threading.Lock()
+		r.gauge_callback('app_http_requests_in_flight', 'Requests currently being handled.', lambda: self.in_flight)
+
+	def init_app(self, app):
+		from flask import g, request
+
+		def route():
+			rule = request.url_rule
+			return rule.rule if rule is not None else 'unmatched'
+
+		@app.before_request
+		def _metrics_start():
+			g._metrics_start = time.perf_counter()
+			with self._in_flight_lock:
+				self.in_flight += 1
+			if self.profiler is not None:
+				self.profiler.begin()
+
+		@app.after_request
+		def _metrics_finish(response):
+			start = g.pop('_metrics_start', None)
+			if start is None:
+				return response
+			seconds = time.perf_counter() - start
+			with self._in_flight_lock:
+				self.in_flight -= 1
+			name = route()
+			self.requests.inc(name, request.method, str(response.status_code))
+			self.latency.observe(seconds, name, request.method)
+			if request.content_length:
+				self.request_bytes.observe(request.content_length, name)
+			if not response.is_streamed and response.content_length is not None:
+				self.response_bytes.observe(response.content_length, name)
+			if response.status_code >= 500:
+				self.errors.inc(name, 'server')
+			elif response.status_code >= 400:
+				self.errors.inc(name, 'client')
+			if self.profiler is not None:
+				path = self.profiler.end(name, seconds)
+				if path is not None:
+					response.headers['X-Profile'] = os.path.basename(path)
+			return response
+
+		@app.teardown_request
+		def _metrics_teardown(exc):
+			if exc is not None:
+				self.errors.inc(route(), 'exception')
+			if g.pop('_metrics_start', None) is not None:
+				# after_request did not run
+				with self._in_flight_lock:
+					self.in_flight -= 1
+				if self.profiler is not None:
+					self.profiler.end(route(), 0.0)
+
+	def observe_stage(self, stage: str, seconds: float):
+		from flask import request
+		rule = request.url_rule
+		self.stages.observe(seconds, rule.rule if rule is not None else 'unmatched', stage)
+
+	@contextmanager
+	def stage(self, stage: str):
+		t0 = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.observe_stage(stage, time.perf_counter() - t0)
@@ -0,0 +1,346 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+from latency import LatencyWindow
+
+
+class ModelNotReady(RuntimeError):
+	def __init__(self, state: str):
+		super().__init__(f'model is {state}')
+		self.state = state
+
+
+class ServedModel:
+	"""One model version as served: the backend together with the class
+	labels and calibration temperature that belong to it. Swapped as a unit,
+	so a request that picked up a ServedModel labels its outputs with the
+	names of the model that produced them."""
+
+	def __init__(self, backend, labels=None, temperature: float = 1.0, version: Optional[str] = None,
+				 metadata: Optional[dict] = None):
+		self.backend = backend
+		self.labels = list(labels or [])
+		self.temperature = temperature
+		self.version = version
+		self.metadata = metadata or {}
+		self._identity = None
+
+	@property
+	def identity(self) -> str:
+		"""Names the model for caches that outlive it: the version, else the
+		model file's name, size and mtime, so a retrained file is told apart."""
+		if self.version:
+			return self.version
+		if self._identity is None:
+			path = getattr(self.backend, 'path', None)
+			try:
+				st = os.stat(path)
+				self._identity = f'{os.path.basename(path)}:{st.st_size}:{int(st.st_mtime)}'
+			except (OSError, TypeError):
+				# e.g. the remote backend's socket address
+				self._identity = f"{getattr(self.backend, 'name', 'model')}:{path}"
+		return self._identity
+
+	@property
+	def input_size(self):
+		"""(H, W) the model expects: metadata.json's input_size when the
+		version has one, else what the backend reports."""
+		size = self.metadata.get('input_size')
+		if size:
+			return (int(size[0]), int(size[1]))
+		return tuple(getattr(self.backend, 'input_size', (224, 224)))
+
+	def label(self, idx: int) -> str:
+		if 0 <= idx < len(self.labels):
+			return self.labels[idx]
+		return str(idx)
+
+	def predict(self, batch):
+		return self.backend.predict(batch)
+
+	def describe(self):
+		return {
+			'version': self.version,
+			'backend': getattr(self.backend, 'name', None),
+			'path': getattr(self.backend, 'path', None),
+			'classes': len(self.labels),
+			'temperature': self.temperature,
+			'input_size': list(self.input_size),
+		}
+
+
+class ModelManager:
+	"""Owns the served model and its load/warm-up lifecycle.
+
+	`loader` is a zero-argument callable returning a backend (see
+	inference_backends) or a ServedModel. Loading can run inline or on a
+	background thread so the HTTP server accepts connections while the model
+	is still warming. reload() loads and warms a replacement next to the live
+	model and swaps it in; callers that already hold the old ServedModel
+	finish on it, and its memory is released once the last of them is done.
+	"""
+
+	def __init__(self, loader, warmup_batch: int = 1):
+		self._loader = loader
+		self.warmup_batch = max(1, int(warmup_batch))
+		self.served = None
+		self.state = 'idle'
+		self.error = None
+		self.started_at = None
+		self.load_seconds = None
+		self.warmup_seconds = None
+		self.reload_state = 'idle'
+		self.reload_error = None
+		self.swaps = 0
+		self.swapped_at = None
+		self._ready = threading.Event()
+		self._done = threading.Event()
+		self._lock = threading.Lock()
+		self._thread = None
+
+	@property
+	def backend(self):
+		served = self.served
+		return served.backend if served is not None else None
+
+	@staticmethod
+	def _as_served(loaded) -> ServedModel:
+		return loaded if isinstance(loaded, ServedModel) else ServedModel(loaded)
+
+	def _warm(self, served: ServedModel) -> float:
+		t0 = time.perf_counter()
+		h, w = served.input_size
+		backend_size = tuple(getattr(served.backend, 'input_size', (h, w)))
+		if backend_size != (h, w):
+			raise ValueError(f'metadata input size {(h, w)} does not match the model input {backend_size}')
+		out = served.predict(np.zeros((self.warmup_batch, h, w, 3), dtype=np.float32))
+		if served.labels and np.shape(out)[-1] != len(served.labels):
+			raise ValueError(f'model has {np.shape(out)[-1]} outputs but {len(served.labels)} labels')
+		return round(time.perf_counter() - t0, 3)
+
+	def _load(self):
+		self.started_at = time.time()
+		t0 = time.perf_counter()
+		try:
+			self.state = 'loading'
+			served = self._as_served(self._loader())
+			self.load_seconds = round(time.perf_counter() - t0, 3)
+			self.state = 'warming'
+			self.warmup_seconds = self._warm(served)
+			self.served = served
+			self.state = 'ready'
+			self._ready.set()
+			print(f'Model ready: loaded in {self.load_seconds}s, warmed in {self.warmup_seconds}s')
+		except Exception as e:
+			self.error = str(e)
+			self.state = 'failed'
+			print('Failed to load model:', e)
+		finally:
+			self._done.set()
+
+	def load(self):
+		with self._lock:
+			if self.state != 'idle':
+				return
+			self.state = 'loading'
+		self._load()
+
+	def start_background(self):
+		with self._lock:
+			if self.state != 'idle':
+				return
+			self.state = 'loading'
+			self._thread = threading.Thread(target=self._load, name='model-loader', daemon=True)
+			self._thread.start()
+
+	def reload(self, loader=None, wait: bool = False) -> bool:
+		"""Loads `loader` (default: the original loader) in the background and
+		swaps it in once warm. The live model keeps serving meanwhile and
+		stays in place if the new one fails. Returns False when a load or
+		reload is already running."""
+		with self._lock:
+			if self.state in ('loading', 'warming') or self.reload_state in ('loading', 'warming'):
+				return False
+			self.reload_state = 'loading'
+			self.reload_error = None
+		thread = threading.Thread(target=self._reload, args=(loader or self._loader,), name='model-reloader',
+								  daemon=True)
+		thread.start()
+		if wait:
+			thread.join()
+		return True
+
+	def _reload(self, loader):
+		t0 = time.perf_counter()
+		try:
+			served = self._as_served(loader())
+			self.reload_state = 'warming'
+			warmup_seconds = self._warm(served)
+			with self._lock:
+				previous = self.served
+				self.served = served
+				self.swaps += 1
+				self.swapped_at = time.time()
+				self.load_seconds = round(time.perf_counter() - t0 - warmup_seconds, 3)
+				self.warmup_seconds = warmup_seconds
+				self.reload_state = 'idle'
+				if not self._ready.is_set():
+					# the first load failed; the reloaded model recovers the server
+					self.state = 'ready'
+					self.error = None
+					self._ready.set()
+			old = getattr(previous, 'version', None)
+			print(f'Model swapped: {old} -> {served.version} (loaded and warmed in {time.perf_counter() - t0:.1f}s)')
+		except Exception as e:
+			self.reload_error = str(e)
+			self.reload_state = 'failed'
+			print('Failed to reload model:', e)
+
+	@property
+	def ready(self) -> bool:
+		return self._ready.is_set()
+
+	def wait_ready(self, timeout: Optional[float] = None) -> bool:
+		if timeout:
+			self._done.wait(timeout)
+		return self.ready
+
+	def get_served(self, timeout: Optional[float] = None) -> ServedModel:
+		"""Returns the live ServedModel or raises ModelNotReady. Hold on to the
+		result for the whole request: reload() may swap in another one."""
+		if not self.wait_ready(timeout):
+			raise ModelNotReady(self.state)
+		return self.served
+
+	def get_backend(self, timeout: Optional[float] = None):
+		"""Returns the ready backend or raises ModelNotReady."""
+		return self.get_served(timeout).backend
+
+	def predict(self, batch):
+		return self.get_served().predict(batch)
+
+	def status(self):
+		served = self.served
+		backend = served.backend if served is not None else None
+		return {
+			'state': self.state,
+			'ready': self.ready,
+			'version': getattr(served, 'version', None),
+			'backend': getattr(backend, 'name', None),
+			'path': getattr(backend, 'path', None),
+			'load_seconds': self.load_seconds,
+			'warmup_seconds': self.warmup_seconds,
+			'error': self.error,
+			'reload_state': self.reload_state,
+			'reload_error': self.reload_error,
+			'swaps': self.swaps,
+		}
+
+
+class ShadowEvaluator:
+	"""Runs a candidate model on a sampled share of live traffic.
+
+	offer() is called after the live prediction; with probability
+	`sample_rate` the same input is queued for the candidate on a single
+	background thread, so the request never waits for it. At most
+	`max_pending` inputs are queued, the rest are dropped. Answers are
+	compared by breed name, so the two versions may order their classes
+	differently. The candidate gets the uploaded bytes and preprocesses them
+	at its own input size, which may differ from the live model's.
+	"""
+
+	def __init__(self, manager: ModelManager, sample_rate: float, max_pending: int = 8, k: int = 5,
+				 preprocess=None):
+		self.manager = manager
+		# preprocess(data, (W, H)) -> (H, W, 3) float32; default preprocess.preprocess_image
+		self.preprocess = preprocess
+		self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+		self.max_pending = max(1, int(max_pending))
+		self.k = k
+		self.pending = 0
+		self.offered = 0
+		self.samples = 0
+		self.agreements = 0
+		self.overlap_total = 0.0
+		self.dropped = 0
+		self.errors = 0
+		self.live_latency = LatencyWindow()
+		self.shadow_latency = LatencyWindow()
+		self._lock = threading.Lock()
+		self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow')
+
+	def _top_names(self, served: ServedModel, probs):
+		k = min(self.k, len(probs))
+		return [served.label(int(i)) for i in np.argsort(-np.asarray(probs))[:k]]
+
+	def offer(self, data: bytes, live_probs, live: ServedModel, live_ms: float, x=None) -> bool:
+		# data: the uploaded image; live_probs: the live model's raw output row;
+		# x: the live model's (1, H, W, 3) input, reused when the sizes agree
+		if not self.manager.ready or random.random() >= self.sample_rate:
+			return False
+		with self._lock:
+			self.offered += 1
+			if self.pending >= self.max_pending:
+				self.dropped += 1
+				return False
+			self.pending += 1
+		self._executor.submit(self._run, data, x, self._top_names(live, live_probs), live_ms)
+		return True
+
+	def _input(self, served: ServedModel, data: bytes, x):
+		h, w = served.input_size
+		if x is not None and tuple(np.shape(x)[1:3]) == (h, w):
+			return x
+		preprocess = self.preprocess
+		if preprocess is None:
+			from preprocess import preprocess_image as preprocess
+		return preprocess(data, (w, h))[np.newaxis]
+
+	def _run(self, data, x, live_top, live_ms):
+		try:
+			served = self.manager.get_served()
+			x = self._input(served, data, x)
+			t0 = time.perf_counter()
+			probs = np.asarray(served.predict(x))[0]
+			shadow_ms = (time.perf_counter() - t0) * 1000.0
+			shadow_top = self._top_names(served, probs)
+			with self._lock:
+				self.samples += 1
+				self.agreements += int(shadow_top[0] == live_top[0])
+				self.overlap_total += len(set(shadow_top) & set(live_top)) / max(1, len(live_top))
+			self.live_latency.add(live_ms)
+			self.shadow_latency.add(shadow_ms)
+		except Exception:
+			with self._lock:
+				self.errors += 1
+		finally:
+			with self._lock:
+				self.pending -= 1
+
+	def stats(self):
+		with self._lock:
+			samples = self.samples
+			s = {
+				'model': self.manager.status(),
+				'sample_rate': self.sample_rate,
+				'offered': self.offered,
+				'samples': samples,
+				'pending': self.pending,
+				'dropped': self.dropped,
+				'errors': self.errors,
+				'top1_agreement': round(self.agreements / samples, 4) if samples else None,
+				f'top{self.k}_overlap': round(self.overlap_total / samples, 4) if samples else None,
+			}
+		# live: time in the micro-batcher (queueing included); shadow: one unbatched call
+		s['live_model_ms'] = self.live_latency.summary()
+		s['shadow_model_ms'] = self.shadow_latency.summary()
+		return s
+
+	def close(self):
+		self._executor.shutdown(wait=False)
@@ -0,0 +1,117 @@
+import json
+import os
+import time
+from typing import Optional
+
+from calibration import CALIBRATION_FILE, load_temperature
+from inference_backends import BACKEND_ARTIFACTS, load_backend
+from model_manager import ServedModel
+
+# Versioned models, written by train_dog_breed_model.py:
+#
+#   models/
+#     CURRENT                 name of the version servers load by default
+#     20260301-142500/
+#       dog_breed_model.h5    plus any export_model.py artifacts
+#       breed_labels.json     class names in output order
+#       calibration.json      softmax temperature
+#       metadata.json         written last; a version without it is incomplete
+#
+# CURRENT is replaced atomically, so a server polling it (MODEL_WATCH_SECONDS
+# in app.py) only ever sees a complete version.
+CURRENT_FILE = 'CURRENT'
+METADATA_FILE = 'metadata.json'
+LABELS_FILE = 'breed_labels.json'
+
+
+def new_version_name() -> str:
+	return time.strftime('%Y%m%d-%H%M%S')
+
+
+def _write_atomic(path: str, text: str):
+	tmp = path + '.tmp'
+	with open(tmp, 'w', encoding='utf-8') as f:
+		f.write(text)
+	os.replace(tmp, path)
+
+
+class ModelRegistry:
+	def __init__(self, root: str):
+		self.root = root
+
+	def path(self, version: str) -> str:
+		if not version or version.startswith('.') or os.sep in version or (os.altsep and os.altsep in version):
+			raise ValueError(f'invalid model version {version!r}')
+		return os.path.join(self.root, version)
+
+	def exists(self, version: str) -> bool:
+		try:
+			return os.path.isfile(os.path.join(self.path(version), METADATA_FILE))
+		except ValueError:
+			return False
+
+	def versions(self):
+		"""Complete versions, oldest first (names sort by creation time)."""
+		if not os.path.isdir(self.root):
+			return []
+		return sorted(v for v in os.listdir(self.root) if not v.startswith('.') and self.exists(v))
+
+	def current(self) -> Optional[str]:
+		try:
+			with open(os.path.join(self.root, CURRENT_FILE), 'r', encoding='utf-8') as f:
+				version = f.read().strip()
+		except OSError:
+			return None
+		return version if self.exists(version) else None
+
+	def set_current(self, version: str):
+		if not self.exists(version):
+			raise ValueError(f'model version {version!r} not found in {self.root}')
+		_write_atomic(os.path.join(self.root, CURRENT_FILE), version + '\n')
+
+	def metadata(self, version: str) -> dict:
+		with open(os.path.join(self.path(version), METADATA_FILE), 'r', encoding='utf-8') as f:
+			return json.load(f)
+
+	def write_metadata(self, version: str, metadata: dict):
+		# last step of publishing a version; see the layout above
+		data = dict(metadata, version=version)
+		_write_atomic(os.path.join(self.path(version), METADATA_FILE), json.dumps(data, indent=2))
+
+	def artifact(self, version: str, kind: str = 'keras') -> str:
+		return os.path.join(self.path(version), os.path.basename(BACKEND_ARTIFACTS[kind]))
+
+	def describe(self):
+		current = self.current()
+		versions = []
+		for v in self.versions():
+			try:
+				meta = self.metadata(v)
+			except (OSError, ValueError):
+				meta = {}
+			versions.append({
+				'version': v,
+				'current': v == current,
+				'created_at': meta.get('created_at'),
+				'val_accuracy': meta.get('val_accuracy'),
+				'backends': [k for k in BACKEND_ARTIFACTS if os.path.exists(self.artifact(v, k))],
+			})
+		return {'root': self.root, 'current': current, 'versions': versions}
+
+	def load(self, version: str, kind: str = 'keras', num_threads: Optional[int] = None,
+			 inter_op_threads: Optional[int] = None) -> ServedModel:
+		"""Backend, labels and temperature of one version."""
+		if not self.exists(version):
+			raise ValueError(f'model version {version!r} not found in {self.root}')
+		backend = load_backend(kind, self.artifact(version, kind), num_threads=num_threads,
+							   inter_op_threads=inter_op_threads)
+		return self.wrap(version, backend)
+
+	def wrap(self, version: str, backend) -> ServedModel:
+		"""`backend` with the labels and temperature stored for `version`
+		(used for the remote backend, whose model lives in the inference server)."""
+		directory = self.path(version)
+		with open(os.path.join(directory, LABELS_FILE), 'r', encoding='utf-8') as f:
+			labels = [str(n) for n in json.load(f)]
+		temperature = load_temperature(os.path.join(directory, CALIBRATION_FILE))
+		return ServedModel(backend, labels, temperature, version=version, metadata=self.metadata(version))
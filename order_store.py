@@ -0,0 +1,216 @@
+import base64
+import json
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+	id TEXT PRIMARY KEY,
+	user_email TEXT,
+	status TEXT,
+	payment_method TEXT,
+	total REAL,
+	created_at INTEGER NOT NULL,
+	data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_user_email ON orders(user_email, created_at);
+CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_orders_payment_method ON orders(payment_method, created_at, id);
+CREATE TABLE IF NOT EXISTS meta (
+	key TEXT PRIMARY KEY,
+	value TEXT
+);
+"""
+
+
+class OrderStore:
+	"""Orders persisted in SQLite (WAL mode).
+
+	Each insert is a single-row transaction, so creating an order costs the
+	same regardless of history size, and concurrent writers from several
+	processes are serialised by SQLite instead of overwriting each other.
+	"""
+
+	def __init__(self, db_path: str, legacy_json_path: Optional[str] = None):
+		self.db_path = db_path
+		self._local = threading.local()
+		conn = self._conn()
+		conn.executescript(_SCHEMA)
+		if legacy_json_path:
+			self.migrate_json(legacy_json_path)
+
+	def _conn(self):
+		conn = getattr(self._local, 'conn', None)
+		if conn is None:
+			conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+			conn.row_factory = sqlite3.Row
+			conn.execute('PRAGMA journal_mode=WAL')
+			conn.execute('PRAGMA synchronous=NORMAL')
+			conn.execute('PRAGMA busy_timeout=30000')
+			self._local.conn = conn
+		return conn
+
+	@staticmethod
+	def _row_values(order):
+		user = order.get('user') or {}
+		email = user.get('email')
+		return (
+			str(order['id']),
+			email.strip().lower() if isinstance(email, str) and email.strip() else None,
+			order.get('status'),
+			order.get('payment_method'),
+			float(order.get('total') or 0.0),
+			int(order.get('created_at') or 0),
+			json.dumps(order, ensure_ascii=False),
+		)
+
+	def migrate_json(self, path: str) -> int:
+		"""One-shot import of the legacy orders.json; the file is left in place.
+
+		A file that cannot be read or parsed is renamed to ``<path>.corrupt``
+		so a bad legacy file neither blocks startup nor is retried each time.
+		"""
+		conn = self._conn()
+		conn.execute('BEGIN IMMEDIATE')
+		try:
+			done = conn.execute("SELECT value FROM meta WHERE key = 'migrated_json'").fetchone()
+			if done is not None or not os.path.exists(path):
+				conn.execute('COMMIT')
+				return 0
+			try:
+				with open(path, 'r', encoding='utf-8') as f:
+					orders = json.load(f)
+				if not isinstance(orders, list):
+					raise ValueError('expected a JSON list of orders')
+			except (ValueError, OSError) as e:
+				conn.execute('COMMIT')
+				self._set_aside(path, e)
+				return 0
+			rows = [self._row_values(o) for o in orders if isinstance(o, dict) and o.get('id')]
+			conn.executemany('INSERT OR IGNORE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+			conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_json', ?)", (os.path.abspath(path),))
+			conn.execute('COMMIT')
+		except Exception:
+			conn.execute('ROLLBACK')
+			raise
+		print(f'Migrated {len(rows)} orders from', path)
+		return len(rows)
+
+	@staticmethod
+	def _set_aside(path: str, error: Exception):
+		aside = path + '.corrupt'
+		try:
+			os.replace(path, aside)
+		except OSError as e:
+			print(f'Warning: could not read legacy orders file {path} ({error}) and could not move it aside: {e}')
+			return
+		print(f'Warning: could not read legacy orders file {path} ({error}); moved it to {aside}')
+
+	def create(self, order):
+		conn = self._conn()
+		conn.execute('INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?, ?)', self._row_values(order))
+
+	def get(self, order_id: str):
+		row = self._conn().execute('SELECT data FROM orders WHERE id = ?', (order_id,)).fetchone()
+		return json.loads(row['data']) if row else None
+
+	@staticmethod
+	def encode_cursor(created_at: int, order_id: str) -> str:
+		raw = json.dumps([created_at, order_id]).encode('utf-8')
+		return base64.urlsafe_b64encode(raw).decode('ascii')
+
+	@staticmethod
+	def decode_cursor(cursor: str):
+		try:
+			created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+			return int(created_at), str(order_id)
+		except Exception:
+			raise ValueError('invalid cursor')
+
+	@staticmethod
+	def _where(filters):
+		# filters: status, payment_method, email, created_from, created_to (unix seconds, inclusive)
+		clauses, params = [], []
+		filters = filters or {}
+		if filters.get('status'):
+			clauses.append('status = ?')
+			params.append(filters['status'])
+		if filters.get('payment_method'):
+			clauses.append('payment_method = ?')
+			params.append(filters['payment_method'])
+		if filters.get('email'):
+			clauses.append('user_email = ?')
+			params.append(filters['email'].strip().lower())
+		if filters.get('created_from') is not None:
+			clauses.append('created_at >= ?')
+			params.append(int(filters['created_from']))
+		if filters.get('created_to') is not None:
+			clauses.append('created_at <= ?')
+			params.append(int(filters['created_to']))
+		return clauses, params
+
+	def count(self, filters=None) -> int:
+		clauses, params = self._where(filters)
+		sql = 'SELECT COUNT(*) FROM orders'
+		if clauses:
+			sql += ' WHERE ' + ' AND '.join(clauses)
+		return self._conn().execute(sql, params).fetchone()[0]
+
+	def _select(self, filters, cursor, descending, limit=None):
+		clauses, params = self._where(filters)
+		if cursor:
+			created_at, order_id = self.decode_cursor(cursor)
+			clauses.append('(created_at, id) < (?, ?)' if descending else '(created_at, id) > (?, ?)')
+			params.extend([created_at, order_id])
+		direction = 'DESC' if descending else 'ASC'
+		sql = 'SELECT id, created_at, data FROM orders'
+		if clauses:
+			sql += ' WHERE ' + ' AND '.join(clauses)
+		sql += f' ORDER BY created_at {direction}, id {direction}'
+		if limit is not None:
+			sql += ' LIMIT ?'
+			params.append(int(limit))
+		return self._conn().execute(sql, params)
+
+	def page(self, filters=None, limit: int = 100, cursor: Optional[str] = None, descending: bool = False):
+		"""Keyset pagination on (created_at, id); returns (orders, next_cursor)."""
+		rows = self._select(filters, cursor, descending, limit + 1).fetchall()
+		next_cursor = None
+		if len(rows) > limit:
+			rows = rows[:limit]
+			last = rows[-1]
+			next_cursor = self.encode_cursor(last['created_at'], last['id'])
+		return [json.loads(r['data']) for r in rows], next_cursor
+
+	def iter_json(self, filters=None, descending: bool = False, chunk: int = 500):
+		"""Yields each matching order's stored JSON text without building a list."""
+		cur = self._select(filters, None, descending)
+		while True:
+			rows = cur.fetchmany(chunk)
+			if not rows:
+				break
+			for r in rows:
+				yield r['data']
+
+	def aggregates(self, filters=None):
+		clauses, params = self._where(filters)
+		where = (' WHERE ' + ' AND '.join(clauses)) if clauses else ''
+		conn = self._conn()
+		by_status = {}
+		for r in conn.execute(f'SELECT status, COUNT(*) AS n, COALESCE(SUM(total), 0) AS revenue FROM orders{where} GROUP BY status', params):
+			by_status[r['status'] or 'unknown'] = {'count': r['n'], 'total': r['revenue']}
+		by_day = []
+		for r in conn.execute(
+			f"SELECT date(created_at, 'unixepoch') AS day, COUNT(*) AS n, COALESCE(SUM(total), 0) AS revenue FROM orders{where} GROUP BY day ORDER BY day",
+			params,
+		):
+			by_day.append({'day': r['day'], 'count': r['n'], 'revenue': r['revenue']})
+		return {
+			'count': sum(v['count'] for v in by_status.values()),
+			'revenue': sum(v['total'] for v in by_status.values()),
+			'by_status': by_status,
+			'revenue_per_day': by_day,
+		}
@@ -1,62 +1,63 @@
-import tensorflow as tf
-import numpy as np
-import cv2
 import os
-import matplotlib.pyplot as plt
-from tkinter import Tk, filedialog
-
-# ✅ Hide the root tkinter window
-Tk().withdraw()
-
-# ✅ Ask user to upload image
-print("📁 Please select a dog image to predict:")
-IMAGE_PATH = filedialog.askopenfilename(
-    title="Select Dog Image",
-    filetypes=[("Image files", "*.jpg *.jpeg *.png")]
-)
-
-if not IMAGE_PATH:
-    print("⚠️ No image selected. Exiting...")
-    exit()
-
-# ✅ Paths
-MODEL_PATH = "dog_breed_model.h5"   # trained model path
-DATA_DIR = r"C:\Users\saraswathi\Downloads\archive\images\Images"  # dataset folder for breed names
-
-# ✅ Load model
-print("\n🔄 Loading model...")
-model = tf.keras.models.load_model(MODEL_PATH)
-print("✅ Model loaded successfully!")
-
-# ✅ Get breed names
-breed_names = sorted(os.listdir(DATA_DIR))
-print(f"📂 Found {len(breed_names)} breeds")
-
-# ✅ Load and preprocess image
-print(f"\n🖼️ Processing: {os.path.basename(IMAGE_PATH)}")
-img = cv2.imread(IMAGE_PATH)
-if img is None:
-    raise FileNotFoundError(f"Image not found at {IMAGE_PATH}")
-
-img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-img_resized = cv2.resize(img_rgb, (224, 224))
-img_array = np.expand_dims(img_resized / 255.0, axis=0)
-
-# ✅ Predict
-print("🔍 Predicting breed...")
-predictions = model.predict(img_array)
-pred_idx = np.argmax(predictions)
-confidence = np.max(predictions) * 100
-pred_breed = breed_names[pred_idx]
-
-# ✅ Print results
-print("\n============================")
-print(f"🐾 Predicted Breed: {pred_breed}")
-print(f"🎯 Confidence: {confidence:.2f}%")
-print("============================")
-
-# ✅ Display the image with prediction
-plt.imshow(img_rgb)
-plt.title(f"{pred_breed}\nConfidence: {confidence:.2f}%")
-plt.axis("off")
-plt.show()
+import sys
+import argparse
+
+from calibration import CALIBRATION_FILE, apply_temperature, load_temperature, top_k
+from classify_images import DEFAULT_DATA_DIR, load_labels
+from inference_backends import load_backend
+from model_registry import ModelRegistry
+from preprocess import preprocess_image
+
+# Classifies a few images from the command line. For folders, globs, file
+# lists, CSV/JSONL output or accuracy reports use classify_images.py.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Predict the breed of one or more dog images.")
+    parser.add_argument("images", nargs="+", help="image files")
+    parser.add_argument("--model", default=os.environ.get("MODEL_PATH") or None,
+                        help="model file (default: the registry version, else the backend artifact)")
+    parser.add_argument("--version", help="model registry version (default: CURRENT, unless --model is given)")
+    parser.add_argument("--registry-dir", default=os.environ.get("MODEL_REGISTRY_DIR", os.path.join(BASE_DIR, "models")))
+    parser.add_argument("--backend", default=os.environ.get("INFERENCE_BACKEND", "keras"))
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    # ✅ Load model, labels and calibration
+    print("🔄 Loading model...")
+    registry = ModelRegistry(args.registry_dir)
+    version = args.version or (None if args.model or args.backend == "remote" else registry.current())
+    if version:
+        backend = registry.load(version, args.backend).backend
+        model_dir = registry.path(version)
+    else:
+        backend = load_backend(args.backend, args.model, base_dir=BASE_DIR)
+        # the remote backend's path is the inference server address
+        local = args.backend != "remote" and getattr(backend, "path", None)
+        model_dir = os.path.dirname(os.path.abspath(backend.path)) if local else BASE_DIR
+    breed_names = load_labels(os.path.join(model_dir, "breed_labels.json"), DEFAULT_DATA_DIR)
+    temperature = load_temperature(os.path.join(model_dir, CALIBRATION_FILE))
+    print(f"✅ Model loaded successfully! ({len(breed_names)} breeds)")
+
+    h, w = backend.input_size
+    for path in args.images:
+        print(f"\n🖼️ Processing: {os.path.basename(path)}")
+        try:
+            with open(path, "rb") as f:
+                img = preprocess_image(f.read(), (w, h))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read {path}: {e}")
+            continue
+        probs = apply_temperature(backend.predict(img[None]), temperature)
+        idx, vals = top_k(probs, args.top_k)
+        print("============================")
+        for rank, (i, v) in enumerate(zip(idx[0], vals[0]), 1):
+            name = breed_names[i] if i < len(breed_names) else str(i)
+            marker = "🐾" if rank == 1 else "  "
+            print(f"{marker} {name}: {v * 100:.2f}%")
+        print("============================")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
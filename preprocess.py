@@ -0,0 +1,112 @@
+import os
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+import cv2
+
+# Upload limits checked from the file header, before any pixel is decoded
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(20 * 1024 * 1024)))
+MAX_UPLOAD_PIXELS = int(os.environ.get('MAX_UPLOAD_PIXELS', str(50_000_000)))
+
+# libjpeg can decode at 1/2, 1/4 or 1/8 scale straight from the DCT
+# coefficients, which is far cheaper than a full decode followed by a resize
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_SCALE = np.float32(1.0 / 255.0)
+
+
+class ImageTooLargeError(ValueError):
+	"""The upload exceeds MAX_UPLOAD_BYTES or MAX_UPLOAD_PIXELS."""
+
+
+def _jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+	# Walk the marker segments up to the first start-of-frame
+	n = len(data)
+	i = 2
+	while i + 4 <= n:
+		if data[i] != 0xFF:
+			return None
+		marker = data[i + 1]
+		if marker == 0xFF:  # fill byte
+			i += 1
+			continue
+		if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # markers without a length
+			i += 2
+			continue
+		if marker == 0xDA:  # start of scan before any frame header
+			return None
+		if marker in _JPEG_SOF:
+			if i + 9 > n:
+				return None
+			h = int.from_bytes(data[i + 5:i + 7], 'big')
+			w = int.from_bytes(data[i + 7:i + 9], 'big')
+			return w, h
+		i += 2 + int.from_bytes(data[i + 2:i + 4], 'big')
+	return None
+
+
+def probe_image(data: bytes) -> Tuple[Optional[str], Optional[Tuple[int, int]]]:
+	"""(format, (width, height)) read from the JPEG SOF or PNG IHDR header
+	without decoding; either part is None when it cannot be determined."""
+	if data[:2] == b'\xff\xd8':
+		return 'jpeg', _jpeg_size(data)
+	if data[:8] == _PNG_SIGNATURE and data[12:16] == b'IHDR' and len(data) >= 24:
+		return 'png', (int.from_bytes(data[16:20], 'big'), int.from_bytes(data[20:24], 'big'))
+	return None, None
+
+
+def check_upload(data: bytes, max_bytes: int = MAX_UPLOAD_BYTES, max_pixels: int = MAX_UPLOAD_PIXELS):
+	"""Raises ImageTooLargeError for payloads that are too big to decode.
+	Returns the probed (format, size) so callers need not parse twice."""
+	if max_bytes and len(data) > max_bytes:
+		raise ImageTooLargeError(f'Image is {len(data)} bytes; the limit is {max_bytes}')
+	fmt, size = probe_image(data)
+	if size is not None and max_pixels and size[0] * size[1] > max_pixels:
+		raise ImageTooLargeError(f'Image is {size[0]}x{size[1]} pixels; the limit is {max_pixels}')
+	return fmt, size
+
+
+def _decode_flag(fmt, size, target) -> int:
+	# Largest JPEG reduction that still leaves both sides at least as big as
+	# the model input (orientation may swap the sides, so use the short one)
+	if fmt != 'jpeg' or size is None:
+		return cv2.IMREAD_COLOR
+	short_side = min(size)
+	for factor, flag in _REDUCED_FLAGS:
+		if short_side // factor >= max(target):
+			return flag
+	return cv2.IMREAD_COLOR
+
+
+def preprocess_image(data: bytes, size: Tuple[int, int] = (224, 224), out: Optional[np.ndarray] = None,
+					 max_bytes: int = MAX_UPLOAD_BYTES, max_pixels: int = MAX_UPLOAD_PIXELS,
+					 timings: Optional[dict] = None) -> np.ndarray:
+	"""Encoded image bytes -> float32 RGB array of shape (h, w, 3) in [0, 1].
+
+	Large JPEGs are decoded at reduced resolution, the resize runs on the
+	uint8 BGR image, and the BGR->RGB swap and the scaling to [0, 1] are done
+	in one pass writing into `out` (e.g. a row of a preallocated batch) when
+	given, so no full-resolution float copy is ever made. `timings`, when
+	given, receives the 'decode' and 'preprocess' durations in seconds.
+	"""
+	t0 = time.perf_counter()
+	fmt, dims = check_upload(data, max_bytes, max_pixels)
+	img = cv2.imdecode(np.frombuffer(data, np.uint8), _decode_flag(fmt, dims, size))
+	if img is None:
+		raise ValueError('Could not decode image')
+	t1 = time.perf_counter()
+	if dims is None and max_pixels and img.shape[0] * img.shape[1] > max_pixels:
+		raise ImageTooLargeError(f'Image is {img.shape[1]}x{img.shape[0]} pixels; the limit is {max_pixels}')
+	w, h = size
+	if img.shape[1] != w or img.shape[0] != h:
+		shrinking = img.shape[1] > w and img.shape[0] > h
+		img = cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR)
+	if out is None:
+		out = np.empty((h, w, 3), dtype=np.float32)
+	np.multiply(img[:, :, ::-1], _SCALE, out=out, dtype=np.float32)
+	if timings is not None:
+		timings['decode'] = t1 - t0
+		timings['preprocess'] = time.perf_counter() - t1
+	return out
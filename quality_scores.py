@@ -0,0 +1,118 @@
+import os
+import sqlite3
+import threading
+from multiprocessing import Pool, cpu_count
+
+import cv2
+
+# Sharpness (variance of the Laplacian) per image file, keyed by path and
+# validated against the file's mtime and size, so a score is reused until the
+# file changes. Shared by reduce_dataset_safe.py and clean_dog_dataset.py.
+DEFAULT_DB = "quality_scores.db"
+
+
+def laplacian_sharpness(gray):
+    """Variance of the Laplacian of a uint8 grayscale image; low means blurry."""
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def file_stat(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def score_file(path):
+    """Worker: (path, mtime_ns, size, sharpness, width, height); sharpness is
+    None when the file cannot be decoded."""
+    try:
+        mtime_ns, size = file_stat(path)
+    except OSError:
+        return path, None, None, None, None, None
+    gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return path, mtime_ns, size, None, None, None
+    h, w = gray.shape[:2]
+    return path, mtime_ns, size, laplacian_sharpness(gray), w, h
+
+
+class ScoreStore:
+    """SQLite table of image quality scores."""
+
+    def __init__(self, path=DEFAULT_DB):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS scores ("
+                " path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL,"
+                " sharpness REAL NOT NULL, width INTEGER, height INTEGER)"
+            )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, paths, stats=None):
+        """{path: (sharpness, width, height)} for paths whose stored mtime and
+        size still match the file on disk (or the given `stats`)."""
+        out = {}
+        conn = self._conn()
+        paths = list(paths)
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            rows = conn.execute(
+                f"SELECT path, mtime_ns, size, sharpness, width, height FROM scores"
+                f" WHERE path IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+            for path, mtime_ns, size, sharpness, w, h in rows:
+                try:
+                    current = stats[path] if stats is not None else file_stat(path)
+                except (KeyError, OSError):
+                    continue
+                if tuple(current) == (mtime_ns, size):
+                    out[path] = (sharpness, w, h)
+        return out
+
+    def put_many(self, rows):
+        """rows: iterable of (path, mtime_ns, size, sharpness, width, height)."""
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO scores (path, mtime_ns, size, sharpness, width, height)"
+                " VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def forget(self, paths):
+        with self._conn() as conn:
+            conn.executemany("DELETE FROM scores WHERE path = ?", [(p,) for p in paths])
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+
+def score_paths(paths, store, workers=None, progress=None):
+    """Returns ({path: (sharpness, width, height)}, number of files scored).
+
+    Only files missing from `store` (or changed since) are decoded, on a
+    process pool; their scores are written back. Undecodable files are left
+    out of the result."""
+    paths = list(paths)
+    scores = store.get_many(paths)
+    todo = [p for p in paths if p not in scores]
+    if todo:
+        pending = []
+        with Pool(workers or cpu_count()) as pool:
+            for path, mtime_ns, size, sharpness, w, h in pool.imap_unordered(score_file, todo, chunksize=32):
+                if progress is not None:
+                    progress(1)
+                if sharpness is None:
+                    continue
+                scores[path] = (sharpness, w, h)
+                pending.append((path, mtime_ns, size, sharpness, w, h))
+                if len(pending) >= 1000:
+                    store.put_many(pending)
+                    pending = []
+        store.put_many(pending)
+    return scores, len(todo)
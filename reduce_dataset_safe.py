@@ -1,57 +1,144 @@
 import os
-import cv2
+import json
+import time
 import shutil
+import argparse
 from tqdm import tqdm
 
-# ✅ Correct dataset path
-DATASET_DIR = r"C:\Users\saraswathi\Downloads\archive\images\Images"
-REMOVED_DIR = r"C:\Users\saraswathi\Downloads\archive\removed_images"
-
-os.makedirs(REMOVED_DIR, exist_ok=True)
-
-def image_quality_score(img_path):
-    try:
-        img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
-        if img is None:
-            return 0
-        return cv2.Laplacian(img, cv2.CV_64F).var()
-    except:
-        return 0
-
-breed_folders = [f for f in os.listdir(DATASET_DIR) if os.path.isdir(os.path.join(DATASET_DIR, f))]
-if not breed_folders:
-    print("⚠️ No breed folders found! Check DATASET_DIR path.")
-    exit()
-
-for breed_folder in tqdm(breed_folders, desc="Processing breeds"):
-    breed_path = os.path.join(DATASET_DIR, breed_folder)
-    image_files = [os.path.join(breed_path, f)
-                   for f in os.listdir(breed_path)
-                   if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
-
-    if len(image_files) <= 50:
-        print(f"✅ {breed_folder}: only {len(image_files)} images, skipped.")
-        continue
-
-    # Rank images by sharpness × file size (for quality)
-    scored_images = []
-    for img_path in image_files:
-        sharpness = image_quality_score(img_path)
-        size = os.path.getsize(img_path)
-        score = sharpness * (size / 1024)
-        scored_images.append((img_path, score))
-
-    scored_images.sort(key=lambda x: x[1], reverse=True)
-    best_images = scored_images[:50]
-    best_paths = set([img[0] for img in best_images])
-
-    # Move extras
-    removed_breed_dir = os.path.join(REMOVED_DIR, breed_folder)
-    os.makedirs(removed_breed_dir, exist_ok=True)
-
-    for img_path, _ in scored_images[50:]:
-        shutil.move(img_path, os.path.join(removed_breed_dir, os.path.basename(img_path)))
-
-    print(f"✅ {breed_folder}: kept 50 / moved {len(scored_images) - 50}")
-
-print("\n🎯 Finished: 50 best-quality images per breed kept.")
+from quality_scores import DEFAULT_DB, ScoreStore, file_stat, score_paths
+
+# ✅ Dataset paths
+DATASET_DIR = os.path.join("images", "Images")
+REMOVED_DIR = "removed_images"
+PLAN_FILE = "reduce_plan.json"
+KEEP_PER_BREED = 50
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Ranking formulas: (sharpness, file size in KB, width, height) -> score
+FORMULAS = {
+    "sharpness_kb": lambda sharpness, kb, w, h: sharpness * kb,   # sharpness × file size (original ranking)
+    "sharpness": lambda sharpness, kb, w, h: sharpness,
+    "sharpness_mp": lambda sharpness, kb, w, h: sharpness * (w * h / 1e6),   # sharpness × megapixels
+}
+
+
+def list_breeds(dataset_dir):
+    breeds = {}
+    for breed in sorted(os.listdir(dataset_dir)):
+        breed_path = os.path.join(dataset_dir, breed)
+        if os.path.isdir(breed_path):
+            breeds[breed] = sorted(os.path.join(breed_path, f) for f in os.listdir(breed_path)
+                                   if f.lower().endswith(IMAGE_EXTENSIONS))
+    return breeds
+
+
+def make_plan(dataset_dir, removed_dir, keep, formula, store, workers=None):
+    """Ranks every breed folder and lists the moves that would keep the best
+    `keep` images per breed. Nothing on disk is changed."""
+    breeds = list_breeds(dataset_dir)
+    if not breeds:
+        raise SystemExit("⚠️ No breed folders found! Check the dataset path.")
+
+    # Score all breeds together so the process pool stays busy across folders
+    all_paths = [p for paths in breeds.values() if len(paths) > keep for p in paths]
+    with tqdm(total=len(all_paths), desc="Scoring", ncols=90) as bar:
+        scores, scored = score_paths(all_paths, store, workers, progress=bar.update)
+    print(f"♻️ {len(all_paths) - scored} scores reused, {scored} images scored")
+
+    rank = FORMULAS[formula]
+    moves = []
+    summary = {}
+    for breed, paths in breeds.items():
+        if len(paths) <= keep:
+            summary[breed] = {"kept": len(paths), "moved": 0}
+            continue
+        ranked = []
+        for path in paths:
+            mtime_ns, size = file_stat(path)
+            sharpness, w, h = scores.get(path, (0.0, 0, 0))   # undecodable files rank last
+            ranked.append((rank(sharpness, size / 1024, w, h), path, mtime_ns, size))
+        ranked.sort(key=lambda r: (-r[0], r[1]))
+        for score, path, mtime_ns, size in ranked[keep:]:
+            moves.append({
+                "src": path,
+                "dst": os.path.join(removed_dir, breed, os.path.basename(path)),
+                "score": round(score, 3),
+                "mtime_ns": mtime_ns,
+                "size": size,
+            })
+        summary[breed] = {"kept": keep, "moved": len(ranked) - keep}
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "dataset_dir": os.path.abspath(dataset_dir),
+        "removed_dir": os.path.abspath(removed_dir),
+        "keep": keep,
+        "formula": formula,
+        "breeds": summary,
+        "moves": moves,
+    }
+
+
+def apply_plan(plan, store=None):
+    """Performs the moves of a plan. Files changed or gone since planning, or
+    whose destination already exists, are skipped and reported."""
+    moved, skipped = 0, []
+    for move in tqdm(plan["moves"], desc="Moving", ncols=90):
+        src, dst = move["src"], move["dst"]
+        try:
+            current = file_stat(src)
+        except OSError:
+            skipped.append((src, "missing"))
+            continue
+        if current != (move["mtime_ns"], move["size"]):
+            skipped.append((src, "changed since plan"))
+            continue
+        if os.path.exists(dst):
+            skipped.append((src, "destination exists"))
+            continue
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.move(src, dst)
+        moved += 1
+    if store is not None:
+        store.forget([m["src"] for m in plan["moves"] if not os.path.exists(m["src"])])
+    return moved, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the best-quality images of each breed.")
+    parser.add_argument("--scores", default=DEFAULT_DB, help="quality score database shared with clean_dog_dataset.py")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("plan", help="score and rank images, write the moves to a plan file")
+    p.add_argument("--dataset", default=DATASET_DIR)
+    p.add_argument("--removed-dir", default=REMOVED_DIR)
+    p.add_argument("--keep", type=int, default=KEEP_PER_BREED, help="images kept per breed")
+    p.add_argument("--formula", choices=sorted(FORMULAS), default="sharpness_kb")
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--out", default=PLAN_FILE)
+
+    a = sub.add_parser("apply", help="move the files listed in a plan")
+    a.add_argument("--plan", default=PLAN_FILE)
+
+    args = parser.parse_args()
+    store = ScoreStore(args.scores)
+
+    if args.cmd == "plan":
+        plan = make_plan(args.dataset, args.removed_dir, args.keep, args.formula, store, args.workers)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(plan, f, indent=2)
+        reduced = sum(1 for s in plan["breeds"].values() if s["moved"])
+        print(f"\n📝 Plan: move {len(plan['moves'])} images from {reduced} breeds "
+              f"(keep {args.keep}, formula {args.formula}); review {args.out}, then run 'apply'")
+    else:
+        with open(args.plan, "r", encoding="utf-8") as f:
+            plan = json.load(f)
+        moved, skipped = apply_plan(plan, store)
+        for src, reason in skipped:
+            print(f"⚠️ Skipped {src}: {reason}")
+        print(f"\n🎯 Finished: moved {moved} images, skipped {len(skipped)}; "
+              f"{plan['keep']} best-quality images per breed kept.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import threading
+
+from caching import ChatCache
+
+
+def test_counters_are_exact_under_threads():
+    cache = ChatCache(ttl=300, sweep_seconds=0)
+    cache.set("hit", "answer")
+
+    def work():
+        for _ in range(2000):
+            cache.get("hit")
+            cache.get("miss")
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = cache.stats()
+    assert stats["hits"] == 16000
+    assert stats["misses"] == 16000
+    assert stats["hit_ratio"] == 0.5
@@ -0,0 +1,64 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from upstream_client import UpstreamClient
+
+
+class _SSEHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        body = b'data: {"choices": [{"delta": {"content": "hi"}}]}\n\ndata: [DONE]\n\n'
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def groq_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SSEHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope="module")
+def app_module(tmp_path_factory):
+    # keep the import from writing orders.db into the checkout
+    os.environ.setdefault("ORDERS_DB_PATH", str(tmp_path_factory.mktemp("orders") / "orders.db"))
+    os.environ.setdefault("MODEL_WATCH_SECONDS", "0")
+    import app
+    return app
+
+
+def test_stream_slot_is_released_when_the_client_leaves_before_the_first_token(app_module, groq_url, monkeypatch):
+    client = UpstreamClient(max_callers=1)
+    monkeypatch.setattr(app_module, "groq_client", client)
+    with app_module.app.test_request_context("/chat?stream=1", method="POST"):
+        response = app_module._chat_stream("k", groq_url, {}, {"messages": []})
+    # what the WSGI server does when the client disconnects: close the
+    # response without ever iterating it
+    response.close()
+    # raises UpstreamBusyError if the only slot leaked
+    client.post(groq_url, timeout=5).close()
+
+
+def test_streamed_answer_releases_its_slot(app_module, groq_url, monkeypatch):
+    client = UpstreamClient(max_callers=1)
+    monkeypatch.setattr(app_module, "groq_client", client)
+    monkeypatch.setattr(app_module, "cache_set", lambda k, v: None)
+    with app_module.app.test_request_context("/chat?stream=1", method="POST"):
+        response = app_module._chat_stream("k", groq_url, {}, {"messages": []})
+        body = "".join(response.response)
+    response.close()
+    assert '"token": "hi"' in body
+    client.post(groq_url, timeout=5).close()
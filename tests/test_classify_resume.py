@@ -0,0 +1,56 @@
+import json
+
+from classify_images import ResultWriter, read_previous
+
+
+def _row(path, breed):
+    return {"path": path, "truth": "beagle", "breed": breed, "confidence": 0.9,
+            "top_k": [{"breed": breed, "confidence": 0.9}], "decode_ms": 1.0, "infer_ms": 2.0}
+
+
+def _write(path, fmt, rows):
+    writer = ResultWriter(str(path), fmt, 1, resume=False)
+    for row in rows:
+        writer.write(row)
+    writer.close()
+
+
+def test_resume_csv_with_torn_last_row(tmp_path):
+    out = tmp_path / "results.csv"
+    _write(out, "csv", [_row("a.jpg", "beagle"), _row("b.jpg", "beagle")])
+    text = out.read_text(encoding="utf-8")
+    # interrupted while writing the third row: the path is complete, the rest is not
+    out.write_text(text + "c.jpg,beagle,bea", encoding="utf-8")
+
+    done, previous = read_previous(str(out), "csv")
+    assert done == {"a.jpg", "b.jpg"}
+    assert len(previous) == 2
+
+    writer = ResultWriter(str(out), "csv", 1, resume=True)
+    writer.write(_row("c.jpg", "husky"))
+    writer.close()
+    done, previous = read_previous(str(out), "csv")
+    assert done == {"a.jpg", "b.jpg", "c.jpg"}
+    assert [p[1] for p in previous] == ["beagle", "beagle", "husky"]
+
+
+def test_resume_jsonl_with_torn_last_row(tmp_path):
+    out = tmp_path / "results.jsonl"
+    _write(out, "jsonl", [_row("a.jpg", "beagle")])
+    with open(out, "a", encoding="utf-8") as f:
+        f.write(json.dumps(_row("b.jpg", "beagle"))[:20])
+
+    done, _ = read_previous(str(out), "jsonl")
+    assert done == {"a.jpg"}
+    assert out.read_text(encoding="utf-8").endswith("\n")
+
+
+def test_resume_csv_torn_header(tmp_path):
+    out = tmp_path / "results.csv"
+    out.write_text("path,truth,br", encoding="utf-8")
+    done, previous = read_previous(str(out), "csv")
+    assert done == set() and previous == []
+    writer = ResultWriter(str(out), "csv", 1, resume=True)
+    writer.write(_row("a.jpg", "beagle"))
+    writer.close()
+    assert read_previous(str(out), "csv")[0] == {"a.jpg"}
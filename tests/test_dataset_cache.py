@@ -0,0 +1,62 @@
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import dataset_cache
+from dataset_cache import INDEX_FILE, build_cache, load_index, open_images
+
+
+def _dataset(root, breeds=("beagle", "husky"), per_breed=2, value=0):
+    for b, breed in enumerate(breeds):
+        os.makedirs(root / breed, exist_ok=True)
+        for i in range(per_breed):
+            img = np.full((20, 30, 3), value + 10 * b + i, dtype=np.uint8)
+            cv2.imwrite(str(root / breed / f"{i}.png"), img)
+
+
+def test_rebuild_replaces_images_and_index_together(tmp_path):
+    data, cache = tmp_path / "data", tmp_path / "cache"
+    _dataset(data)
+    first = build_cache(str(data), str(cache), (8, 8), workers=1)
+    _dataset(data, per_breed=3, value=100)
+    second = build_cache(str(data), str(cache), (8, 8), workers=1)
+
+    assert second["images_file"] != first["images_file"]
+    assert sorted(n for n in os.listdir(cache) if n.startswith("images")) == [second["images_file"]]
+    assert len(open_images(str(cache))) == 6
+
+
+def test_crash_before_the_index_is_replaced_keeps_the_old_cache(tmp_path, monkeypatch):
+    data, cache = tmp_path / "data", tmp_path / "cache"
+    _dataset(data)
+    first = build_cache(str(data), str(cache), (8, 8), workers=1)
+    before = np.array(open_images(str(cache)))
+
+    def crash(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    # the new images file is in place, the index rename never happens
+    _dataset(data, value=100)
+    real_replace = os.replace
+    monkeypatch.setattr(dataset_cache.os, "replace",
+                        lambda src, dst: crash() if dst.endswith(INDEX_FILE) else real_replace(src, dst))
+    with pytest.raises(KeyboardInterrupt):
+        build_cache(str(data), str(cache), (8, 8), workers=1)
+    monkeypatch.undo()
+
+    assert load_index(str(cache))["images_file"] == first["images_file"]
+    np.testing.assert_array_equal(open_images(str(cache)), before)
+
+
+def test_open_images_rejects_a_mismatched_images_file(tmp_path):
+    data, cache = tmp_path / "data", tmp_path / "cache"
+    _dataset(data)
+    index = build_cache(str(data), str(cache), (8, 8), workers=1)
+    index["entries"].append(["beagle/extra.png", 0, 0, 0])
+    with open(cache / INDEX_FILE, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    with pytest.raises(ValueError):
+        open_images(str(cache))
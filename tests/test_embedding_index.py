@@ -0,0 +1,41 @@
+import json
+import os
+
+import numpy as np
+
+from embedding_index import IVF_FILE, META_FILE, VECTORS_FILE, EmbeddingIndex, build_ivf
+
+
+def _legacy_index(index_dir, n=40, dim=8):
+    # layout written before file names were recorded in meta.json
+    vectors = np.random.default_rng(0).normal(size=(n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.save(index_dir / VECTORS_FILE, vectors)
+    meta = {"model": "m.h5", "dtype": "float32", "rows": [[f"b/{i}.jpg", "b"] for i in range(n)]}
+    (index_dir / META_FILE).write_text(json.dumps(meta))
+    return vectors
+
+
+def test_save_ivf_publishes_through_meta(tmp_path):
+    vectors = _legacy_index(tmp_path)
+    np.savez(tmp_path / IVF_FILE, centroids=np.zeros((1, 8)), order=np.zeros(0), offsets=np.zeros(2))
+    index = EmbeddingIndex(str(tmp_path))
+    index.save_ivf(*build_ivf(index.vectors, nlist=4))
+
+    meta = json.loads((tmp_path / META_FILE).read_text())
+    assert meta["vectors_file"] == VECTORS_FILE
+    assert sorted(os.listdir(tmp_path)) == sorted([META_FILE, VECTORS_FILE, meta["ivf_file"]])
+
+    reopened = EmbeddingIndex(str(tmp_path))
+    assert len(reopened.centroids) == 4
+    assert reopened.search(vectors[3], k=1, nprobe=4)[0][0] == 3
+
+
+def test_index_without_ivf_ignores_a_stale_ivf_file(tmp_path):
+    _legacy_index(tmp_path)
+    meta = json.loads((tmp_path / META_FILE).read_text())
+    os.rename(tmp_path / VECTORS_FILE, tmp_path / "vectors-1.npy")
+    (tmp_path / META_FILE).write_text(json.dumps(dict(meta, vectors_file="vectors-1.npy", ivf_file=None)))
+    np.savez(tmp_path / IVF_FILE, centroids=np.zeros((1, 8)), order=np.zeros(0), offsets=np.zeros(2))
+
+    assert EmbeddingIndex(str(tmp_path)).centroids is None
@@ -0,0 +1,65 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from inference_backends import RemoteBackend
+from inference_server import InferenceServer
+from model_manager import ModelManager, ServedModel
+
+
+class SizedBackend:
+    name = "fake"
+
+    def __init__(self, size, classes=3):
+        self.input_size = (size, size)
+        self.classes = classes
+
+    def predict(self, batch):
+        batch = np.asarray(batch)
+        if batch.shape[1:3] != self.input_size:
+            raise ValueError(f"expected {self.input_size}, got {batch.shape[1:3]}")
+        return np.full((len(batch), self.classes), 1.0 / self.classes, dtype=np.float32)
+
+
+VERSIONS = {"v1": 32, "v2": 48}
+
+
+def _load(version=None):
+    version = version or "v1"
+    return ServedModel(SizedBackend(VERSIONS[version]), version=version)
+
+
+@pytest.fixture
+def server(tmp_path):
+    manager = ModelManager(_load)
+    manager.load()
+    srv = InferenceServer(manager, address=str(tmp_path / "infer.sock"), authkey=b"test", loader=_load)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.close()
+
+
+def _wait_for(cond, timeout=10.0):
+    deadline = time.time() + timeout
+    while not cond():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_remote_follows_a_server_reload(server):
+    remote = RemoteBackend(server.address, authkey=b"test", connect_timeout=10)
+    assert (remote.server_version, remote.input_size) == ("v1", (32, 32))
+    remote.predict(np.zeros((1, 32, 32, 3), dtype=np.float32))
+
+    assert remote.reload("v2")["reloading"]
+    _wait_for(lambda: server.manager.served.version == "v2")
+
+    # the next reply carries the new version and size without a reconnect
+    with pytest.raises(RuntimeError):
+        remote.predict(np.zeros((1, 32, 32, 3), dtype=np.float32))
+    assert remote.refresh()["version"] == "v2"
+    assert remote.input_size == (48, 48)
+    remote.predict(np.zeros((2, 48, 48, 3), dtype=np.float32))
+    assert remote.server_version == "v2"
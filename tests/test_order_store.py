@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from order_store import OrderStore
+
+
+@pytest.mark.parametrize("content", ["", '[{"id": "a", "total": 1', "not json"])
+def test_unreadable_legacy_json_is_set_aside(tmp_path, content):
+    legacy = tmp_path / "orders.json"
+    legacy.write_text(content)
+
+    store = OrderStore(str(tmp_path / "orders.db"), legacy_json_path=str(legacy))
+
+    assert store.count() == 0
+    assert not legacy.exists()
+    assert (tmp_path / "orders.json.corrupt").read_text() == content
+    # the next start neither fails nor re-reads the moved file
+    OrderStore(str(tmp_path / "orders.db"), legacy_json_path=str(legacy))
+
+
+def test_legacy_json_is_migrated_once(tmp_path):
+    legacy = tmp_path / "orders.json"
+    legacy.write_text(json.dumps([{"id": "a", "total": 2, "created_at": 1}, {"id": "b", "created_at": 2}]))
+
+    store = OrderStore(str(tmp_path / "orders.db"), legacy_json_path=str(legacy))
+    assert store.count() == 2
+    assert legacy.exists()
+    assert store.migrate_json(str(legacy)) == 0
+
+
+def test_payment_method_filter_uses_its_index(tmp_path):
+    store = OrderStore(str(tmp_path / "orders.db"))
+    plan = store._conn().execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM orders WHERE payment_method = ? ORDER BY created_at, id", ("card",)
+    ).fetchall()
+    assert any("idx_orders_payment_method" in row[-1] for row in plan)
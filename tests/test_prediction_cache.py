@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from caching import PredictionCache
+from model_manager import ServedModel
+
+
+class _Backend:
+    name = "keras"
+
+    def __init__(self, path):
+        self.path = path
+
+
+def test_counters_are_exact_under_threads():
+    cache = PredictionCache(max_entries=16)
+    cache.set("sha256:a", np.ones(3))
+
+    def work():
+        for _ in range(2000):
+            cache.get("sha256:a")
+            cache.record_miss()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = cache.stats()
+    assert stats["hits"] == 16000
+    assert stats["misses"] == 16000
+
+
+def _wait_for_prune(cache, timeout=10.0):
+    deadline = time.time() + timeout
+    while cache.stats()["disk"]["pruning"]:
+        assert time.time() < deadline, "prune did not finish"
+        time.sleep(0.01)
+
+
+def test_disk_prune_ignores_tmp_files(tmp_path):
+    cache = PredictionCache(max_entries=1, disk_dir=str(tmp_path), disk_max_entries=10, prune_interval=0)
+    leftover = tmp_path / "ab"
+    leftover.mkdir()
+    for i in range(20):
+        (leftover / f"{i}.json.tmp").write_text("{")
+    for i in range(12):
+        cache.set(f"sha256:{i}", np.ones(3))
+    _wait_for_prune(cache)
+    entries = [n for _, _, files in os.walk(tmp_path) for n in files if n.endswith(".json")]
+    assert len(entries) == cache.stats()["disk"]["entries"] <= 10
+    # recent .tmp files may be writes in progress and are left alone
+    assert len(list(leftover.glob("*.tmp"))) == 20
+
+
+def test_unversioned_model_identity_follows_the_file(tmp_path):
+    model = tmp_path / "dog_breed_model.h5"
+    model.write_bytes(b"x" * 10)
+    before = ServedModel(_Backend(str(model))).identity
+    model.write_bytes(b"x" * 11)
+    assert ServedModel(_Backend(str(model))).identity != before
+    assert ServedModel(_Backend(str(model)), version="20260301-142500").identity == "20260301-142500"
+
+
+def test_disk_prune_runs_off_the_request_thread_and_is_rate_limited(tmp_path):
+    cache = PredictionCache(max_entries=1, disk_dir=str(tmp_path), disk_max_entries=5, prune_interval=3600)
+    for i in range(6):
+        cache.set(f"sha256:{i}", np.ones(3))
+    _wait_for_prune(cache)
+    assert cache.stats()["disk"]["evictions"] > 0
+    evictions = cache.stats()["disk"]["evictions"]
+    for i in range(6, 12):
+        cache.set(f"sha256:{i}", np.ones(3))
+    # over the limit again, but the next prune waits for prune_interval
+    assert not cache.stats()["disk"]["pruning"]
+    assert cache.stats()["disk"]["evictions"] == evictions
+    assert cache.stats()["disk"]["entries"] > 5
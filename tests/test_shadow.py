@@ -0,0 +1,94 @@
+import time
+
+import cv2
+import numpy as np
+
+from model_manager import ModelManager, ServedModel, ShadowEvaluator
+from preprocess import preprocess_image
+
+LABELS = ["beagle", "husky", "poodle"]
+
+
+class FakeBackend:
+    """Answers class 0 and records the input shapes it was given; rejects
+    inputs that are not its own size, like a real model would."""
+
+    name = "fake"
+
+    def __init__(self, size):
+        self.input_size = (size, size)
+        self.shapes = []
+
+    def predict(self, batch):
+        batch = np.asarray(batch)
+        if batch.shape[1:3] != self.input_size:
+            raise ValueError(f"expected {self.input_size}, got {batch.shape[1:3]}")
+        self.shapes.append(batch.shape)
+        out = np.zeros((len(batch), len(LABELS)), dtype=np.float32)
+        out[:, 0] = 1.0
+        return out
+
+
+def _jpeg(w=300, h=200):
+    img = np.random.default_rng(0).integers(0, 255, (h, w, 3), dtype=np.uint8)
+    ok, buf = cv2.imencode(".jpg", img)
+    assert ok
+    return buf.tobytes()
+
+
+def _wait(evaluator, samples, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        s = evaluator.stats()
+        if s["samples"] + s["errors"] >= samples and not s["pending"]:
+            return s
+        time.sleep(0.01)
+    raise AssertionError("shadow evaluator did not finish")
+
+
+def test_shadow_candidate_with_smaller_input_size():
+    live = ServedModel(FakeBackend(224), LABELS, metadata={"input_size": [224, 224]}, version="full")
+    candidate_backend = FakeBackend(160)
+    manager = ModelManager(lambda: ServedModel(candidate_backend, LABELS, version="variant-a0.5-s160",
+                                               metadata={"input_size": [160, 160]}))
+    manager.load()
+    assert manager.ready
+
+    data = _jpeg()
+    x = preprocess_image(data, (224, 224))[np.newaxis]
+    live_probs = live.predict(x)[0]
+    evaluator = ShadowEvaluator(manager, sample_rate=1.0)
+    try:
+        for _ in range(3):
+            assert evaluator.offer(data, live_probs, live, 1.0, x=x)
+        stats = _wait(evaluator, 3)
+    finally:
+        evaluator.close()
+
+    assert stats["errors"] == 0
+    assert stats["samples"] == 3
+    assert stats["top1_agreement"] == 1.0
+    # warm-up plus three samples, all at the candidate's own resolution
+    assert candidate_backend.shapes[1:] == [(1, 160, 160, 3)] * 3
+
+
+def test_shadow_reuses_live_input_when_sizes_match():
+    live = ServedModel(FakeBackend(224), LABELS, version="full")
+    manager = ModelManager(lambda: ServedModel(FakeBackend(224), LABELS, version="retrained"))
+    manager.load()
+    calls = []
+
+    def preprocess(data, size):
+        calls.append(size)
+        return preprocess_image(data, size)
+
+    data = _jpeg()
+    x = preprocess_image(data, (224, 224))[np.newaxis]
+    evaluator = ShadowEvaluator(manager, sample_rate=1.0, preprocess=preprocess)
+    try:
+        evaluator.offer(data, live.predict(x)[0], live, 1.0, x=x)
+        stats = _wait(evaluator, 1)
+    finally:
+        evaluator.close()
+    assert stats["errors"] == 0 and stats["samples"] == 1
+    assert calls == []
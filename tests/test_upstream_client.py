@@ -0,0 +1,101 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from upstream_client import UpstreamBusyError, UpstreamClient
+
+
+class _Handler(BaseHTTPRequestHandler):
+    delay = 0.0
+    status = 200
+    hits = 0
+
+    def do_POST(self):
+        type(self).hits += 1
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        time.sleep(self.delay)
+        body = b"{}"
+        self.send_response(self.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    handler = type("Handler", (_Handler,), {"hits": 0})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield handler, f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def test_slow_upstream_times_out_within_the_callers_timeout(upstream):
+    handler, url = upstream
+    handler.delay = 3.0
+    client = UpstreamClient(max_retries=5, backoff=0.05)
+    t0 = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        client.post(url, timeout=1.0)
+    assert time.monotonic() - t0 < 1.5
+
+
+def test_retries_stay_within_the_callers_timeout(upstream):
+    handler, url = upstream
+    handler.delay = 0.4
+    handler.status = 503
+    client = UpstreamClient(max_retries=5, backoff=0.05)
+    t0 = time.monotonic()
+    try:
+        assert client.post(url, timeout=1.0).status_code == 503
+    except requests.Timeout:
+        pass  # the last retry started but could not finish in the budget
+    assert time.monotonic() - t0 < 1.5
+    assert handler.hits < 6
+
+
+def test_retries_on_5xx_until_the_deadline(upstream):
+    handler, url = upstream
+    handler.status = 503
+    client = UpstreamClient(max_retries=2, backoff=0.01)
+    r = client.post(url, timeout=5.0)
+    assert r.status_code == 503
+    assert handler.hits == 3
+
+
+def test_callers_beyond_max_callers_fail_fast(upstream):
+    handler, url = upstream
+    handler.delay = 0.5
+    client = UpstreamClient(max_concurrency=8, max_pending=32, max_callers=2)
+    assert client.max_callers == 2
+    threads = [threading.Thread(target=client.post, args=(url,), kwargs={"timeout": 5.0}) for _ in range(2)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    t0 = time.monotonic()
+    with pytest.raises(UpstreamBusyError):
+        client.post(url, timeout=5.0)
+    assert time.monotonic() - t0 < 0.1
+    for t in threads:
+        t.join()
+    assert client.post(url, timeout=5.0).status_code == 200
+
+
+def test_streamed_response_holds_its_slot_until_closed(upstream):
+    _handler, url = upstream
+    client = UpstreamClient(max_callers=1)
+    r = client.post(url, timeout=5.0, stream=True)
+    with pytest.raises(UpstreamBusyError):
+        client.post(url, timeout=5.0)
+    r.close()
+    r.close()
+    assert client.post(url, timeout=5.0).status_code == 200
@@ -1,105 +1,569 @@
 import os
+import json
+import time
+import argparse
+
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
-from tensorflow.keras.applications import MobileNetV2
-from tensorflow.keras.models import Model
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout
-from tensorflow.keras.optimizers import Adam
-import matplotlib.pyplot as plt
-
-# ✅ Paths
-DATA_DIR = r"C:\Users\saraswathi\Downloads\archive\images\Images"
-MODEL_PATH = "dog_breed_model.h5"
-
-# ✅ Hyperparameters
-IMG_SIZE = (224, 224)
-BATCH_SIZE = 16
-EPOCHS_STAGE1 = 5     # Initial training with frozen base
-EPOCHS_STAGE2 = 10    # Fine-tuning with unfreezed layers
-LR_STAGE1 = 1e-4
-LR_STAGE2 = 1e-5
-
-# ✅ Data Augmentation
-datagen = ImageDataGenerator(
-    rescale=1./255,
-    validation_split=0.2,
-    rotation_range=20,
-    width_shift_range=0.1,
-    height_shift_range=0.1,
-    shear_range=0.2,
-    zoom_range=0.2,
-    horizontal_flip=True
-)
-
-train_gen = datagen.flow_from_directory(
-    DATA_DIR,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    subset='training'
-)
-
-val_gen = datagen.flow_from_directory(
-    DATA_DIR,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    subset='validation'
-)
-
-# ✅ Base model (Transfer Learning)
-base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=(224,224,3))
-base_model.trainable = False  # freeze base initially
-
-x = GlobalAveragePooling2D()(base_model.output)
-x = Dropout(0.3)(x)
-x = Dense(128, activation='relu')(x)
-output = Dense(train_gen.num_classes, activation='softmax')(x)
-
-model = Model(inputs=base_model.input, outputs=output)
-
-# ✅ Compile (Stage 1)
-model.compile(optimizer=Adam(learning_rate=LR_STAGE1),
-              loss='categorical_crossentropy',
-              metrics=['accuracy'])
-
-print("\n🚀 Stage 1: Training top layers...")
-history1 = model.fit(
-    train_gen,
-    validation_data=val_gen,
-    epochs=EPOCHS_STAGE1
-)
-
-# ✅ Fine-tuning (Stage 2)
-print("\n🎯 Stage 2: Fine-tuning deeper layers...")
-base_model.trainable = True
-for layer in base_model.layers[:-20]:  # freeze all except last 20 layers
-    layer.trainable = False
-
-# Recompile with smaller learning rate
-model.compile(optimizer=Adam(learning_rate=LR_STAGE2),
-              loss='categorical_crossentropy',
-              metrics=['accuracy'])
-
-history2 = model.fit(
-    train_gen,
-    validation_data=val_gen,
-    epochs=EPOCHS_STAGE2
-)
-
-# ✅ Save model
-model.save(MODEL_PATH)
-print(f"\n✅ Model saved as {MODEL_PATH}")
-
-# ✅ Evaluate
-val_loss, val_acc = model.evaluate(val_gen)
-print(f"🎯 Final Validation Accuracy: {val_acc*100:.2f}%")
-
-# ✅ Plot Accuracy Curves
-plt.figure(figsize=(8,4))
-plt.plot(history1.history['accuracy'] + history2.history['accuracy'], label='train acc')
-plt.plot(history1.history['val_accuracy'] + history2.history['val_accuracy'], label='val acc')
-plt.legend()
-plt.title("Training Accuracy")
-plt.xlabel("Epochs")
-plt.ylabel("Accuracy")
-plt.show()
+
+from dataset_cache import build_cache, make_datasets
+from feature_store import extract_features, head_datasets, train_head, copy_head_weights
+from calibration import CALIBRATION_FILE, calibration_report, fit_temperature, save_calibration
+from model_registry import ModelRegistry, new_version_name
+
+# ✅ Defaults (override with --config file.json and/or command-line flags)
+DEFAULTS = {
+    # Paths
+    "data_dir": os.path.join("images", "Images"),
+    "registry_dir": "models",        # publish to models/<version>/ and point models/CURRENT at it (see model_registry.py)
+    "version": None,                 # default: a timestamp
+    "promote": True,                 # false: publish the version without making it CURRENT
+    "model_path": None,              # set to write a single model file instead of a registry version
+    "labels_path": None,             # default: breed_labels.json next to the model, read by app.py
+    "calibration_path": None,        # default: calibration.json next to the model (temperature scaling)
+    "dataset_cache_dir": None,       # e.g. "dataset_cache": decode images once into a memory-mapped cache
+    "feature_store_dir": None,       # e.g. "feature_store": train stage 1 on cached backbone features (needs dataset_cache_dir)
+    "feature_aug_seeds": [0, 1, 2],  # 0 = un-augmented; each extra seed adds one augmented copy
+    "checkpoint_dir": "checkpoints",
+    "metrics_log": "training_metrics.jsonl",
+    "plot": None,                    # e.g. "training_accuracy.png"
+
+    # Hyperparameters
+    "img_size": 224,
+    "alpha": 1.0,                    # MobileNetV2 width multiplier (ImageNet weights exist for 0.35, 0.5, 0.75, 1.0, 1.3, 1.4)
+    "batch_size": 16,
+    "epochs_stage1": 5,              # initial training with frozen base
+    "epochs_stage2": 10,             # fine-tuning with the last layers unfrozen
+    "lr_stage1": 1e-4,
+    "lr_stage2": 1e-5,
+    "fine_tune_layers": 20,
+    "dropout": 0.3,
+    "hidden": 128,
+    "validation_split": 0.2,
+    "seed": 123,
+    "early_stopping_patience": 3,    # 0 disables early stopping
+
+    # Knowledge distillation (see train_variants.py)
+    "teacher_path": None,            # trained model file or registry version to distill from
+    "distill_temperature": 4.0,      # softens both models' outputs for the distillation term
+    "distill_weight": 0.5,           # share of the distillation term in the loss (rest: the true labels)
+
+    # CPU / precision controls
+    "mixed_precision": "off",        # off | float16 | bfloat16 (bfloat16 is the one that pays off on CPUs)
+    "intra_op_threads": 0,           # 0 = let TensorFlow decide
+    "inter_op_threads": 0,
+}
+
+STATE_FILE = "state.json"
+CHECKPOINT_FILE = "last.h5"
+
+
+def load_config(argv=None):
+    parser = argparse.ArgumentParser(description="Train the dog breed classifier (MobileNetV2 transfer learning).")
+    parser.add_argument("--config", help="JSON file with any of the settings below")
+    parser.add_argument("--data-dir")
+    parser.add_argument("--registry-dir")
+    parser.add_argument("--version", help="registry version name (default: a timestamp)")
+    parser.add_argument("--no-promote", dest="promote", action="store_const", const=False, default=None,
+                        help="publish the version without pointing CURRENT at it")
+    parser.add_argument("--model-path", help="write this model file instead of a registry version")
+    parser.add_argument("--labels-path")
+    parser.add_argument("--calibration-path")
+    parser.add_argument("--dataset-cache-dir")
+    parser.add_argument("--feature-store-dir")
+    parser.add_argument("--feature-aug-seeds", type=int, nargs="+")
+    parser.add_argument("--checkpoint-dir")
+    parser.add_argument("--metrics-log")
+    parser.add_argument("--plot", help="save the accuracy curves to this image file")
+    parser.add_argument("--img-size", type=int)
+    parser.add_argument("--alpha", type=float, help="MobileNetV2 width multiplier")
+    parser.add_argument("--batch-size", type=int)
+    parser.add_argument("--epochs-stage1", type=int)
+    parser.add_argument("--epochs-stage2", type=int)
+    parser.add_argument("--lr-stage1", type=float)
+    parser.add_argument("--lr-stage2", type=float)
+    parser.add_argument("--fine-tune-layers", type=int)
+    parser.add_argument("--dropout", type=float)
+    parser.add_argument("--hidden", type=int)
+    parser.add_argument("--validation-split", type=float)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--early-stopping-patience", type=int)
+    parser.add_argument("--teacher-path", help="distill from this model file or registry version")
+    parser.add_argument("--distill-temperature", type=float)
+    parser.add_argument("--distill-weight", type=float)
+    parser.add_argument("--mixed-precision", choices=["off", "float16", "bfloat16"])
+    parser.add_argument("--intra-op-threads", type=int)
+    parser.add_argument("--inter-op-threads", type=int)
+    parser.add_argument("--resume", action="store_true", help="continue from the last checkpoint in --checkpoint-dir")
+    args = parser.parse_args(argv)
+
+    cfg = dict(DEFAULTS)
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+        unknown = set(overrides) - set(DEFAULTS)
+        if unknown:
+            parser.error(f"unknown setting(s) in {args.config}: {', '.join(sorted(unknown))}")
+        cfg.update(overrides)
+    for key in DEFAULTS:
+        value = getattr(args, key)
+        if value is not None:
+            cfg[key] = value
+    if cfg["model_path"] or not cfg["registry_dir"]:
+        cfg["registry_dir"] = cfg["version"] = None
+        cfg["model_path"] = cfg["model_path"] or "dog_breed_model.h5"
+    else:
+        cfg["version"] = cfg["version"] or new_version_name()
+        cfg["model_path"] = os.path.join(cfg["registry_dir"], cfg["version"], "dog_breed_model.h5")
+    model_dir = os.path.dirname(os.path.abspath(cfg["model_path"]))
+    if not cfg["labels_path"]:
+        cfg["labels_path"] = os.path.join(model_dir, "breed_labels.json")
+    if not cfg["calibration_path"]:
+        cfg["calibration_path"] = os.path.join(model_dir, CALIBRATION_FILE)
+    if cfg["feature_store_dir"] and not cfg["dataset_cache_dir"]:
+        parser.error("feature_store_dir needs dataset_cache_dir")
+    if not 0.0 <= cfg["distill_weight"] <= 1.0:
+        parser.error("distill_weight must be between 0 and 1")
+    return cfg, args.resume
+
+
+def configure_runtime(cfg):
+    """Thread pools and precision policy; must run before TensorFlow builds any op."""
+    import tensorflow as tf
+    if cfg["intra_op_threads"]:
+        tf.config.threading.set_intra_op_parallelism_threads(cfg["intra_op_threads"])
+    if cfg["inter_op_threads"]:
+        tf.config.threading.set_inter_op_parallelism_threads(cfg["inter_op_threads"])
+    if cfg["mixed_precision"] != "off":
+        tf.keras.mixed_precision.set_global_policy(f"mixed_{cfg['mixed_precision']}")
+    tf.keras.utils.set_random_seed(cfg["seed"])
+
+
+def load_data(cfg):
+    size = (cfg["img_size"], cfg["img_size"])
+    if cfg["dataset_cache_dir"]:
+        # ✅ Preprocessed cache + tf.data (augmentation runs on the fly)
+        build_cache(cfg["data_dir"], cfg["dataset_cache_dir"], size)
+        return make_datasets(cfg["dataset_cache_dir"], cfg["batch_size"],
+                             validation_split=cfg["validation_split"], seed=cfg["seed"])
+
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+    # ✅ Data Augmentation
+    datagen = ImageDataGenerator(
+        rescale=1./255,
+        validation_split=cfg["validation_split"],
+        rotation_range=20,
+        width_shift_range=0.1,
+        height_shift_range=0.1,
+        shear_range=0.2,
+        zoom_range=0.2,
+        horizontal_flip=True
+    )
+    train_gen = datagen.flow_from_directory(cfg["data_dir"], target_size=size, batch_size=cfg["batch_size"],
+                                            subset='training', seed=cfg["seed"])
+    # validation (and the temperature fitted on it) sees unaugmented images in
+    # a fixed order; validation_split picks the same files as for training
+    val_datagen = ImageDataGenerator(rescale=1./255, validation_split=cfg["validation_split"])
+    val_gen = val_datagen.flow_from_directory(cfg["data_dir"], target_size=size, batch_size=cfg["batch_size"],
+                                              subset='validation', shuffle=False)
+    class_names = [name for name, _ in sorted(train_gen.class_indices.items(), key=lambda kv: kv[1])]
+    return train_gen, val_gen, class_names
+
+
+def build_model(cfg, num_classes):
+    from tensorflow.keras.applications import MobileNetV2
+    from tensorflow.keras.models import Model
+    from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout
+
+    # ✅ Base model (Transfer Learning)
+    base_model = MobileNetV2(weights='imagenet', include_top=False, alpha=cfg["alpha"],
+                             input_shape=(cfg["img_size"], cfg["img_size"], 3))
+    base_model.trainable = False  # freeze base initially
+
+    x = GlobalAveragePooling2D(name='head_pool')(base_model.output)
+    x = Dropout(cfg["dropout"])(x)
+    x = Dense(cfg["hidden"], activation='relu', name='head_hidden')(x)
+    # softmax stays in float32 under mixed precision
+    output = Dense(num_classes, activation='softmax', dtype='float32', name='head_output')(x)
+    return Model(inputs=base_model.input, outputs=output)
+
+
+def base_layers(model):
+    """The MobileNetV2 layers of `model` (everything before the head)."""
+    names = [layer.name for layer in model.layers]
+    return model.layers[:names.index('head_pool')]
+
+
+def compile_model(model, lr):
+    from tensorflow.keras.optimizers import Adam
+    model.compile(optimizer=Adam(learning_rate=lr),
+                  loss='categorical_crossentropy',
+                  metrics=['accuracy'])
+
+
+# ---------------- DISTILLATION ---------------- #
+# The student is trained on y = [one-hot labels | teacher probabilities]; the
+# loss mixes cross-entropy on the labels with cross-entropy between the
+# temperature-softened teacher and student outputs (Hinton et al.), scaled by
+# T^2 so its gradients keep their size as T changes.
+def resolve_teacher(cfg):
+    path = cfg["teacher_path"]
+    if not os.path.exists(path) and cfg["registry_dir"]:
+        registry = ModelRegistry(cfg["registry_dir"])
+        if registry.exists(path):
+            return registry.artifact(path)
+    if not os.path.exists(path):
+        raise SystemExit(f"❌ Teacher model {path} not found")
+    return path
+
+
+def _soften(probs, temperature):
+    import tensorflow as tf
+    return tf.nn.softmax(tf.math.log(tf.clip_by_value(probs, 1e-7, 1.0)) / temperature, axis=-1)
+
+
+def distillation_objects(num_classes, temperature, weight):
+    """Loss and accuracy metric for the stacked targets; the metric keeps
+    the name `accuracy` so logs, early stopping and plots stay unchanged."""
+    import tensorflow as tf
+
+    def distillation_loss(y_true, y_pred):
+        labels, teacher = y_true[:, :num_classes], y_true[:, num_classes:]
+        hard = tf.keras.losses.categorical_crossentropy(labels, y_pred)
+        soft = tf.keras.losses.categorical_crossentropy(teacher, _soften(y_pred, temperature))
+        return (1.0 - weight) * hard + weight * temperature ** 2 * soft
+
+    def accuracy(y_true, y_pred):
+        return tf.keras.metrics.categorical_accuracy(y_true[:, :num_classes], y_pred)
+
+    return {"distillation_loss": distillation_loss, "accuracy": accuracy}
+
+
+def compile_distillation(model, lr, objects):
+    from tensorflow.keras.optimizers import Adam
+    model.compile(optimizer=Adam(learning_rate=lr),
+                  loss=objects["distillation_loss"],
+                  metrics=[objects["accuracy"]])
+
+
+def with_teacher(data, teacher, temperature):
+    """`data` with the softened teacher outputs appended to every label row.
+    Images are resized to the teacher's input when the sizes differ."""
+    import tensorflow as tf
+    size = tuple(int(d) for d in teacher.input_shape[1:3])
+
+    def targets(x, y):
+        if tuple(x.shape[1:3]) != size:
+            x = tf.image.resize(x, size)
+        soft = _soften(teacher(x, training=False), temperature)
+        return tf.concat([tf.cast(y, tf.float32), tf.cast(soft, tf.float32)], axis=-1)
+
+    if isinstance(data, tf.data.Dataset):
+        return data.map(lambda x, y: (x, targets(x, y)))
+
+    class TeacherSequence(tf.keras.utils.Sequence):
+        # ImageDataGenerator iterator: augmented batches are drawn on the
+        # fly, so the teacher labels each batch as it comes out
+
+        def __len__(self):
+            return len(data)
+
+        def __getitem__(self, i):
+            x, y = data[i]
+            return x, targets(x, y).numpy()
+
+        def on_epoch_end(self):
+            data.on_epoch_end()
+
+    return TeacherSequence()
+
+
+def unfreeze_top(model, fine_tune_layers):
+    layers = base_layers(model)
+    for layer in layers:
+        layer.trainable = True
+    for layer in layers[:-fine_tune_layers]:  # freeze all except the last `fine_tune_layers`
+        layer.trainable = False
+
+
+def collect_predictions(model, data):
+    """(probs, labels) over one pass of a validation generator or tf.data dataset."""
+    probs, labels = [], []
+    batches = (data[i] for i in range(len(data))) if hasattr(data, "__getitem__") else data
+    for x, y in batches:
+        probs.append(np.asarray(model(x, training=False), dtype=np.float32))
+        labels.append(np.argmax(np.asarray(y), axis=-1))
+    return np.concatenate(probs), np.concatenate(labels)
+
+
+# ---------------- CHECKPOINT STATE ---------------- #
+def load_state(checkpoint_dir):
+    path = os.path.join(checkpoint_dir, STATE_FILE)
+    if not os.path.exists(path) or not os.path.exists(os.path.join(checkpoint_dir, CHECKPOINT_FILE)):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(model, checkpoint_dir, state):
+    """Writes the full model (weights + optimizer) and then the state that
+    points at it, each via a temp file so an interrupted save never leaves a
+    state describing a half-written model."""
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    ckpt = os.path.join(checkpoint_dir, CHECKPOINT_FILE)
+    model.save(ckpt + ".tmp.h5")
+    os.replace(ckpt + ".tmp.h5", ckpt)
+    tmp = os.path.join(checkpoint_dir, STATE_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, os.path.join(checkpoint_dir, STATE_FILE))
+
+
+def make_callbacks(cfg, stage, state):
+    import tensorflow as tf
+
+    class EpochCheckpoint(tf.keras.callbacks.Callback):
+        """Saves the model and the resume state after every epoch."""
+
+        def on_epoch_end(self, epoch, logs=None):
+            state.update({"stage": stage, "epoch": epoch + 1, "stage_done": False})
+            save_checkpoint(self.model, cfg["checkpoint_dir"], state)
+
+    class MetricsLogger(tf.keras.callbacks.Callback):
+        """One JSON line per epoch: losses, accuracies, training throughput
+        (images/sec, excluding validation) and step-time percentiles."""
+
+        def on_epoch_begin(self, epoch, logs=None):
+            self.step_times = []
+            self.epoch_start = self.last = time.perf_counter()
+
+        def on_train_batch_end(self, batch, logs=None):
+            now = time.perf_counter()
+            self.step_times.append(now - self.last)
+            self.last = now
+
+        def on_epoch_end(self, epoch, logs=None):
+            train_seconds = self.last - self.epoch_start
+            steps = np.asarray(self.step_times) * 1000.0
+            images = len(self.step_times) * cfg["batch_size"]
+            record = {
+                "stage": stage,
+                "epoch": epoch + 1,
+                "time": time.time(),
+                **{k: round(float(v), 6) for k, v in (logs or {}).items()},
+                "epoch_seconds": round(time.perf_counter() - self.epoch_start, 3),
+                "train_seconds": round(train_seconds, 3),
+                "images_per_sec": round(images / max(train_seconds, 1e-9), 2),
+                "steps": len(self.step_times),
+                "step_ms_mean": round(float(steps.mean()), 3) if len(steps) else None,
+                "step_ms_p50": round(float(np.percentile(steps, 50)), 3) if len(steps) else None,
+                "step_ms_p95": round(float(np.percentile(steps, 95)), 3) if len(steps) else None,
+            }
+            append_metrics(cfg["metrics_log"], record)
+            print(f"📈 stage {stage} epoch {epoch + 1}: {record['images_per_sec']} img/s, "
+                  f"step {record['step_ms_mean']} ms")
+
+    callbacks = [MetricsLogger(), EpochCheckpoint()]
+    if cfg["early_stopping_patience"]:
+        # restore_best_weights keeps the best epoch when stopping early; note
+        # that the patience counter starts over after a resume
+        callbacks.append(tf.keras.callbacks.EarlyStopping(
+            monitor='val_loss', patience=cfg["early_stopping_patience"], restore_best_weights=True))
+    return callbacks
+
+
+def append_metrics(path, record):
+    if not path:
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def read_metrics(path):
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_plot(metrics, path):
+    """Accuracy curves across both stages, written to a file (no display needed)."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    epochs = [m for m in metrics if "stage" in m and "accuracy" in m]
+    plt.figure(figsize=(8, 4))
+    plt.plot([m["accuracy"] for m in epochs], label='train acc')
+    plt.plot([m.get("val_accuracy") for m in epochs], label='val acc')
+    plt.legend()
+    plt.title("Training Accuracy")
+    plt.xlabel("Epochs")
+    plt.ylabel("Accuracy")
+    plt.savefig(path, dpi=100, bbox_inches="tight")
+    plt.close()
+    print(f"🖼️ Accuracy curves saved as {path}")
+
+
+# ---------------- TRAINING ---------------- #
+def train(cfg, resume=False):
+    configure_runtime(cfg)
+    import tensorflow as tf
+    started = time.time()
+
+    train_gen, val_gen, class_names = load_data(cfg)
+    num_classes = len(class_names)
+
+    # ✅ Optional teacher: model.fit stages train on [labels | teacher outputs]
+    fit_train, fit_val, objects = train_gen, val_gen, None
+    if cfg["teacher_path"]:
+        teacher_path = resolve_teacher(cfg)
+        teacher = tf.keras.models.load_model(teacher_path)
+        if teacher.output_shape[-1] != num_classes:
+            raise SystemExit(f"❌ Teacher {teacher_path} has {teacher.output_shape[-1]} outputs, dataset has {num_classes} classes")
+        teacher.trainable = False
+        objects = distillation_objects(num_classes, cfg["distill_temperature"], cfg["distill_weight"])
+        fit_train = with_teacher(train_gen, teacher, cfg["distill_temperature"])
+        fit_val = with_teacher(val_gen, teacher, cfg["distill_temperature"])
+        print(f"🧑‍🏫 Distilling from {teacher_path} (T={cfg['distill_temperature']}, weight {cfg['distill_weight']})")
+
+    def compile_stage(model, lr):
+        if objects:
+            compile_distillation(model, lr, objects)
+        else:
+            compile_model(model, lr)
+
+    state = load_state(cfg["checkpoint_dir"]) if resume else None
+    if state is not None:
+        if (state.get("num_classes") != num_classes or state.get("img_size") != cfg["img_size"]
+                or state.get("alpha", 1.0) != cfg["alpha"] or state.get("teacher") != cfg["teacher_path"]):
+            raise SystemExit(f"❌ Checkpoint in {cfg['checkpoint_dir']} was made for a different dataset, "
+                             f"image size, width or teacher")
+        print(f"♻️ Resuming from stage {state['stage']}, epoch {state['epoch']}")
+        model = tf.keras.models.load_model(os.path.join(cfg["checkpoint_dir"], CHECKPOINT_FILE),
+                                           custom_objects=objects)
+    else:
+        if resume:
+            print(f"⚠️ No checkpoint in {cfg['checkpoint_dir']}; starting from scratch")
+        if os.path.exists(cfg["metrics_log"] or ""):
+            os.remove(cfg["metrics_log"])
+        state = {"stage": 1, "epoch": 0, "stage_done": False,
+                 "num_classes": num_classes, "img_size": cfg["img_size"], "alpha": cfg["alpha"],
+                 "teacher": cfg["teacher_path"]}
+        model = build_model(cfg, num_classes)
+        compile_stage(model, cfg["lr_stage1"])
+
+    # ✅ Stage 1: frozen base
+    if state["stage"] == 1 and not state["stage_done"]:
+        print("\n🚀 Stage 1: Training top layers...")
+        if cfg["feature_store_dir"]:
+            # The base is frozen, so its pooled output only needs computing once per
+            # (image, augmentation seed); the head then trains on those vectors
+            # (on the true labels only: the teacher needs the images)
+            extract_features(cfg["dataset_cache_dir"], cfg["feature_store_dir"], cfg["feature_aug_seeds"],
+                             alpha=cfg["alpha"])
+            data = head_datasets(cfg["feature_store_dir"], cfg["validation_split"], cfg["seed"])
+            head, history = train_head(data, num_classes, dropout=cfg["dropout"], hidden=cfg["hidden"],
+                                       lr=cfg["lr_stage1"], epochs=cfg["epochs_stage1"],
+                                       batch_size=cfg["batch_size"])
+            copy_head_weights(head, model)
+            for epoch, (acc, val_acc) in enumerate(zip(history.history["accuracy"],
+                                                       history.history["val_accuracy"])):
+                append_metrics(cfg["metrics_log"], {"stage": 1, "epoch": epoch + 1, "features": True,
+                                                    "accuracy": acc, "val_accuracy": val_acc})
+        else:
+            model.fit(
+                fit_train,
+                validation_data=fit_val,
+                epochs=cfg["epochs_stage1"],
+                initial_epoch=state["epoch"],
+                callbacks=make_callbacks(cfg, 1, state),
+            )
+        state.update({"stage": 2, "epoch": 0, "stage_done": False})
+        save_checkpoint(model, cfg["checkpoint_dir"], state)
+        fresh_stage2 = True
+    else:
+        # resuming inside stage 2: the checkpoint already carries the
+        # unfrozen layers and the optimizer state, so keep its compilation
+        fresh_stage2 = state["epoch"] == 0
+
+    # ✅ Stage 2: fine-tuning
+    if not state["stage_done"]:
+        print("\n🎯 Stage 2: Fine-tuning deeper layers...")
+        if fresh_stage2:
+            unfreeze_top(model, cfg["fine_tune_layers"])
+            # Recompile with smaller learning rate
+            compile_stage(model, cfg["lr_stage2"])
+        model.fit(
+            fit_train,
+            validation_data=fit_val,
+            epochs=cfg["epochs_stage2"],
+            initial_epoch=state["epoch"],
+            callbacks=make_callbacks(cfg, 2, state),
+        )
+        state["stage_done"] = True
+        save_checkpoint(model, cfg["checkpoint_dir"], state)
+
+    if objects:
+        # the served file must load without the distillation loss, and the
+        # final evaluation should report plain cross-entropy
+        compile_model(model, cfg["lr_stage2"])
+
+    # ✅ Save model
+    model_dir = os.path.dirname(os.path.abspath(cfg["model_path"]))
+    os.makedirs(model_dir, exist_ok=True)
+    model.save(cfg["model_path"])
+    print(f"\n✅ Model saved as {cfg['model_path']}")
+
+    # ✅ Save breed labels in class-index order
+    with open(cfg["labels_path"], "w", encoding="utf-8") as f:
+        json.dump(class_names, f, indent=2)
+    print(f"✅ Breed labels saved as {cfg['labels_path']}")
+
+    # ✅ Evaluate
+    val_loss, val_acc = model.evaluate(val_gen)
+    print(f"🎯 Final Validation Accuracy: {val_acc*100:.2f}%")
+    # ✅ Calibrate: temperature scaling on the validation split, stored next to the model
+    probs, labels = collect_predictions(model, val_gen)
+    report = calibration_report(probs, labels, fit_temperature(probs, labels))
+    save_calibration(cfg["calibration_path"], report, cfg["model_path"])
+    print(f"🌡️ Calibration temperature {report['temperature']:.3f} "
+          f"(NLL {report['nll_before']:.4f} -> {report['nll_after']:.4f}, "
+          f"ECE {report['ece_before']:.4f} -> {report['ece_after']:.4f}) saved as {cfg['calibration_path']}")
+
+    append_metrics(cfg["metrics_log"], {"final": True, "val_loss": float(val_loss), "val_accuracy": float(val_acc),
+                                        "calibration": report, "config": cfg})
+
+    if cfg["plot"]:
+        save_plot(read_metrics(cfg["metrics_log"]), cfg["plot"])
+
+    # ✅ Publish the registry version: metadata.json last, then CURRENT
+    if cfg["version"]:
+        registry = ModelRegistry(cfg["registry_dir"])
+        registry.write_metadata(cfg["version"], {
+            "created_at": int(time.time()),
+            "train_seconds": round(time.time() - started, 1),
+            "model_file": os.path.basename(cfg["model_path"]),
+            "num_classes": num_classes,
+            "img_size": cfg["img_size"],
+            "input_size": [cfg["img_size"], cfg["img_size"]],
+            "alpha": cfg["alpha"],
+            "teacher": cfg["teacher_path"],
+            "params": int(model.count_params()),
+            "val_loss": float(val_loss),
+            "val_accuracy": float(val_acc),
+            "calibration_temperature": report["temperature"],
+            "config": cfg,
+        })
+        print(f"📦 Published model version {cfg['version']} in {cfg['registry_dir']}")
+        if cfg["promote"]:
+            registry.set_current(cfg["version"])
+            print(f"✅ {cfg['registry_dir']}/CURRENT -> {cfg['version']} (running servers pick it up)")
+    return model, class_names
+
+
+def main(argv=None):
+    cfg, resume = load_config(argv)
+    train(cfg, resume)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""Trains a family of smaller MobileNetV2 variants and picks one by latency.
+
+Every (width multiplier, input size) pair is trained with
+train_dog_breed_model.py into its own registry version (not promoted), then
+benchmarked on this machine's CPU in a fresh process: load time, batch-1
+latency, batch throughput and peak RSS. The report lists accuracy against
+latency and memory, marks the Pareto front and selects the fastest variant
+whose validation accuracy meets --accuracy-floor.
+
+    # 3 widths x 3 input sizes, distilled from the full-size model
+    python train_variants.py --alphas 0.35 0.5 1.0 --sizes 128 160 224 --distill \\
+        --dataset-cache-dir dataset_cache --accuracy-floor 0.80
+
+    # benchmark what is already trained and make the pick the served model
+    python train_variants.py --bench-only --accuracy-floor 0.80 --promote
+
+Arguments after `--` are passed to every train_dog_breed_model.py run, e.g.
+`-- --epochs-stage2 5`.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+from model_registry import ModelRegistry
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAIN_SCRIPT = os.path.join(BASE_DIR, "train_dog_breed_model.py")
+EXPORT_SCRIPT = os.path.join(BASE_DIR, "export_model.py")
+
+
+def variant_name(prefix, alpha, size):
+    return f"{prefix}-a{alpha:g}-s{size}"
+
+
+# ---------------------------------------------------------------- training
+
+def train_command(args, name, alpha, size, teacher=None):
+    work = os.path.join(args.work_dir, name)
+    cmd = [sys.executable, TRAIN_SCRIPT,
+           "--registry-dir", args.registry_dir, "--version", name, "--no-promote",
+           "--alpha", f"{alpha:g}", "--img-size", str(size),
+           "--checkpoint-dir", os.path.join(work, "checkpoints"),
+           "--metrics-log", os.path.join(work, "training_metrics.jsonl")]
+    if args.config:
+        cmd += ["--config", args.config]
+    if args.data_dir:
+        cmd += ["--data-dir", args.data_dir]
+    if args.dataset_cache_dir:
+        # the cache holds images at one resolution, so one cache per size
+        cmd += ["--dataset-cache-dir", f"{args.dataset_cache_dir}-{size}"]
+        if args.feature_store_dir:
+            cmd += ["--feature-store-dir", f"{args.feature_store_dir}-a{alpha:g}-s{size}"]
+    if teacher:
+        cmd += ["--teacher-path", teacher]
+    return cmd + args.train_args
+
+
+def train_variants(args, registry, variants):
+    teacher = args.teacher
+    if args.distill and not teacher:
+        # the full-size model of the family teaches the others, so it goes first
+        full = (max(args.alphas), max(args.sizes))
+        teacher = variant_name(args.prefix, *full)
+        variants = [full] + [v for v in variants if v != full]
+    for alpha, size in variants:
+        name = variant_name(args.prefix, alpha, size)
+        if registry.exists(name) and not args.retrain:
+            print(f"♻️ {name} already trained")
+            continue
+        distill_from = teacher if args.distill and teacher != name else None
+        print(f"\n🚀 Training {name}" + (f" (teacher {distill_from})" if distill_from else ""))
+        if subprocess.run(train_command(args, name, alpha, size, distill_from)).returncode != 0:
+            if name == teacher:
+                raise SystemExit(f"❌ Teacher {name} failed to train")
+            print(f"⚠️ Training {name} failed; skipping it")
+
+
+def export_variant(args, registry, name):
+    version_dir = registry.path(name)
+    cmd = [sys.executable, EXPORT_SCRIPT, "--model", registry.artifact(name),
+           "--out-dir", version_dir, "--formats", args.backend,
+           "--report", os.path.join(version_dir, "export_report.json")]
+    if args.data_dir:
+        cmd += ["--data-dir", args.data_dir]
+    print(f"\n⚙️ Exporting {name} to {args.backend}")
+    return subprocess.run(cmd).returncode == 0
+
+
+# ---------------------------------------------------------------- benchmark
+
+def _peak_rss_mb():
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def bench_one(registry_dir, version, kind, threads, runs, batch_size):
+    """Runs inside a fresh process (see measure()), so the peak RSS is this
+    model's alone. Prints one JSON line."""
+    import numpy as np
+    from latency import LatencyWindow
+
+    base_mb = _peak_rss_mb()
+    t0 = time.perf_counter()
+    served = ModelRegistry(registry_dir).load(version, kind, num_threads=threads or None)
+    load_seconds = time.perf_counter() - t0
+    h, w = served.input_size
+    rng = np.random.default_rng(0)
+    one = rng.random((1, h, w, 3), dtype=np.float32)
+    for _ in range(5):
+        served.predict(one)
+    runs = max(1, runs)
+    latency = LatencyWindow(runs)
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        served.predict(one)
+        latency.add((time.perf_counter() - t0) * 1000.0)
+    batch = rng.random((batch_size, h, w, 3), dtype=np.float32)
+    served.predict(batch)
+    repeats = max(3, runs // 10)
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        served.predict(batch)
+    throughput = repeats * batch_size / (time.perf_counter() - t0)
+    print(json.dumps({
+        "load_seconds": round(load_seconds, 3),
+        "latency_batch1_ms": latency.summary(),
+        f"throughput_batch{batch_size}_img_s": round(throughput, 1),
+        "peak_rss_mb": _peak_rss_mb(),
+        "baseline_rss_mb": base_mb,
+    }))
+
+
+def measure(args, registry, name):
+    cmd = [sys.executable, os.path.abspath(__file__), "--bench-one", name,
+           "--registry-dir", args.registry_dir, "--backend", args.backend,
+           "--threads", str(args.threads), "--runs", str(args.runs), "--batch-size", str(args.batch_size)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "benchmark failed")
+    return json.loads(lines[-1])
+
+
+def variant_accuracy(registry, name, meta, backend):
+    # exported backends are scored by export_model.py; Keras by training's validation split
+    path = os.path.join(registry.path(name), "export_report.json")
+    if backend != "keras" and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for r in json.load(f).get("results", []):
+                if r.get("backend") == backend and r.get("top1_accuracy") is not None:
+                    return r["top1_accuracy"], "export_report"
+    return meta.get("val_accuracy"), "val_split"
+
+
+def benchmark(args, registry, names):
+    results = []
+    for name in names:
+        meta = registry.metadata(name)
+        artifact = registry.artifact(name, args.backend)
+        if not os.path.exists(artifact) and not (args.export and export_variant(args, registry, name)):
+            print(f"⚠️ {name}: no {args.backend} artifact (use --export); skipping")
+            continue
+        print(f"⏱️ Benchmarking {name} ({args.backend})...")
+        try:
+            bench = measure(args, registry, name)
+        except RuntimeError as e:
+            print(f"⚠️ {name}: {e}")
+            continue
+        accuracy, source = variant_accuracy(registry, name, meta, args.backend)
+        size = meta.get("input_size") or [meta.get("img_size"), meta.get("img_size")]
+        results.append({
+            "version": name,
+            "alpha": meta.get("alpha", 1.0),
+            "input_size": size,
+            "teacher": meta.get("teacher"),
+            "params": meta.get("params"),
+            "file_mb": round(os.path.getsize(registry.artifact(name, args.backend)) / 1e6, 2),
+            "accuracy": accuracy,
+            "accuracy_source": source,
+            **bench,
+        })
+    return results
+
+
+# ---------------------------------------------------------------- selection
+
+def pareto_front(results):
+    """Versions no other variant beats on both accuracy and p50 latency."""
+    front = []
+    for r in results:
+        p50, acc = r["latency_batch1_ms"]["p50"], r["accuracy"] or 0.0
+        dominated = any(o is not r and o["latency_batch1_ms"]["p50"] <= p50 and (o["accuracy"] or 0.0) >= acc
+                        and (o["latency_batch1_ms"]["p50"] < p50 or (o["accuracy"] or 0.0) > acc)
+                        for o in results)
+        if not dominated:
+            front.append(r["version"])
+    return front
+
+
+def select(results, accuracy_floor):
+    eligible = [r for r in results if r["accuracy"] is not None and r["accuracy"] >= accuracy_floor]
+    if not eligible:
+        return None
+    return min(eligible, key=lambda r: (r["latency_batch1_ms"]["p50"], r["peak_rss_mb"]))["version"]
+
+
+def save_plot(results, front, selected, accuracy_floor, path):
+    """Accuracy against batch-1 p50 latency; marker area follows peak RSS."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    plt.figure(figsize=(8, 5))
+    for r in results:
+        x, y = r["latency_batch1_ms"]["p50"], r["accuracy"] or 0.0
+        plt.scatter(x, y, s=max(20.0, r["peak_rss_mb"] / 4), alpha=0.6,
+                    edgecolors="red" if r["version"] == selected else "none", linewidths=2)
+        plt.annotate(f"α{r['alpha']:g}/{r['input_size'][0]}\n{r['peak_rss_mb']:.0f} MB", (x, y),
+                     textcoords="offset points", xytext=(6, 4), fontsize=8)
+    points = sorted((r["latency_batch1_ms"]["p50"], r["accuracy"] or 0.0) for r in results if r["version"] in front)
+    if points:
+        plt.plot([p[0] for p in points], [p[1] for p in points], "--", color="gray", label="Pareto front")
+    if accuracy_floor:
+        plt.axhline(accuracy_floor, color="red", linewidth=1, label=f"accuracy floor {accuracy_floor:g}")
+    plt.legend()
+    plt.title("Model variants: accuracy vs CPU latency (marker size = peak RSS)")
+    plt.xlabel("Batch-1 latency p50 (ms)")
+    plt.ylabel("Accuracy")
+    plt.savefig(path, dpi=100, bbox_inches="tight")
+    plt.close()
+    print(f"🖼️ Plot saved as {path}")
+
+
+def print_table(results, front, selected):
+    tp_key = next((k for k in results[0] if k.startswith("throughput_batch")), None) if results else None
+    print("\n============================")
+    print(f"{'version':<24} {'acc':>6} {'p50 ms':>8} {'p95 ms':>8} {'img/s':>8} {'RSS MB':>8} {'file MB':>8}")
+    for r in sorted(results, key=lambda r: r["latency_batch1_ms"]["p50"]):
+        lat = r["latency_batch1_ms"]
+        mark = "🎯" if r["version"] == selected else ("* " if r["version"] in front else "  ")
+        acc = f"{r['accuracy']:.3f}" if r["accuracy"] is not None else "-"
+        print(f"{mark}{r['version']:<22} {acc:>6} {lat['p50']:>8.2f} {lat['p95']:>8.2f} "
+              f"{r[tp_key]:>8.1f} {r['peak_rss_mb']:>8.1f} {r['file_mb']:>8.2f}")
+    print("============================  (* = Pareto front)")
+
+
+# ---------------------------------------------------------------- main
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    train_args = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, train_args = argv[:split], argv[split + 1:]
+
+    parser = argparse.ArgumentParser(description="Train reduced width/resolution model variants and select one by latency.")
+    parser.add_argument("--alphas", type=float, nargs="+", default=[0.35, 0.5, 1.0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[128, 160, 224])
+    parser.add_argument("--prefix", default="variant", help="registry version names are <prefix>-a<alpha>-s<size>")
+    parser.add_argument("--registry-dir", default="models")
+    parser.add_argument("--work-dir", default="variants", help="per-variant checkpoints, metrics, report and plot")
+    parser.add_argument("--config", help="train_dog_breed_model.py config file shared by all variants")
+    parser.add_argument("--data-dir")
+    parser.add_argument("--dataset-cache-dir", help="per-size caches are written to <dir>-<size>")
+    parser.add_argument("--feature-store-dir", help="per-variant stores are written to <dir>-a<alpha>-s<size>")
+    parser.add_argument("--distill", action="store_true",
+                        help="distill every variant from --teacher (default: the widest, largest variant)")
+    parser.add_argument("--teacher", help="model file or registry version to distill from")
+    parser.add_argument("--retrain", action="store_true", help="train variants that already exist again")
+    parser.add_argument("--bench-only", action="store_true", help="only benchmark versions already trained")
+    parser.add_argument("--backend", default="keras", help="backend to benchmark (see inference_backends.py)")
+    parser.add_argument("--export", action="store_true", help="run export_model.py for variants missing --backend")
+    parser.add_argument("--threads", type=int, default=0, help="inference threads (0 = backend default)")
+    parser.add_argument("--runs", type=int, default=100, help="batch-1 predictions per variant")
+    parser.add_argument("--batch-size", type=int, default=16, help="batch size for the throughput run")
+    parser.add_argument("--accuracy-floor", type=float, default=0.0)
+    parser.add_argument("--promote", action="store_true", help="point CURRENT at the selected variant")
+    parser.add_argument("--report", help="JSON report (default: <work-dir>/report.json)")
+    parser.add_argument("--plot", help="accuracy/latency plot (default: <work-dir>/accuracy_latency.png)")
+    parser.add_argument("--bench-one", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.train_args = train_args
+
+    if args.bench_one:
+        bench_one(args.registry_dir, args.bench_one, args.backend, args.threads, args.runs, args.batch_size)
+        return 0
+    if args.teacher:
+        args.distill = True
+
+    registry = ModelRegistry(args.registry_dir)
+    variants = [(alpha, size) for alpha in args.alphas for size in args.sizes]
+    if not args.bench_only:
+        os.makedirs(args.work_dir, exist_ok=True)
+        train_variants(args, registry, variants)
+
+    names = [n for n in (variant_name(args.prefix, a, s) for a, s in variants) if registry.exists(n)]
+    if not names:
+        raise SystemExit(f"❌ No trained variants in {args.registry_dir}")
+    results = benchmark(args, registry, names)
+    if not results:
+        raise SystemExit("❌ No variant could be benchmarked")
+    front = pareto_front(results)
+    selected = select(results, args.accuracy_floor)
+    print_table(results, front, selected)
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    report_path = args.report or os.path.join(args.work_dir, "report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({"backend": args.backend, "threads": args.threads, "runs": args.runs,
+                   "accuracy_floor": args.accuracy_floor, "selected": selected, "pareto_front": front,
+                   "results": results}, f, indent=2)
+    print(f"\n📝 Report written to {report_path}")
+    save_plot(results, front, selected, args.accuracy_floor, args.plot or os.path.join(args.work_dir, "accuracy_latency.png"))
+
+    if selected is None:
+        print(f"⚠️ No variant reaches accuracy {args.accuracy_floor:g}")
+        return 1
+    print(f"🎯 Fastest variant with accuracy >= {args.accuracy_floor:g}: {selected}")
+    if args.promote:
+        registry.set_current(selected)
+        print(f"✅ {args.registry_dir}/CURRENT -> {selected} (running servers pick it up)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
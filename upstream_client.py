@@ -0,0 +1,217 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from latency import LatencyWindow
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(RuntimeError):
+	pass
+
+
+class UpstreamBusyError(RuntimeError):
+	pass
+
+
+class CircuitBreaker:
+	"""Opens after `threshold` consecutive failures and lets a single probe
+	request through once `reset_seconds` have passed."""
+
+	def __init__(self, threshold: int = 5, reset_seconds: float = 30.0):
+		self.threshold = max(1, int(threshold))
+		self.reset_seconds = float(reset_seconds)
+		self.failures = 0
+		self.opened_at = None
+		self.state = 'closed'
+		self._lock = threading.Lock()
+
+	def allow(self) -> bool:
+		with self._lock:
+			if self.state == 'closed':
+				return True
+			if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_seconds:
+				self.state = 'half_open'
+				return True
+			return False
+
+	def record_success(self):
+		with self._lock:
+			self.failures = 0
+			self.state = 'closed'
+			self.opened_at = None
+
+	def record_failure(self):
+		with self._lock:
+			self.failures += 1
+			if self.state == 'half_open' or self.failures >= self.threshold:
+				self.state = 'open'
+				self.opened_at = time.monotonic()
+
+
+def _retry_after(r) -> Optional[float]:
+	value = r.headers.get('Retry-After')
+	try:
+		return max(0.0, float(value)) if value is not None else None
+	except ValueError:
+		return None  # HTTP-date form; fall back to the backoff
+
+
+class UpstreamClient:
+	"""Shared keep-alive HTTP client for the LLM upstream.
+
+	Calls run on a bounded worker pool: at most `max_concurrency` are in flight
+	and at most `max_pending` may wait, so a slow upstream makes /chat fail fast
+	with UpstreamBusyError instead of tying up every server thread.
+	`max_callers`, when given, caps in-flight plus waiting calls (streamed
+	responses count until closed); set it below the server's request threads
+	so some are always left for /predict.
+
+	`timeout` is the budget for the whole call: connection and read timeouts
+	of each attempt, backoff between retries (on connection errors, timeouts
+	and 429/5xx) and queueing for a worker all come out of it.
+	"""
+
+	def __init__(self, pool_size: int = 10, max_retries: int = 2, backoff: float = 0.5,
+				 max_concurrency: int = 8, max_pending: int = 32, max_callers: Optional[int] = None,
+				 breaker_threshold: int = 5, breaker_reset: float = 30.0):
+		self.session = requests.Session()
+		adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, pool_size))
+		self.session.mount('http://', adapter)
+		self.session.mount('https://', adapter)
+		self.max_retries = max(0, int(max_retries))
+		self.backoff = backoff
+		self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+		callers = max(1, max_concurrency) + max(0, max_pending)
+		if max_callers is not None:
+			callers = max(1, min(callers, int(max_callers)))
+		self.max_callers = callers
+		self._executor = ThreadPoolExecutor(max_workers=min(max(1, max_concurrency), callers),
+											thread_name_prefix='upstream')
+		self._slots = threading.BoundedSemaphore(callers)
+		self.latency = LatencyWindow()
+		self._stats_lock = threading.Lock()
+		self.requests = 0
+		self.errors = 0
+		self.rejected = 0
+		self.status_counts = {}
+
+	def _record(self, ms: float, status: Optional[int], failed: bool):
+		self.latency.add(ms)
+		with self._stats_lock:
+			self.requests += 1
+			key = f'{status // 100}xx' if status else 'exception'
+			self.status_counts[key] = self.status_counts.get(key, 0) + 1
+			if failed:
+				self.errors += 1
+		if failed:
+			self.breaker.record_failure()
+		else:
+			self.breaker.record_success()
+
+	def _send(self, method, url, kwargs, deadline):
+		# one call with its retries, all within `deadline` (time.monotonic())
+		t0 = time.perf_counter()
+		attempt = 0
+		while True:
+			remaining = deadline - time.monotonic()
+			if remaining <= 0:
+				# the budget went on queueing for a worker (retries stop before
+				# it runs out), which says nothing about the upstream; only a
+				# half-open probe must be settled so that another can follow
+				if self.breaker.state == 'half_open':
+					self.breaker.record_failure()
+				raise requests.Timeout('upstream call ran out of time while queued')
+			try:
+				r = self.session.request(method, url, timeout=remaining, **kwargs)
+			except requests.RequestException as e:
+				retryable = isinstance(e, (requests.ConnectionError, requests.Timeout))
+				delay = self.backoff * (2 ** attempt)
+				if not retryable or attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+					self._record((time.perf_counter() - t0) * 1000.0, None, True)
+					raise
+			else:
+				failed = r.status_code in RETRY_STATUSES
+				delay = _retry_after(r)
+				if delay is None:
+					delay = self.backoff * (2 ** attempt)
+				if not failed or attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+					self._record((time.perf_counter() - t0) * 1000.0, r.status_code, failed)
+					return r
+				r.close()
+			time.sleep(delay)
+			attempt += 1
+
+	def request(self, method: str, url: str, timeout: float = 30, **kwargs):
+		deadline = time.monotonic() + timeout
+		if not self._slots.acquire(blocking=False):
+			with self._stats_lock:
+				self.rejected += 1
+			raise UpstreamBusyError('too many upstream requests in flight')
+		if not self.breaker.allow():
+			self._slots.release()
+			with self._stats_lock:
+				self.rejected += 1
+			raise CircuitOpenError('upstream circuit is open')
+		kwargs.pop('timeout', None)
+		try:
+			fut = self._executor.submit(self._send, method, url, kwargs, deadline)
+		except Exception:
+			self._slots.release()
+			raise
+		fut.add_done_callback(lambda f: self._release_when_done(f, kwargs.get('stream', False)))
+		try:
+			# _send gives up by the deadline itself; the margin covers the
+			# hand-back from the worker thread
+			return fut.result(timeout=max(0.0, deadline - time.monotonic()) + 1.0)
+		except FutureTimeoutError:
+			if not fut.cancel():
+				# it finished after all; nobody will read or close the response
+				fut.add_done_callback(self._close_abandoned)
+			raise requests.Timeout(f'upstream call took longer than {timeout}s')
+
+	def _release_when_done(self, fut, stream: bool):
+		# a streamed body is read by the caller's thread after _send returns,
+		# so its slot is held until the response is closed
+		r = None if fut.cancelled() or fut.exception() is not None else fut.result()
+		if not stream or r is None:
+			self._slots.release()
+			return
+		close = r.close
+		released = threading.Event()
+
+		def close_and_release():
+			try:
+				close()
+			finally:
+				if not released.is_set():
+					released.set()
+					self._slots.release()
+		r.close = close_and_release
+
+	@staticmethod
+	def _close_abandoned(fut):
+		if not fut.cancelled() and fut.exception() is None:
+			fut.result().close()
+
+	def post(self, url: str, timeout: float = 30, **kwargs):
+		return self.request('POST', url, timeout=timeout, **kwargs)
+
+	def stats(self):
+		with self._stats_lock:
+			requests_total = self.requests
+			s = {
+				'requests': requests_total,
+				'errors': self.errors,
+				'rejected': self.rejected,
+				'status_counts': dict(self.status_counts),
+			}
+		s['error_rate'] = round(s['errors'] / requests_total, 4) if requests_total else None
+		s['latency_ms'] = self.latency.summary()
+		s['circuit'] = {'state': self.breaker.state, 'consecutive_failures': self.breaker.failures}
+		return s